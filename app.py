@@ -5,30 +5,231 @@ This module provides the application factory pattern for creating Flask app inst
 Routes are organized in separate blueprint modules in the routes package.
 """
 
+import atexit
+import os
+from typing import Dict, Optional
+
+import click
 from flask import Flask
+import database
 from database import init_database, add_sample_data
+from commands import register_commands
 from routes import register_blueprints
+from routes.admission import init_admission_control
+from routes.caching import init_render_cache
+from routes.deadlines import init_query_deadlines
+from routes.maintenance import init_maintenance
+from services import backup, hold_service, library_service, maintenance, recommendations
+from services.availability_feed import availability_feed
+from services.events import event_bus
+from services.search_cache import search_cache
+from services.single_flight import single_flight
+from services.fuzzy_index import fuzzy_index
+from services.suggest_index import suggest_index
+
+DEFAULT_CONFIG = {
+    # Apply pending schema migrations while building the app. Multi-process
+    # servers turn this off and run it once (see gunicorn.conf.py).
+    "INIT_DATABASE": True,
+    # Seed demonstration books into an empty catalog; off in production and
+    # for `flask --app app ...` commands unless SAMPLE_DATA=1 is set
+    "SAMPLE_DATA": True,
+    # Busy-timeout and retry policy for writers contending on library.db
+    "SQLITE_BUSY_TIMEOUT": database.BUSY_TIMEOUT,
+    "SQLITE_WRITE_RETRIES": database.WRITE_RETRIES,
+    # Catalog, search and report reads go to a read-only connection: the
+    # primary by default, or a snapshot file at READ_REPLICA_PATH refreshed with
+    # the backup API once it is READ_REPLICA_MAX_STALENESS seconds old
+    "READ_REPLICA_PATH": database.READ_REPLICA,
+    "READ_REPLICA_MAX_STALENESS": database.REPLICA_MAX_STALENESS,
+    # Split loan history across this many SQLite files by patron (1 = keep it in
+    # library.db); the LOAN_SHARDS environment variable overrides it. Changing
+    # it needs `flask shards rebalance` first.
+    "LOAN_SHARDS": database.SHARD_COUNT,
+    # Cache rendered /catalog, /search and /status pages keyed on the catalog version
+    "RENDER_CACHE": True,
+    "RENDER_CACHE_SIZE": 256,
+    # Compile every template at startup instead of on first use
+    "PRECOMPILE_TEMPLATES": True,
+    # JSON API: Cache-Control max-age (0 = always revalidate with the ETag)
+    "API_CACHE_MAX_AGE": 0,
+    # JSON API: gzip/brotli-compress responses at least this many bytes long
+    "API_COMPRESSION": True,
+    "API_COMPRESS_MIN_SIZE": 1024,
+    # Total size of cached search results per worker, in bytes
+    "SEARCH_CACHE_MAX_BYTES": 4 * 1024 * 1024,
+    # Build the typeahead prefix and fuzzy-search trigram indexes at startup
+    # instead of on the first lookup
+    "SUGGEST_INDEX_PRELOAD": True,
+    "FUZZY_INDEX_PRELOAD": True,
+    # Borrow/return/payment analytics events, written to the events table by a
+    # background thread in batches. When EVENTS_QUEUE_SIZE events are waiting,
+    # EVENTS_DROP_POLICY is "block" (wait up to EVENTS_BLOCK_TIMEOUT seconds),
+    # "drop_newest" or "drop_oldest".
+    "EVENTS_ENABLED": True,
+    "EVENTS_QUEUE_SIZE": 10_000,
+    "EVENTS_BATCH_SIZE": 500,
+    "EVENTS_FLUSH_INTERVAL": 0.2,
+    "EVENTS_DROP_POLICY": "drop_newest",
+    "EVENTS_BLOCK_TIMEOUT": 0.05,
+    # Holds: a returned copy is set aside for the next patron in line for
+    # HOLD_PICKUP_DAYS. /api/holds/stream re-reads ready holds every
+    # HOLD_STREAM_POLL_SECONDS (returns in other workers) and closes after
+    # HOLD_STREAM_MAX_SECONDS so the client reconnects.
+    "HOLD_PICKUP_DAYS": hold_service.HOLD_PICKUP_DAYS,
+    "HOLD_STREAM_POLL_SECONDS": 5.0,
+    "HOLD_STREAM_MAX_SECONDS": 300,
+    # /api/stream/availability: changes made by other workers are picked up by
+    # one poll of the catalog version every AVAILABILITY_POLL_SECONDS per
+    # worker (not per stream); idle streams send a comment every
+    # AVAILABILITY_STREAM_KEEPALIVE_SECONDS
+    "AVAILABILITY_POLL_SECONDS": availability_feed.poll_interval,
+    "AVAILABILITY_STREAM_KEEPALIVE_SECONDS": 15.0,
+    "AVAILABILITY_STREAM_MAX_SECONDS": 300,
+    # Have /catalog follow that stream to update its Availability column. Off
+    # by default: every open catalog tab then holds a server thread.
+    "CATALOG_LIVE_AVAILABILITY": False,
+    # Identical concurrent catalog, search, late-fee and page-render calls run
+    # once and share the result. A caller waits at most the timeout for its
+    # kind of call ("page" for rendered pages) before running its own.
+    "SINGLE_FLIGHT": True,
+    "SINGLE_FLIGHT_TIMEOUTS": dict(library_service.COALESCE_TIMEOUTS, page=single_flight.timeout),
+    # Admission control for borrow/return/hold/late-fee requests: token buckets
+    # per patron ID and per client IP (RATE tokens/second, up to BURST), at most
+    # ADMISSION_MAX_KEYS buckets each (least recently used are dropped), and at
+    # most ADMISSION_MAX_CONCURRENT_WRITES writing requests at once, each
+    # waiting up to ADMISSION_WRITE_WAIT seconds for a slot. Over a limit the
+    # request gets 429 with Retry-After. Behind a proxy, the client IP is only
+    # right if the proxy's address is rewritten (werkzeug ProxyFix).
+    "ADMISSION_CONTROL": True,
+    "ADMISSION_PATRON_RATE": 2.0,
+    "ADMISSION_PATRON_BURST": 20,
+    "ADMISSION_IP_RATE": 20.0,
+    "ADMISSION_IP_BURST": 120,
+    "ADMISSION_MAX_KEYS": 100_000,
+    "ADMISSION_MAX_CONCURRENT_WRITES": 4,
+    "ADMISSION_WRITE_WAIT": 0.05,
+    # Reads made while serving a request are aborted after this many seconds
+    # (503 + Retry-After); writes always finish. 0 or None turns it off.
+    "QUERY_DEADLINE_SECONDS": 5.0,
+    # Background database maintenance, per worker: every
+    # MAINTENANCE_TICK_SECONDS, once the worker has served nothing for
+    # MAINTENANCE_QUIET_SECONDS (and the local hour is inside
+    # MAINTENANCE_WINDOW, e.g. (1, 5), if set), run each task whose interval
+    # has passed. A WAL file over MAINTENANCE_CHECKPOINT_WAL_BYTES brings the
+    # checkpoint forward, MAINTENANCE_ANALYZE_CHANGES new rows bring ANALYZE
+    # forward, and incremental vacuum only runs on files with at least
+    # MAINTENANCE_VACUUM_FREE_RATIO of their pages free.
+    "MAINTENANCE_ENABLED": True,
+    "MAINTENANCE_TICK_SECONDS": 60.0,
+    "MAINTENANCE_QUIET_SECONDS": 5.0,
+    "MAINTENANCE_WINDOW": None,
+    "MAINTENANCE_INTERVALS": dict(maintenance.DEFAULT_INTERVALS),
+    "MAINTENANCE_ANALYZE_CHANGES": 10_000,
+    "MAINTENANCE_CHECKPOINT_WAL_BYTES": 64 * 1024 * 1024,
+    "MAINTENANCE_VACUUM_FREE_RATIO": 0.1,
+    "MAINTENANCE_VACUUM_STEP_PAGES": 256,
+    # `flask backup create`: online snapshots into BACKUP_DIR, copied
+    # BACKUP_STEP_PAGES pages at a time with BACKUP_STEP_SLEEP seconds between
+    # steps; the newest BACKUP_KEEP snapshots are kept
+    "BACKUP_DIR": backup.BACKUP_DIR,
+    "BACKUP_KEEP": backup.KEEP,
+    "BACKUP_STEP_PAGES": backup.STEP_PAGES,
+    "BACKUP_STEP_SLEEP": backup.STEP_SLEEP,
+    # `flask recommendations build` writes the co-borrow index here (None:
+    # beside DATABASE, library.db -> library.related.bin); /api/books/<id>/related
+    # and the catalog and search pages read it
+    "RELATED_INDEX_PATH": recommendations.INDEX_PATH,
+}
+
+_shutdown_hook_registered = False
+
 
+def _environment_config() -> Dict:
+    """
+    Settings taken from the environment, the way wsgi.py and gunicorn.conf.py
+    read them, so `flask --app app ...` commands see the same loan shards as
+    the server they maintain.
+    """
+    config: Dict = {}
+    if os.environ.get("LOAN_SHARDS"):
+        config["LOAN_SHARDS"] = int(os.environ["LOAN_SHARDS"])
+    if click.get_current_context(silent=True) is not None:
+        # Built by the Flask CLI to run a maintenance command against a real catalog
+        config["SAMPLE_DATA"] = os.environ.get("SAMPLE_DATA") == "1"
+    return config
 
-def create_app():
+
+def create_app(config: Optional[Dict] = None):
     """
     Application factory function to create and configure Flask app.
-    
+
+    Args:
+        config: Optional overrides for DEFAULT_CONFIG, the environment and Flask settings
+
     Returns:
         Flask: Configured Flask application instance
     """
     app = Flask(__name__)
     app.secret_key = "super secret key"
-    
-    # Initialize the database
-    init_database()
-    
-    # Add sample data for testing and demonstration
-    add_sample_data()
-    
+    app.config.update(DEFAULT_CONFIG)
+    app.config.update(_environment_config())
+    if config:
+        app.config.update(config)
+
+    database.BUSY_TIMEOUT = app.config["SQLITE_BUSY_TIMEOUT"]
+    database.WRITE_RETRIES = app.config["SQLITE_WRITE_RETRIES"]
+    database.READ_REPLICA = app.config["READ_REPLICA_PATH"]
+    database.REPLICA_MAX_STALENESS = app.config["READ_REPLICA_MAX_STALENESS"]
+    database.SHARD_COUNT = app.config["LOAN_SHARDS"]
+    search_cache.max_bytes = app.config["SEARCH_CACHE_MAX_BYTES"]
+    hold_service.HOLD_PICKUP_DAYS = app.config["HOLD_PICKUP_DAYS"]
+    availability_feed.poll_interval = app.config["AVAILABILITY_POLL_SECONDS"]
+    backup.BACKUP_DIR = app.config["BACKUP_DIR"]
+    backup.KEEP = app.config["BACKUP_KEEP"]
+    backup.STEP_PAGES = app.config["BACKUP_STEP_PAGES"]
+    backup.STEP_SLEEP = app.config["BACKUP_STEP_SLEEP"]
+    recommendations.INDEX_PATH = app.config["RELATED_INDEX_PATH"]
+    single_flight.enabled = app.config["SINGLE_FLIGHT"]
+    timeouts = dict(app.config["SINGLE_FLIGHT_TIMEOUTS"])
+    single_flight.timeout = timeouts.pop("page", single_flight.timeout)
+    library_service.COALESCE_TIMEOUTS.update(timeouts)
+    database.add_availability_listener(availability_feed.changed)
+    event_bus.configure(
+        enabled=app.config["EVENTS_ENABLED"],
+        max_queue=app.config["EVENTS_QUEUE_SIZE"],
+        batch_size=app.config["EVENTS_BATCH_SIZE"],
+        flush_interval=app.config["EVENTS_FLUSH_INTERVAL"],
+        drop_policy=app.config["EVENTS_DROP_POLICY"],
+        block_timeout=app.config["EVENTS_BLOCK_TIMEOUT"],
+    )
+    global _shutdown_hook_registered
+    if not _shutdown_hook_registered:
+        # Write queued events before the worker process exits
+        atexit.register(event_bus.close)
+        _shutdown_hook_registered = True
+
+    if app.config["INIT_DATABASE"]:
+        # Initialize the database (a single PRAGMA read once the schema is current)
+        init_database()
+
+    if app.config["SAMPLE_DATA"]:
+        # Add sample data for testing and demonstration
+        add_sample_data()
+
+    if app.config["SUGGEST_INDEX_PRELOAD"]:
+        suggest_index.rebuild()
+    if app.config["FUZZY_INDEX_PRELOAD"]:
+        fuzzy_index.rebuild()
+
     # Register all route blueprints
     register_blueprints(app)
-    
+    init_render_cache(app)
+    init_admission_control(app)
+    init_query_deadlines(app)
+    init_maintenance(app)
+    register_commands(app)
+
     return app
 
 
@@ -0,0 +1,143 @@
+"""
+Fan-out benchmark for /api/stream/availability with many subscribers in one process.
+
+Opens N streams through the real endpoint (Flask test client, unbuffered), each
+read by its own thread the way a gthread worker serves it, then makes U
+availability changes through update_book_availability spaced --interval apart.
+Reports delivery latency from the write starting to each stream yielding the
+delta (p50/p99/max), how many deltas a stream saw coalesced into one event,
+how long update_book_availability takes on the writing request, the time
+the feed's dispatcher spends in publish() per change, and resident memory
+per open stream.
+
+    python benchmarks/availability_stream.py --subscribers 100 1000 5000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import database  # noqa: E402
+from app import create_app  # noqa: E402
+from services.availability_feed import availability_feed  # noqa: E402
+from services.pubsub import pubsub  # noqa: E402
+
+START_COPIES = 1_000_000
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def run(subscribers: int, updates: int, interval: float) -> None:
+    app = create_app({"SAMPLE_DATA": False, "AVAILABILITY_STREAM_MAX_SECONDS": 3600})
+    database.insert_book("popular", "author", "9780000000001", START_COPIES, START_COPIES)
+    book_id = database.get_book_by_isbn("9780000000001")["id"]
+    client = app.test_client()
+
+    published_at = {}
+    arrivals = []
+    events_seen = []
+    lock = threading.Lock()
+    ready = threading.Barrier(subscribers + 1)
+    last = START_COPIES - updates
+
+    def reader() -> None:
+        response = client.get("/api/stream/availability", buffered=False)
+        chunks = iter(response.response)
+        next(chunks), next(chunks)  # retry, snapshot
+        ready.wait()
+        mine, events = [], 0
+        for chunk in chunks:
+            received = time.perf_counter()
+            if not chunk.startswith(b"event: availability"):
+                continue
+            events += 1
+            data = json.loads(chunk.split(b"\ndata: ", 1)[1])
+            available = dict(data)[book_id]
+            mine.append(received - published_at[available])
+            if available == last:
+                break
+        response.close()
+        with lock:
+            arrivals.extend(mine)
+            events_seen.append(events)
+
+    threading.stack_size(256 * 1024)
+    before = rss_mb()
+    threads = [threading.Thread(target=reader, daemon=True) for _ in range(subscribers)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    per_stream_kb = (rss_mb() - before) * 1024 / subscribers
+
+    fan_out = []
+    writes = []
+    original_publish = pubsub.publish
+
+    def timed_publish(topic, message):
+        t0 = time.perf_counter()
+        count = original_publish(topic, message)
+        fan_out.append(time.perf_counter() - t0)
+        return count
+
+    pubsub.publish = timed_publish
+    try:
+        for n in range(1, updates + 1):
+            published_at[START_COPIES - n] = t0 = time.perf_counter()
+            database.update_book_availability(book_id, -1)
+            writes.append(time.perf_counter() - t0)
+            time.sleep(interval)
+        for thread in threads:
+            thread.join(60)
+    finally:
+        pubsub.publish = original_publish
+
+    ms = [a * 1e3 for a in arrivals]
+    print(
+        f"{subscribers:>11,} {statistics.median(ms):>9.2f} {percentile(ms, 0.99):>8.2f} {max(ms):>8.2f} "
+        f"{updates / statistics.mean(events_seen):>9.2f} {statistics.median(writes) * 1e3:>9.2f} "
+        f"{statistics.median(fan_out) * 1e3:>11.2f} "
+        f"{per_stream_kb:>10.1f}"
+    )
+    assert pubsub.subscriber_count(availability_feed.topic) == 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--updates", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.05, help="Seconds between changes.")
+    args = parser.parse_args()
+
+    print(f"{args.updates} changes, {args.interval * 1e3:.0f} ms apart")
+    print(f"{'subscribers':>11} {'p50 ms':>9} {'p99 ms':>8} {'max ms':>8} {'coalesced':>9} "
+          f"{'write ms':>9} {'publish ms':>11} {'KB/stream':>10}")
+    for count in args.subscribers:
+        with tempfile.TemporaryDirectory() as tmp:
+            database.DATABASE = str(Path(tmp) / "library.db")
+            run(count, args.updates, args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Borrow latency while an online backup runs.
+
+Fills a database with BOOKS books and LOANS returned loans, then runs a
+borrow-and-return loop on THREADS threads for SECONDS per phase and reports
+borrow latency p50/p99/max in three phases: no backup, back-to-back paced
+backups (--step-pages pages with --step-sleep seconds between steps, the
+defaults `flask backup create` uses), and back-to-back one-shot backups
+(the whole file in one step). Backups run in a separate process, like the
+CLI run from cron would.
+
+    python benchmarks/backup_latency.py --loans 300000 --seconds 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import database  # noqa: E402
+from services import backup, library_service  # noqa: E402
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def load(books: int, loans: int) -> None:
+    conn = database.get_db_connection()
+    conn.executemany(
+        "INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, 5, 5)",
+        ((f"title {i}", f"author {i % 700}", f"{9780000000000 + i}") for i in range(books)),
+    )
+    now = datetime.now()
+    conn.executemany(
+        "INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date) "
+        "VALUES (?, ?, ?, ?, ?)",
+        ((f"{200000 + i % 50_000}", 1 + i % books, (now - timedelta(days=400)).isoformat(),
+          (now - timedelta(days=386)).isoformat(), (now - timedelta(days=390)).isoformat())
+         for i in range(loans)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def backups_until(path: str, out: str, pages: int, sleep: float, stop, results) -> None:
+    database.DATABASE = path
+    while not stop.is_set():
+        manifest = backup.create_snapshot(out, pages=pages, sleep=sleep, keep=1)
+        results.append(manifest["seconds"])
+
+
+def circulate(threads: int, seconds: float) -> list:
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def patron(n: int) -> None:
+        patron_id, book_id = f"{100000 + n}", 1 + n
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            ok, message = library_service.borrow_book_by_patron(patron_id, book_id)
+            elapsed = time.perf_counter() - t0
+            assert ok, message
+            library_service.return_book_by_patron(patron_id, book_id)
+            with lock:
+                latencies.append(elapsed * 1e3)
+
+    workers = [threading.Thread(target=patron, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--books", type=int, default=2_000)
+    parser.add_argument("--loans", type=int, default=300_000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--step-pages", type=int, default=backup.STEP_PAGES)
+    parser.add_argument("--step-sleep", type=float, default=backup.STEP_SLEEP)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE = str(Path(tmp) / "library.db")
+        database.init_database()
+        load(args.books, args.loans)
+        size = Path(database.DATABASE).stat().st_size
+        print(f"{args.books:,} books, {args.loans:,} loans ({size / 1e6:.0f} MB), "
+              f"{args.threads} threads, {args.seconds:.0f}s per phase")
+        print(f"{'backup':<22} {'borrows':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'backups':>8} {'each s':>7}")
+
+        phases = [
+            ("none", None),
+            (f"paced {args.step_pages}p/{args.step_sleep * 1e3:.0f}ms", (args.step_pages, args.step_sleep)),
+            ("one step", (-1, 0.0)),
+        ]
+        context = multiprocessing.get_context("spawn")
+        for label, pacing in phases:
+            manager = context.Manager()
+            stop, results = manager.Event(), manager.list()
+            process = None
+            if pacing is not None:
+                process = context.Process(
+                    target=backups_until,
+                    args=(database.DATABASE, str(Path(tmp) / "backups"), *pacing, stop, results),
+                )
+                process.start()
+                time.sleep(0.5)
+            latencies = circulate(args.threads, args.seconds)
+            if process is not None:
+                stop.set()
+                process.join()
+            each = f"{statistics.mean(results):7.2f}" if results else f"{'-':>7}"
+            print(
+                f"{label:<22} {len(latencies):>8,} {statistics.median(latencies):>8.2f} "
+                f"{percentile(latencies, 0.99):>8.2f} {max(latencies):>8.2f} {len(results):>8} {each}"
+            )
+            manager.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Throughput benchmark for the weekly patron notice run.
+
+Loads P patrons with 5 loans each (some open, some overdue) and compares
+patrons/second for calling get_patron_status_report once per patron against
+generate_reports (one ordered scan, in-process and on a process pool).
+
+    python benchmarks/bulk_reports.py --patrons 50000 --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import database  # noqa: E402
+from services.bulk_reports import generate_reports  # noqa: E402
+from services.library_service import get_patron_status_report  # noqa: E402
+
+
+def load(patrons: int, rng: random.Random) -> None:
+    conn = database.get_db_connection()
+    conn.executemany(
+        "INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, 99, 99)",
+        ((f"book {i}", f"author {i}", f"{9780000000000 + i}") for i in range(1000)),
+    )
+    now = datetime.now()
+    rows = []
+    for p in range(patrons):
+        for _ in range(5):
+            borrowed = now - timedelta(days=rng.randrange(1, 60))
+            returned = None if rng.random() < 0.3 else (borrowed + timedelta(days=5)).isoformat()
+            rows.append((f"{100000 + p:06d}", rng.randrange(1, 1001), borrowed.isoformat(),
+                         (borrowed + timedelta(days=14)).isoformat(), returned))
+    conn.executemany(
+        "INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date) VALUES (?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--patrons", type=int, default=50_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--seed", type=int, default=327)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE = str(Path(tmp) / "library.db")
+        database.init_database()
+        load(args.patrons, random.Random(args.seed))
+        active = [patron_id for patron_id, _ in database.iter_loans_by_patron()]
+
+        start = time.perf_counter()
+        for patron_id in active:
+            get_patron_status_report(patron_id)
+        serial = time.perf_counter() - start
+        print(f"{len(active):,} patrons with open loans")
+        print(f"get_patron_status_report per patron: {len(active) / serial:>9,.0f} patrons/s")
+
+        for workers in sorted({1, args.workers}):
+            result = generate_reports(str(Path(tmp) / "notices.jsonl"), workers=workers)
+            print(f"generate_reports, {workers} worker(s):  {result['patrons_per_second']:>9,.0f} patrons/s")
+
+
+if __name__ == "__main__":
+    main()
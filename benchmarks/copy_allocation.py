@@ -0,0 +1,131 @@
+"""
+Copy allocation and barcode-scan latency at millions of copies.
+
+Builds BOOKS books with COPIES_PER_BOOK copies each, then measures:
+barcode lookups (get_copy_by_barcode, the scan endpoint's one query),
+the same lookup forced to scan the table (NOT INDEXED) for comparison,
+allocating the first available copy of a random book and putting it
+back (allocate_copy + move_copy, each its own committed write), and
+THREADS threads racing to allocate copies of one book.
+
+    python benchmarks/copy_allocation.py --books 250000 --copies-per-book 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import database  # noqa: E402
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def load(books: int, per_book: int) -> None:
+    conn = database.get_db_connection()
+    conn.executemany(
+        "INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, ?, ?)",
+        ((f"title {i}", f"author {i % 700}", f"{9780000000000 + i}", per_book, per_book) for i in range(books)),
+    )
+    conn.executemany(
+        "INSERT INTO copies (book_id, barcode, status) VALUES (?, ?, 'available')",
+        ((book_id, database.copy_barcode(book_id, n))
+         for book_id in range(1, books + 1) for n in range(1, per_book + 1)),
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def timed(calls: int, call) -> list:
+    latencies = []
+    for _ in range(calls):
+        t0 = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - t0) * 1e3)
+    return latencies
+
+
+def report(label: str, latencies: list) -> None:
+    print(f"{label:<34} {len(latencies):>7,} {statistics.median(latencies):>9.3f} "
+          f"{percentile(latencies, 0.99):>9.3f} {max(latencies):>9.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--books", type=int, default=250_000)
+    parser.add_argument("--copies-per-book", type=int, default=8)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    parser.add_argument("--allocations", type=int, default=2_000)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE = str(Path(tmp) / "library.db")
+        database.init_database()
+        t0 = time.perf_counter()
+        load(args.books, args.copies_per_book)
+        total = args.books * args.copies_per_book
+        print(f"{args.books:,} books, {total:,} copies, loaded in {time.perf_counter() - t0:.1f}s")
+        print(f"{'operation':<34} {'calls':>7} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+
+        rng = random.Random(7)
+
+        def random_barcode() -> str:
+            return database.copy_barcode(rng.randint(1, args.books), rng.randint(1, args.copies_per_book))
+
+        report("scan barcode (indexed)", timed(args.lookups, lambda: database.get_copy_by_barcode(random_barcode())))
+
+        conn = database.get_db_connection()
+        report("scan barcode (NOT INDEXED)", timed(5, lambda: conn.execute(
+            "SELECT * FROM copies NOT INDEXED WHERE barcode = ?", (random_barcode(),)).fetchone()))
+        conn.close()
+
+        now = datetime.now()
+
+        def allocate_and_return() -> None:
+            book_id = rng.randint(1, args.books)
+            copy = database.allocate_copy(book_id, "100001", now)
+            database.move_copy(book_id, "on_loan", "available", now, copy_id=copy["id"])
+
+        report("allocate + return (2 commits)", timed(args.allocations, allocate_and_return))
+
+        # every thread wants a copy of book 1; exactly copies_per_book may get one
+        barrier = threading.Barrier(args.threads)
+        got, latencies, lock = [], [], threading.Lock()
+
+        def contend(n: int) -> None:
+            barrier.wait()
+            t0 = time.perf_counter()
+            copy = database.allocate_copy(1, f"{300000 + n}", now)
+            elapsed = (time.perf_counter() - t0) * 1e3
+            with lock:
+                latencies.append(elapsed)
+                if copy is not None:
+                    got.append(copy["id"])
+
+        threads = [threading.Thread(target=contend, args=(n,)) for n in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        report(f"{args.threads} threads racing for 1 book", latencies)
+        assert len(got) == len(set(got)) == min(args.threads, args.copies_per_book), got
+        print(f"  {len(got)} of {args.threads} got a copy, no copy lent twice")
+
+
+if __name__ == "__main__":
+    main()
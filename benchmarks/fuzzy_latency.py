@@ -0,0 +1,96 @@
+"""
+Latency benchmark for fuzzy (typo-tolerant) search as the catalog grows.
+
+For each catalog size, builds a FuzzyIndex over synthetic titles and times
+queries made by introducing one typo (swap, drop or substitute a letter) into
+real title words. Titles draw from a 20,000-word pseudo vocabulary with a
+Zipf-like skew, like real catalogs. Stop-trigram and candidate caps should
+keep p99 roughly flat as the catalog grows.
+
+    python benchmarks/fuzzy_latency.py --sizes 10000 100000 500000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from services.fuzzy_index import FuzzyIndex  # noqa: E402
+
+SYLLABLES = "ka ri mon tel sa vor en li dra qu bel ost ar fin gal ho pe tur wy zen".split()
+
+
+def vocabulary(size: int, rng: random.Random):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def zipf_word(words, rng: random.Random) -> str:
+    return words[min(len(words) - 1, int(rng.paretovariate(1.1)) - 1)]
+
+
+def synthetic_books(count: int, words, rng: random.Random):
+    for book_id in range(1, count + 1):
+        title = " ".join(zipf_word(words, rng) for _ in range(rng.randint(2, 5)))
+        yield {"id": book_id, "title": title, "author": f"{zipf_word(words, rng)} {rng.choice(words)}"}
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def with_typo(word: str, rng: random.Random) -> str:
+    i = rng.randrange(len(word) - 1)
+    kind = rng.choice(("swap", "drop", "sub"))
+    if kind == "swap":
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    if kind == "drop":
+        return word[:i] + word[i + 1:]
+    return word[:i] + rng.choice("abcdefghijklmnopqrstuvwxyz") + word[i + 1:]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+    parser.add_argument("--queries", type=int, default=2_000)
+    parser.add_argument("--seed", type=int, default=327)
+    args = parser.parse_args()
+
+    words = vocabulary(20_000, random.Random(args.seed))
+    rng = random.Random(args.seed)
+    rng.shuffle(words)
+    print(f"{'books':>10} {'build s':>8} {'p50 ms':>8} {'p99 ms':>8} {'hit rate':>9}")
+    for size in args.sizes:
+        rng = random.Random(args.seed)
+        index = FuzzyIndex()
+        start = time.perf_counter()
+        books = list(synthetic_books(size, words, rng))
+        index.load(books)
+        build = time.perf_counter() - start
+
+        timings, hits = [], 0
+        for _ in range(args.queries):
+            title_words = rng.choice(books)["title"].split()
+            picked = rng.sample(title_words, min(len(title_words), rng.randint(1, 2)))
+            query = " ".join(with_typo(word, rng) for word in picked)
+            t0 = time.perf_counter()
+            hits += bool(index.search(query))
+            timings.append((time.perf_counter() - t0) * 1e3)
+        print(
+            f"{size:>10,} {build:>8.1f} {statistics.median(timings):>8.2f} "
+            f"{percentile(timings, 0.99):>8.2f} {hits / args.queries:>9.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Throughput benchmark for the bulk-import ISBN validator.
+
+Generates N ISBNs in a bulk-import mix (mostly bare ISBN-13s, some ISBN-10s,
+hyphenated forms and bad checksums) and reports ISBNs validated per second by
+validate_isbn_batch (on that mix and on bare ISBN-13s only), and by isbn_key
+one at a time for comparison.
+
+    python benchmarks/isbn_batch.py --count 2000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from isbn import isbn10_to_isbn13, isbn13_check_digit, isbn_key, validate_isbn_batch  # noqa: E402
+
+
+def make_isbns(count: int, rng: random.Random):
+    isbns = []
+    for _ in range(count):
+        roll = rng.random()
+        body = f"{rng.randrange(10 ** 9):09d}"
+        if roll < 0.05:
+            check = sum((10 - i) * int(d) for i, d in enumerate(body)) % 11
+            check = (11 - check) % 11
+            isbns.append(body + ("X" if check == 10 else str(check)))
+        elif roll < 0.10:
+            isbn13 = isbn10_to_isbn13(body + "0")
+            isbns.append(f"{isbn13[:3]}-{isbn13[3]}-{isbn13[4:9]}-{isbn13[9:12]}-{isbn13[12]}")
+        else:
+            first = "978" + body
+            check = isbn13_check_digit(first)
+            if roll < 0.12:
+                check = (check + 1) % 10
+            isbns.append(first + str(check))
+    return isbns
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--count", type=int, default=2_000_000)
+    parser.add_argument("--seed", type=int, default=327)
+    args = parser.parse_args()
+    isbns = make_isbns(args.count, random.Random(args.seed))
+
+    isbn13_only = [isbn for isbn in isbns if len(isbn) == 13]
+    for label, batch_input in (("mixed", isbns), ("ISBN-13 only", isbn13_only)):
+        start = time.perf_counter()
+        keys = validate_isbn_batch(batch_input)
+        batch = time.perf_counter() - start
+        invalid = sum(key is None for key in keys)
+        print(
+            f"validate_isbn_batch, {label}: {len(batch_input) / batch / 1e6:.2f} M ISBNs/s "
+            f"({invalid:,} invalid)"
+        )
+
+    sample = isbns[: min(len(isbns), 500_000)]
+    start = time.perf_counter()
+    for raw in sample:
+        isbn_key(raw, strict=True)
+    single = time.perf_counter() - start
+    print(f"isbn_key one at a time: {len(sample) / single / 1e6:.2f} M ISBNs/s")
+
+
+if __name__ == "__main__":
+    main()
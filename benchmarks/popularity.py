@@ -0,0 +1,108 @@
+"""
+Most-borrowed rankings: counters and heap top-N against a GROUP BY over the loans.
+
+Loads LOANS loans of BOOKS books spread over the last DAYS days, rebuilds the
+popularity counters from them, then times, for each window: the naive
+aggregate over borrow_records, the index's first (cold) ranking, a warm
+ranking with the counters unchanged, and a ranking right after BATCH more
+borrows have been counted (the incremental refresh).
+
+    python benchmarks/popularity.py --books 100000 --loans 2000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import database  # noqa: E402
+from services.popularity import WINDOWS, PopularityIndex  # noqa: E402
+
+NAIVE = """
+    SELECT book_id, COUNT(*) AS borrows FROM borrow_records
+    WHERE borrow_date >= ? GROUP BY book_id ORDER BY borrows DESC, book_id LIMIT 10
+"""
+
+
+def load(books: int, loans: int, days: int, now: datetime, rng: random.Random) -> None:
+    conn = database.get_db_connection()
+    # a skewed catalog: a few books get most of the borrows
+    weights = [1 / (rank + 1) for rank in range(books)]
+    book_ids = rng.choices(range(1, books + 1), weights=weights, k=loans)
+    conn.executemany(
+        "INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date) VALUES (?, ?, ?, ?)",
+        ((f"{100000 + n % 900000}", book_id, (now - timedelta(seconds=rng.randrange(days * 86400))).isoformat(),
+          now.isoformat()) for n, book_id in enumerate(book_ids)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def timed(call, repeat: int = 1) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - t0) * 1e3)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--books", type=int, default=100_000)
+    parser.add_argument("--loans", type=int, default=2_000_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    now = datetime.now()
+    today = date.today()
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE = str(Path(tmp) / "library.db")
+        database.init_database()
+        t0 = time.perf_counter()
+        load(args.books, args.loans, args.days, now, rng)
+        print(f"{args.loans:,} loans of {args.books:,} books over {args.days} days, "
+              f"loaded in {time.perf_counter() - t0:.1f}s")
+        t0 = time.perf_counter()
+        counts = database.rebuild_popularity(now)
+        print(f"rebuild: {counts['daily_rows']:,} daily buckets, {counts['books']:,} books "
+              f"in {time.perf_counter() - t0:.2f}s")
+
+        conn = database.get_read_connection()
+        index = PopularityIndex()
+        print(f"{'window':<8} {'GROUP BY ms':>12} {'cold ms':>9} {'warm ms':>9} {'after batch ms':>15}")
+        for window, days in WINDOWS.items():
+            since = (now - timedelta(days=days)).isoformat() if days else ""
+            naive = timed(lambda: conn.execute(NAIVE, (since,)).fetchall(), repeat=3)
+            cold = timed(lambda: PopularityIndex().top(window, 10, today))
+            index.top(window, 10, today)
+            warm = timed(lambda: index.top(window, 10, today), repeat=200)
+
+            def after_batch() -> None:
+                # counted one at a time, as borrow_book_by_patron does
+                for _ in range(args.batch):
+                    database.add_borrow_counts([(today.isoformat(), rng.randint(1, args.books), 1)])
+                t0 = time.perf_counter()
+                index.top(window, 10, today)
+                refresh_times.append((time.perf_counter() - t0) * 1e3)
+
+            refresh_times: list = []
+            for _ in range(5):
+                after_batch()
+            print(f"{window:<8} {naive:>12.1f} {cold:>9.1f} {warm:>9.3f} {statistics.median(refresh_times):>15.2f}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
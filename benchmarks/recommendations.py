@@ -0,0 +1,128 @@
+"""
+Related books: the offline co-borrow index against a self-join over the loans.
+
+Loads LOANS loans of BOOKS books by PATRONS patrons (each patron keeps to a
+few genres, so co-borrowing has structure), builds the index with MAX_PAIRS
+in-memory pair counts, and reports the build time, peak memory and file
+size. Then times, over books picked as often as they are borrowed, the
+self-join a request would otherwise run, the index lookup alone, and the
+full related_books() call (lookup plus the books fetch the endpoint makes).
+
+    python benchmarks/recommendations.py --books 20000 --patrons 50000 --loans 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import database  # noqa: E402
+from services import recommendations  # noqa: E402
+from services.recommendations import RelatedIndex, build, related_books  # noqa: E402
+
+SELF_JOIN = """
+    SELECT b.book_id, COUNT(DISTINCT b.patron_id) AS shared
+    FROM borrow_records a JOIN borrow_records b ON a.patron_id = b.patron_id AND b.book_id != a.book_id
+    WHERE a.book_id = ? GROUP BY b.book_id ORDER BY shared DESC LIMIT 10
+"""
+GENRES = 50
+
+
+def pick(books: int, genre: int, rng: random.Random) -> int:
+    # books are dealt round-robin into genres; popular ones first within each
+    return genre + 1 + GENRES * min(int(rng.paretovariate(1.2)) - 1, books // GENRES - 1)
+
+
+def load(books: int, patrons: int, loans: int, now: datetime, rng: random.Random) -> None:
+    conn = database.get_db_connection()
+    conn.executemany(
+        "INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES (?, 'author', ?, 1, 1)",
+        ((f"book {n}", f"{9780000000000 + n}") for n in range(1, books + 1)),
+    )
+    tastes = [rng.sample(range(GENRES), 3) for _ in range(patrons)]
+
+    def rows():
+        for _ in range(loans):
+            patron = rng.randrange(patrons)
+            book_id = pick(books, rng.choice(tastes[patron]), rng)
+            borrowed = now - timedelta(seconds=rng.randrange(365 * 86400))
+            yield f"{100000 + patron}", book_id, borrowed.isoformat(), borrowed.isoformat()
+
+    conn.executemany(
+        "INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date) VALUES (?, ?, ?, ?)", rows()
+    )
+    conn.commit()
+    conn.close()
+
+
+def timed(call, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - t0) * 1e3)
+    return samples
+
+
+def report(label: str, samples: list) -> None:
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<28} p50 {statistics.median(samples):>9.3f} ms   p99 {p99:>9.3f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--books", type=int, default=20_000)
+    parser.add_argument("--patrons", type=int, default=50_000)
+    parser.add_argument("--loans", type=int, default=1_000_000)
+    parser.add_argument("--max-pairs", type=int, default=recommendations.MAX_PAIRS)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE = str(Path(tmp) / "library.db")
+        database.init_database()
+        t0 = time.perf_counter()
+        load(args.books, args.patrons, args.loans, datetime.now(), rng)
+        print(f"{args.loans:,} loans of {args.books:,} books by {args.patrons:,} patrons, "
+              f"loaded in {time.perf_counter() - t0:.1f}s")
+
+        recommendations.MAX_PAIRS = args.max_pairs
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result = build()
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f"build: {result['related_pairs']:,} related pairs, {result['neighbours']:,} neighbours, "
+              f"{result['spilled_runs']} spilled runs, {result['bytes'] / 2**20:.1f} MiB file, "
+              f"{result['seconds']:.1f}s, peak RSS {max(before, peak) / 1024:.0f} MiB "
+              f"(+{(peak - before) / 1024:.0f} MiB)")
+
+        # looked up as often as they are borrowed, as a catalog page's would be
+        book_ids = [pick(args.books, rng.randrange(GENRES), rng) for _ in range(args.lookups)]
+        conn = database.get_read_connection()
+        join_ids = iter(book_ids[:20])
+        report("self-join (20 books)", timed(lambda: conn.execute(SELF_JOIN, (next(join_ids),)).fetchall(), 20))
+        conn.close()
+
+        index = RelatedIndex()
+        t0 = time.perf_counter()
+        index.related(1)
+        print(f"first lookup (maps the file)  {(time.perf_counter() - t0) * 1e3:.3f} ms")
+        ids = iter(book_ids)
+        report("index lookup", timed(lambda: index.related(next(ids), 10), len(book_ids)))
+        ids = iter(book_ids)
+        report("related_books (with rows)", timed(lambda: related_books(next(ids), 10), len(book_ids)))
+
+
+if __name__ == "__main__":
+    main()
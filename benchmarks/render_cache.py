@@ -0,0 +1,65 @@
+"""
+Load test: repeated /catalog views with and without the render cache.
+
+Seeds a scratch database with a catalog of N books, then measures requests/sec
+through the Flask test client for three cases: cache off, cache on, and cache
+on with clients revalidating via If-None-Match (304s).
+
+    python benchmarks/render_cache.py --books 500 --requests 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import database  # noqa: E402
+from app import create_app  # noqa: E402
+
+
+def seed(books: int) -> None:
+    conn = database.get_db_connection()
+    conn.executemany(
+        'INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, ?, ?)',
+        ((f"title {i:06d}", f"author {i % 97}", f"{9780000000000 + i}", 3, 2) for i in range(books)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def measure(label: str, requests: int, cache: bool, revalidate: bool) -> None:
+    app = create_app({"SAMPLE_DATA": False, "RENDER_CACHE": cache})
+    client = app.test_client()
+    headers = {}
+    if revalidate:
+        headers["If-None-Match"] = client.get("/catalog").headers["ETag"]
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.get("/catalog", headers=headers)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {requests / elapsed:>10.1f} req/s  {elapsed / requests * 1000:>8.3f} ms/req")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--books", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="library-render-") as workdir:
+        database.DATABASE = str(Path(workdir) / "library.db")
+        database.init_database()
+        seed(args.books)
+        measure("no cache", args.requests, cache=False, revalidate=False)
+        measure("render cache", args.requests, cache=True, revalidate=False)
+        measure("render cache + 304", args.requests, cache=True, revalidate=True)
+
+
+if __name__ == "__main__":
+    main()
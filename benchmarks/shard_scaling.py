@@ -0,0 +1,133 @@
+"""
+Loan sharding benchmark: patron lookups and fan-out queries versus shard count.
+
+For each shard count, bulk-loads N synthetic loans (10 per patron, 10% still
+open) into a fresh database split into that many shard files, then reports
+load rate, p50/p99 of the patron-scoped helpers, and the latency of a
+fan-out query (all open loans of one book) run serially versus on the shard
+thread pool. Loans are written straight into the shard files in large
+transactions; the request path only matters for the lookups being timed.
+
+    python benchmarks/shard_scaling.py --loans 1000000 --shards 1 4 8
+    python benchmarks/shard_scaling.py --loans 100000000 --shards 8 16   # ~10 GB of disk
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import database  # noqa: E402
+
+BOOKS = 5_000
+LOANS_PER_PATRON = 10
+CHUNK = 200_000
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def load(loans: int, rng: random.Random) -> float:
+    conn = database.get_db_connection()
+    conn.executemany(
+        "INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, 1000, 1000)",
+        ((f"book {i}", f"author {i % 500}", f"{9780000000000 + i}") for i in range(BOOKS)),
+    )
+    conn.commit()
+    conn.close()
+
+    shards = [sqlite3.connect(path) for path in database.shard_paths()]
+    for shard in shards:
+        shard.execute("PRAGMA synchronous=OFF")
+    start = time.perf_counter()
+    base = datetime(2024, 1, 1)
+    patrons = max(1, loans // LOANS_PER_PATRON)
+    for first in range(0, loans, CHUNK):
+        batches = [[] for _ in shards]
+        for n in range(first, min(loans, first + CHUNK)):
+            patron = f"{n % patrons:06d}"
+            borrowed = base + timedelta(minutes=n)
+            returned = None if rng.random() < 0.1 else (borrowed + timedelta(days=7)).isoformat()
+            batches[database.shard_index(patron)].append(
+                (patron, rng.randrange(1, BOOKS + 1), borrowed.isoformat(),
+                 (borrowed + timedelta(days=14)).isoformat(), returned)
+            )
+        for shard, rows in zip(shards, batches):
+            shard.executemany(
+                "INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            shard.commit()
+    for shard in shards:
+        shard.close()
+    return loans / (time.perf_counter() - start)
+
+
+def timed(fn, args_list):
+    samples = []
+    for args in args_list:
+        t0 = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - t0) * 1e3)
+    return samples
+
+
+def serial_fan_out(book_id: int):
+    rows = []
+    for path in database.shard_paths():
+        conn = database._connect_shard(path, read_only=True, with_books=False)
+        rows.extend(conn.execute(
+            "SELECT * FROM borrow_records WHERE book_id = ? AND return_date IS NULL", (book_id,)
+        ).fetchall())
+        conn.close()
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--loans", type=int, default=1_000_000)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--lookups", type=int, default=2_000)
+    parser.add_argument("--seed", type=int, default=327)
+    args = parser.parse_args()
+
+    print(f"{args.loans:,} loans")
+    print(f"{'shards':>6} {'load/s':>10} {'count p50':>10} {'p99':>7} {'records p50':>12} {'p99':>7} "
+          f"{'fan-out serial':>15} {'parallel':>9}  (ms)")
+    for count in args.shards:
+        rng = random.Random(args.seed)
+        with tempfile.TemporaryDirectory() as tmp:
+            database.DATABASE = str(Path(tmp) / "library.db")
+            database.SHARD_COUNT = count
+            database.init_database()
+            rate = load(args.loans, rng)
+
+            patrons = max(1, args.loans // LOANS_PER_PATRON)
+            picks = [(f"{rng.randrange(patrons):06d}",) for _ in range(args.lookups)]
+            counts = timed(database.get_patron_borrow_count, picks)
+            records = timed(database.get_patron_borrow_records, picks)
+            books = [(rng.randrange(1, BOOKS + 1),) for _ in range(200)]
+            serial = timed(serial_fan_out, books)
+            parallel = timed(database.get_active_loans_for_book, books)
+            print(
+                f"{count:>6} {rate:>10,.0f} {statistics.median(counts):>10.3f} {percentile(counts, 0.99):>7.3f} "
+                f"{statistics.median(records):>12.3f} {percentile(records, 0.99):>7.3f} "
+                f"{statistics.median(serial):>15.2f} {statistics.median(parallel):>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
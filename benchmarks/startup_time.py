@@ -0,0 +1,90 @@
+"""
+Startup benchmark: import cost and time-to-first-request for a fresh process.
+
+Reports the modules with the most self time from `python -X importtime -c "import app"`, then
+spawns fresh interpreters that build an app against a scratch database and
+serve one `/catalog` request, first with an empty database (migrations run) and
+then with a current schema (a single PRAGMA read).
+
+    python benchmarks/startup_time.py --runs 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+FIRST_REQUEST_SNIPPET = """
+import sys, time
+start = time.perf_counter()
+import database
+database.DATABASE = sys.argv[1]
+from app import create_app
+app = create_app({"SAMPLE_DATA": False})
+app.test_client().get("/catalog")
+print(time.perf_counter() - start)
+"""
+
+
+def import_profile(top: int) -> Tuple[int, List[Tuple[int, str]]]:
+    """Return total import microseconds for `import app` and the modules with the most self time."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows: List[Tuple[int, str]] = []
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|", 2)
+        total += int(self_us)
+        rows.append((int(self_us), name.strip()))
+    rows.sort(reverse=True)
+    return total, rows[:top]
+
+
+def first_request_seconds(db_path: Path) -> float:
+    result = subprocess.run(
+        [sys.executable, "-c", FIRST_REQUEST_SNIPPET, str(db_path)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    total_us, slowest = import_profile(args.top)
+    print(f"import app: {total_us / 1000:.1f} ms total, slowest modules by self time:")
+    for self_us, name in slowest:
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+    with tempfile.TemporaryDirectory(prefix="library-startup-") as workdir:
+        cold, warm = [], []
+        for run in range(args.runs):
+            db_path = Path(workdir) / f"run{run}.db"
+            cold.append(first_request_seconds(db_path))
+            warm.append(first_request_seconds(db_path))
+    print(f"time to first request, new database:     median {statistics.median(cold) * 1000:.1f} ms")
+    print(f"time to first request, current schema:   median {statistics.median(warm) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
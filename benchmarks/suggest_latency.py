@@ -0,0 +1,82 @@
+"""
+Latency benchmark for the typeahead prefix index.
+
+Builds a PrefixIndex over N synthetic titles (default 1,000,000) and reports
+build time, index size and per-lookup latency percentiles for random 1-4
+character prefixes, plus the cost of an incremental insert.
+
+    python benchmarks/suggest_latency.py --titles 1000000 --lookups 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from services.suggest_index import PrefixIndex  # noqa: E402
+
+WORDS = (
+    "shadow river garden empire winter secret silver night city ocean stone "
+    "history journey kingdom machine theory letters island mountain return "
+    "fire glass music summer forest house children war peace light dark "
+    "portrait memory station engine harbor castle voyage"
+).split()
+SURNAMES = (
+    "smith orwell austen tolkien rowling dickens morrison atwood le guin "
+    "pratchett herbert asimov woolf hemingway baldwin ishiguro"
+).split()
+
+
+def synthetic_books(count: int, rng: random.Random):
+    for book_id in range(1, count + 1):
+        title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5)))
+        yield {"id": book_id, "title": f"{title} {book_id}", "author": rng.choice(SURNAMES)}
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--titles", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=327)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    index = PrefixIndex()
+    start = time.perf_counter()
+    index.load(synthetic_books(args.titles, rng))
+    build = time.perf_counter() - start
+    entries = len(index._tokens)
+    approx_mb = (entries * 8 + index._ids.itemsize * entries) / 1e6
+    print(f"built {args.titles:,} titles in {build:.1f}s: {entries:,} tokens, ~{approx_mb:.0f} MB of index arrays")
+
+    prefixes = [rng.choice(WORDS + SURNAMES)[: rng.randint(1, 4)] for _ in range(args.lookups)]
+    timings = []
+    for prefix in prefixes:
+        t0 = time.perf_counter()
+        index.suggest(prefix, args.limit)
+        timings.append((time.perf_counter() - t0) * 1e6)
+    print(
+        f"suggest (top {args.limit}): p50 {statistics.median(timings):.1f} us, "
+        f"p99 {percentile(timings, 0.99):.1f} us, max {max(timings):.1f} us"
+    )
+
+    t0 = time.perf_counter()
+    index.add_book({"id": args.titles + 1, "title": "freshly catalogued", "author": "new author"})
+    print(f"incremental insert: {(time.perf_counter() - t0) * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
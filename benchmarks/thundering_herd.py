@@ -0,0 +1,121 @@
+"""
+Thundering-herd benchmark for single-flight coalescing of identical reads.
+
+Releases N threads at once (a barrier) on the same catalog listing, search
+and late-fee lookup, for R rounds. Before each round the catalog version is
+bumped so the search cache starts cold, which is what opening time looks
+like. Runs each scenario with single-flight off and on and reports how many
+SQLite queries actually ran and the per-caller latency p50/p99/max.
+
+    python benchmarks/thundering_herd.py --callers 100 --rounds 5 --books 5000
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import database  # noqa: E402
+from services import library_service  # noqa: E402
+from services.single_flight import single_flight  # noqa: E402
+
+PATRON = "123456"
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def load(books: int) -> int:
+    conn = database.get_db_connection()
+    conn.executemany(
+        "INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, 5, 5)",
+        ((f"title {i} {'gatsby' if i % 50 == 0 else 'novel'}", f"author {i % 700}", f"{9780000000000 + i}")
+         for i in range(books)),
+    )
+    conn.commit()
+    conn.close()
+    now = datetime.now()
+    database.insert_borrow_record(PATRON, 1, now - timedelta(days=30), now - timedelta(days=16))
+    return 1
+
+
+def counting(name: str, fn, counts):
+    def wrapper(*args):
+        counts[name] += 1
+        return fn(*args)
+    return wrapper
+
+
+def herd(callers: int, rounds: int, call) -> list:
+    latencies = []
+    lock = threading.Lock()
+    for _ in range(rounds):
+        # any write to books moves the catalog version: caches go cold
+        database.update_book_availability(2, 0)
+        barrier = threading.Barrier(callers)
+
+        def caller():
+            barrier.wait()
+            t0 = time.perf_counter()
+            call()
+            elapsed = time.perf_counter() - t0
+            with lock:
+                latencies.append(elapsed * 1e3)
+
+        threads = [threading.Thread(target=caller) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--callers", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--books", type=int, default=5_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE = str(Path(tmp) / "library.db")
+        database.init_database()
+        book_id = load(args.books)
+
+        counts = {"get_all_books": 0, "search_books": 0, "get_active_borrow_record": 0}
+        for name in counts:
+            setattr(library_service, name, counting(name, getattr(library_service, name), counts))
+
+        scenarios = [
+            ("catalog", "get_all_books", library_service.get_catalog_books),
+            ("search", "search_books", lambda: library_service.search_books_in_catalog("gatsby", "title")),
+            ("late fee", "get_active_borrow_record",
+             lambda: library_service.calculate_late_fee_for_book(PATRON, book_id)),
+        ]
+        print(f"{args.callers} callers x {args.rounds} rounds, {args.books:,} books")
+        print(f"{'call':<9} {'single-flight':>13} {'queries':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for label, counted, call in scenarios:
+            for enabled in (False, True):
+                single_flight.enabled = enabled
+                counts[counted] = 0
+                latencies = herd(args.callers, args.rounds, call)
+                print(
+                    f"{label:<9} {'on' if enabled else 'off':>13} {counts[counted]:>8,} "
+                    f"{statistics.median(latencies):>8.2f} {percentile(latencies, 0.99):>8.2f} "
+                    f"{max(latencies):>8.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
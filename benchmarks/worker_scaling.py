@@ -0,0 +1,106 @@
+"""
+Load test: requests/sec against gunicorn as the worker count grows.
+
+Starts `gunicorn -c gunicorn.conf.py wsgi:app` once per worker count against a
+scratch database, hammers a path from a pool of client threads and prints
+throughput. Run on a multi-core box:
+
+    python benchmarks/worker_scaling.py --workers 1 2 4 8 --path /catalog
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import List
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _wait_until_up(url: str, deadline: float) -> None:
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.1)
+    raise RuntimeError(f"server did not come up at {url}")
+
+
+def _hammer(url: str, duration: float, clients: int) -> int:
+    """Issue requests from `clients` threads for `duration` seconds; return completed count."""
+    counts: List[int] = [0] * clients
+    stop_at = time.monotonic() + duration
+
+    def worker(slot: int) -> None:
+        while time.monotonic() < stop_at:
+            try:
+                urllib.request.urlopen(url, timeout=5).read()
+                counts[slot] += 1
+            except (urllib.error.URLError, ConnectionError):
+                pass
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts)
+
+
+def run(worker_counts: List[int], path: str, duration: float, clients: int, port: int) -> None:
+    workdir = Path(tempfile.mkdtemp(prefix="library-bench-"))
+    try:
+        # gunicorn runs from the scratch dir, so library.db is created (and seeded
+        # by the on_starting hook) there rather than in the repo
+        env = dict(os.environ, PYTHONPATH=str(ROOT), SAMPLE_DATA="1")
+        print(f"{'workers':>8} {'requests':>10} {'req/s':>10}")
+        for count in worker_counts:
+            proc = subprocess.Popen(
+                [
+                    sys.executable, "-m", "gunicorn",
+                    "-c", str(ROOT / "gunicorn.conf.py"),
+                    "--workers", str(count),
+                    "--bind", f"127.0.0.1:{port}",
+                    "--access-logfile", os.devnull,
+                    "wsgi:app",
+                ],
+                cwd=workdir,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            try:
+                url = f"http://127.0.0.1:{port}{path}"
+                _wait_until_up(url, time.monotonic() + 15)
+                done = _hammer(url, duration, clients)
+                print(f"{count:>8} {done:>10} {done / duration:>10.1f}")
+            finally:
+                proc.terminate()
+                proc.wait(timeout=10)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--path", default="/catalog")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--port", type=int, default=5055)
+    args = parser.parse_args()
+    run(sorted(set(args.workers)), args.path, args.duration, args.clients, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""
+Maintenance commands for the Library Management System, run through the
+Flask CLI:
+
+    flask --app app shards info
+    flask --app app shards rebalance --to 8
+    flask --app app archive run --older-than-days 365
+    flask --app app reports notices notices.jsonl
+    flask --app app holds expire
+    flask --app app maintenance run analyze vacuum
+    flask --app app backup create
+    flask --app app inventory reconcile --dry-run
+    flask --app app inventory add-branch EAST "East Branch"
+    flask --app app popularity rebuild
+    flask --app app recommendations build
+"""
+
+import random
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import Flask
+
+import database
+from services import backup
+from services.bulk_reports import FORMATS, generate_reports
+from services.copy_service import add_branch, move_copy_to_branch
+from services.hold_service import expire_holds
+from services.library_service import get_patron_status_report
+from services.maintenance import TASKS, full_vacuum, scheduler
+from services import recommendations
+from services.popularity import WINDOWS, popular_books, rebuild as rebuild_popularity
+from services.reconciliation import BATCH_SIZE, SETTLE_SECONDS, reconcile
+
+
+@click.group('shards')
+def shards_cli():
+    """Inspect and rebalance the loan history shards."""
+
+
+@shards_cli.command('info')
+def shards_info():
+    """Show how many loans each shard of the current layout holds."""
+    paths = database.shard_paths()
+    counts = database.fan_out_query("SELECT COUNT(*) AS loans FROM borrow_records")
+    for path, row in zip(paths, counts):
+        click.echo(f'{path}: {row["loans"]:,} loans')
+
+
+@shards_cli.command('rebalance')
+@click.option('--from', 'old_count', type=int, default=None,
+              help='Shard count the loans are stored with now (default: LOAN_SHARDS).')
+@click.option('--to', 'new_count', type=int, required=True, help='Shard count to move the loans to.')
+@click.option('--batch-size', type=int, default=5000, show_default=True)
+def shards_rebalance(old_count, new_count, batch_size):
+    """
+    Move loans into a new shard layout. Stop the app first, and start it again
+    with LOAN_SHARDS set to the new count afterwards.
+    """
+    old_count = old_count or database.SHARD_COUNT
+    if old_count < 1 or new_count < 1:
+        raise click.BadParameter('shard counts must be positive')
+    started = time.perf_counter()
+
+    def progress(done):
+        click.echo(f'  {done:,} loans scanned', err=True)
+
+    result = database.rebalance_shards(old_count, new_count, batch_size, progress)
+    elapsed = time.perf_counter() - started
+    click.echo(
+        f'Moved {result["moved"]:,} loans, kept {result["kept"]:,} in place; moved {result["archived_moved"]:,} '
+        f'archived loans, kept {result["archived_kept"]:,} ({old_count} -> {new_count} shards, {elapsed:.1f}s).'
+    )
+
+
+@click.group('archive')
+def archive_cli():
+    """Move long-returned loans out of the hot borrow_records table."""
+
+
+def _time_status_reports(patron_ids):
+    """Average milliseconds to build the (hot-only) status report of each patron."""
+    if not patron_ids:
+        return 0.0
+    for patron_id in patron_ids:
+        get_patron_status_report(patron_id)  # warm the page cache so both runs compare fairly
+    started = time.perf_counter()
+    for patron_id in patron_ids:
+        get_patron_status_report(patron_id)
+    return (time.perf_counter() - started) * 1000 / len(patron_ids)
+
+
+@archive_cli.command('run')
+@click.option('--older-than-days', type=int, default=365, show_default=True,
+              help='Archive loans returned at least this many days ago.')
+@click.option('--batch-size', type=int, default=5000, show_default=True)
+@click.option('--sample', type=int, default=200, show_default=True,
+              help='Patrons whose status report is timed before and after.')
+@click.option('--vacuum', is_flag=True, help='Rewrite shard files afterwards to return freed space.')
+def archive_run(older_than_days, batch_size, sample, vacuum):
+    """Archive old returned loans and report how much the hot table shrank."""
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    patrons = [row['patron_id'] for row in database.fan_out_query(
+        'SELECT DISTINCT patron_id FROM borrow_records WHERE return_date < ?', (cutoff.isoformat(),)
+    )]
+    patrons = random.sample(patrons, min(sample, len(patrons)))
+
+    before = database.get_loan_table_stats()
+    before_ms = _time_status_reports(patrons)
+    archived = database.archive_loans(cutoff, batch_size)
+    after = database.get_loan_table_stats(vacuum=vacuum)
+    after_ms = _time_status_reports(patrons)
+
+    def reduction(old, new):
+        return f'{(old - new) / old:.0%}' if old else '0%'
+
+    click.echo(f'Archived {archived:,} loans returned before {cutoff:%Y-%m-%d}.')
+    click.echo(
+        f'Hot loans: {before["rows"]:,} -> {after["rows"]:,} rows, '
+        f'{before["bytes"] / 1e6:.1f} -> {after["bytes"] / 1e6:.1f} MB '
+        f'(reduced {reduction(before["bytes"], after["bytes"])}).'
+    )
+    click.echo(
+        f'Status report for {len(patrons)} affected patrons: {before_ms:.2f} -> {after_ms:.2f} ms '
+        f'(reduced {reduction(before_ms, after_ms)}).'
+    )
+
+
+@click.group('reports')
+def reports_cli():
+    """Bulk patron reports."""
+
+
+@reports_cli.command('notices')
+@click.argument('output')
+@click.option('--format', 'output_format', type=click.Choice(FORMATS), default='jsonl', show_default=True,
+              help='One JSONL file, or a directory of <patron_id>.txt notices.')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: CPU count).')
+@click.option('--chunk-size', type=int, default=500, show_default=True, help='Patrons per worker task.')
+@click.option('--all-patrons', is_flag=True, help='Include patrons with no open loans.')
+def reports_notices(output, output_format, workers, chunk_size, all_patrons):
+    """Write the weekly status report of every patron with books out to OUTPUT."""
+    last_report = [0.0]
+
+    def progress(done, rate):
+        if time.perf_counter() - last_report[0] >= 1.0:
+            last_report[0] = time.perf_counter()
+            click.echo(f'  {done:,} patrons ({rate:,.0f}/s)', err=True)
+
+    result = generate_reports(
+        output, output_format, workers, chunk_size, active_only=not all_patrons, progress=progress
+    )
+    click.echo(
+        f'Wrote {result["patrons"]:,} patron reports ({result["loans"]:,} loans) to {output} '
+        f'in {result["seconds"]:.1f}s, {result["patrons_per_second"]:,.0f} patrons/s.'
+    )
+
+
+@click.group('holds')
+def holds_cli():
+    """Book hold queue upkeep."""
+
+
+@holds_cli.command('expire')
+def holds_expire():
+    """Expire ready holds past their pickup window and pass each copy to the next in line."""
+    expired = expire_holds()
+    click.echo(f'Expired {expired:,} uncollected holds.')
+
+
+@click.group('maintenance')
+def maintenance_cli():
+    """Database checkpoints, statistics and vacuuming."""
+
+
+@maintenance_cli.command('run')
+@click.argument('tasks', nargs=-1, type=click.Choice(TASKS))
+@click.option('--full', is_flag=True,
+              help='VACUUM every file in full first (blocks writers), switching it to incremental vacuum.')
+def maintenance_run(tasks, full):
+    """Run maintenance TASKS now (default: all of them), whatever the traffic."""
+    if full:
+        click.echo(f'Full vacuum reclaimed {full_vacuum():,} bytes.')
+    for task in tasks or TASKS:
+        result = scheduler.run_task(task, yield_to_traffic=False)
+        click.echo(
+            f'{task}: {result["files"]} file(s) in {result["seconds"]:.3f}s, '
+            f'{result["reclaimed_bytes"]:,} bytes reclaimed.'
+        )
+
+
+@maintenance_cli.command('status')
+def maintenance_status():
+    """Show when each maintenance task last ran."""
+    for row in database.get_maintenance_state():
+        if row['last_finished'] is None:
+            click.echo(f'{row["task"]}: never run')
+        else:
+            click.echo(
+                f'{row["task"]}: finished {row["last_finished"]}, took {row["last_seconds"]:.3f}s, '
+                f'reclaimed {row["last_reclaimed"]:,} bytes'
+            )
+
+
+@click.group('backup')
+def backup_cli():
+    """Online snapshots of the database files, taken while the app keeps serving."""
+
+
+@backup_cli.command('create')
+@click.option('--step-pages', type=int, default=None, help='Pages copied per step (default: BACKUP_STEP_PAGES).')
+@click.option('--step-sleep', type=float, default=None,
+              help='Seconds between steps (default: BACKUP_STEP_SLEEP).')
+def backup_create(step_pages, step_sleep):
+    """Snapshot every database file into BACKUP_DIR and prune old snapshots."""
+    manifest = backup.create_snapshot(pages=step_pages, sleep=step_sleep)
+    copied = [entry for entry in manifest['files'] if not entry['linked']]
+    click.echo(
+        f'Snapshot {manifest["name"]}: copied {len(copied)} file(s), '
+        f'{sum(entry["bytes"] for entry in copied) / 1e6:.1f} MB, '
+        f'linked {len(manifest["files"]) - len(copied)} unchanged, in {manifest["seconds"]:.1f}s.'
+    )
+
+
+@backup_cli.command('list')
+def backup_list():
+    """List the snapshots in BACKUP_DIR, oldest first."""
+    for manifest in backup.list_snapshots():
+        size = sum(entry['bytes'] for entry in manifest['files'])
+        click.echo(f'{manifest["name"]}  {len(manifest["files"])} file(s)  {size / 1e6:.1f} MB')
+
+
+@backup_cli.command('verify')
+@click.argument('name')
+def backup_verify(name):
+    """Check snapshot NAME's checksums and run SQLite's quick_check on each file."""
+    try:
+        problems = backup.verify_snapshot(name)
+    except backup.BackupError as e:
+        raise click.ClickException(str(e))
+    if problems:
+        raise click.ClickException('; '.join(problems))
+    click.echo(f'Snapshot {name} is intact.')
+
+
+@backup_cli.command('restore')
+@click.argument('name')
+@click.confirmation_option(prompt='Replace the live database with this snapshot?')
+def backup_restore(name):
+    """Verify snapshot NAME, then copy it back over the live database files."""
+    try:
+        restored = backup.restore_snapshot(name)
+    except backup.BackupError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'Restored {len(restored)} file(s) from {name}.')
+    for path in backup.unrestored_files(name):
+        click.echo(f'Warning: {path} is not in the snapshot and was left as it is.')
+
+
+@click.group('inventory')
+def inventory_cli():
+    """Catalog inventory checks."""
+
+
+@inventory_cli.command('reconcile')
+@click.option('--dry-run', is_flag=True, help='Report drift without repairing it.')
+@click.option('--incremental', is_flag=True,
+              help='Only check books with loan or hold activity since the last repairing run.')
+@click.option('--since', type=click.DateTime(), default=None,
+              help='Only check books with loan or hold activity since this time.')
+@click.option('--batch-size', type=int, default=BATCH_SIZE, show_default=True, help='Books repaired per transaction.')
+@click.option('--settle', type=float, default=SETTLE_SECONDS, show_default=True,
+              help='Seconds to wait before confirming drift and repairing it.')
+def inventory_reconcile(dry_run, incremental, since, batch_size, settle):
+    """Compare available copies with active loans and ready holds, and repair any drift."""
+    report = reconcile(dry_run=dry_run, incremental=incremental, since=since,
+                       batch_size=batch_size, settle=settle)
+    for row in report['drifted']:
+        note = '  OVERLENT' if row['overlent'] else ''
+        click.echo(
+            f'  book {row["book_id"]} ({row["title"]}): available {row["stored"]} -> {row["expected"]} '
+            f'({row["total_copies"]} copies, {row["active_loans"]} on loan, {row["ready_holds"]} on hold){note}'
+        )
+    scope = f'since {report["since"]}' if report['since'] else 'in the catalog'
+    summary = f'Checked {report["checked"]:,} books {scope}: {len(report["drifted"]):,} drifted'
+    if not dry_run:
+        summary += f', {report["repaired"]:,} repaired, {report["skipped"]:,} skipped'
+    click.echo(f'{summary} ({report["seconds"]:.2f}s).')
+
+
+@inventory_cli.command('branches')
+def inventory_branches():
+    """List branches with their copy counts."""
+    for branch in database.get_branch_totals():
+        click.echo(f'{branch["code"]:<10} {branch["name"]:<30} '
+                   f'{branch["available_copies"]:,} of {branch["total_copies"]:,} copies available')
+
+
+@inventory_cli.command('add-branch')
+@click.argument('code')
+@click.argument('name')
+def inventory_add_branch(code, name):
+    """Open a branch that copies can be transferred to, lent from and returned at."""
+    success, message = add_branch(code, name)
+    if not success:
+        raise click.ClickException(message)
+    click.echo(message)
+
+
+@inventory_cli.command('transfer')
+@click.argument('branch')
+@click.argument('barcodes', nargs=-1, required=True)
+def inventory_transfer(branch, barcodes):
+    """Move copies (by barcode) that aren't out on loan to BRANCH."""
+    for barcode in barcodes:
+        success, message = move_copy_to_branch(barcode, branch)
+        click.echo(message if success else f'{barcode}: {message}')
+
+
+@click.group('popularity')
+def popularity_cli():
+    """Most-borrowed counters."""
+
+
+@popularity_cli.command('rebuild')
+def popularity_rebuild():
+    """Recount the popularity counters from every loan, including archived ones."""
+    started = time.perf_counter()
+    result = rebuild_popularity()
+    click.echo(f'Counted {result["loans"]:,} loans of {result["books"]:,} books '
+               f'({result["daily_rows"]:,} daily buckets) in {time.perf_counter() - started:.2f}s.')
+
+
+@popularity_cli.command('top')
+@click.option('--window', type=click.Choice(list(WINDOWS)), default='week', show_default=True)
+@click.option('--limit', type=int, default=10, show_default=True)
+def popularity_top(window, limit):
+    """Show the most borrowed books in a window."""
+    for rank, book in enumerate(popular_books(window, limit), 1):
+        click.echo(f'{rank:>3}. {book["borrows"]:>6,}  {book["title"]} ({book["author"]})')
+
+
+@click.group('recommendations')
+def recommendations_cli():
+    """Co-borrow ("also borrowed") recommendations."""
+
+
+@recommendations_cli.command('build')
+@click.option('--output', type=click.Path(dir_okay=False), default=None,
+              help='Where to write the index (default: RELATED_INDEX_PATH, or beside the database).')
+@click.option('--neighbours', type=int, default=recommendations.NEIGHBOURS, show_default=True,
+              help='Related books kept per book.')
+@click.option('--min-shared', type=int, default=recommendations.MIN_SHARED, show_default=True,
+              help='Patrons two books must have in common to count as related.')
+def recommendations_build(output, neighbours, min_shared):
+    """Rebuild the related-books index from every patron's loans, including archived ones."""
+    if neighbours < 1 or min_shared < 1:
+        raise click.BadParameter('--neighbours and --min-shared must be positive')
+    result = recommendations.build(output, neighbours=neighbours, min_shared=min_shared)
+    click.echo(f'Related {result["books"]:,} books through {result["related_pairs"]:,} co-borrowed pairs; '
+               f'wrote {result["neighbours"]:,} neighbours ({result["bytes"]:,} bytes, '
+               f'{result["spilled_runs"]} spilled runs) in {result["seconds"]:.2f}s.')
+
+
+@recommendations_cli.command('show')
+@click.argument('book_id', type=int)
+@click.option('--limit', type=int, default=10, show_default=True)
+def recommendations_show(book_id, limit):
+    """Show the books most often borrowed alongside a book."""
+    for rank, book in enumerate(recommendations.related_books(book_id, limit), 1):
+        click.echo(f'{rank:>3}. {book["score"]:.3f} ({book["shared"]:,} patrons)  {book["title"]} ({book["author"]})')
+
+
+def register_commands(app: Flask) -> None:
+    """Add the maintenance command groups to the app's CLI."""
+    app.cli.add_command(shards_cli)
+    app.cli.add_command(archive_cli)
+    app.cli.add_command(reports_cli)
+    app.cli.add_command(holds_cli)
+    app.cli.add_command(maintenance_cli)
+    app.cli.add_command(backup_cli)
+    app.cli.add_command(inventory_cli)
+    app.cli.add_command(popularity_cli)
+    app.cli.add_command(recommendations_cli)
@@ -14,6 +14,8 @@ if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
 import database
+from services.events import event_bus
+from services.maintenance import scheduler
 
 
 @pytest.fixture(autouse=True)
@@ -23,6 +25,9 @@ def isolated_database(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterat
     monkeypatch.setattr(database, "DATABASE", str(db_path))
     database.init_database()
     yield
+    # write events queued by this test into its own database
+    event_bus.flush()
+    scheduler.stop()
     try:
         db_path.unlink()
     except FileNotFoundError:
@@ -3,25 +3,652 @@ Database module for Library Management System
 Handles all database operations and connections
 """
 
+import contextvars
+import functools
+import json
+import os
 import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import groupby
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from isbn import isbn_key
 
 # Database configuration
 DATABASE = 'library.db'
 
+# Seconds a connection waits for another worker process to release the write lock
+BUSY_TIMEOUT = 5.0
+
+# Extra attempts for a write that still finds the database locked after BUSY_TIMEOUT
+WRITE_RETRIES = 3
+RETRY_BACKOFF = 0.05
+
+# Browsing, search and report queries read through get_read_connection(). With
+# no READ_REPLICA they open DATABASE read-only; with one they read a snapshot of
+# DATABASE taken with the backup API, refreshed once it is REPLICA_MAX_STALENESS
+# seconds old. Writes, and the reads that guard them, always use the primary.
+READ_REPLICA: Optional[str] = None
+REPLICA_MAX_STALENESS = 5.0
+
+_replica_lock = threading.Lock()
+
+# Loans (borrow_records) are split across SHARD_COUNT SQLite files by a hash of
+# patron_id; with 1 they stay in DATABASE. Every worker must use the same count,
+# and changing it needs a rebalance_shards() run (flask shards rebalance).
+SHARD_COUNT = 1
+
+# Days of daily borrow counts kept for popularity windows (the longest window)
+POPULARITY_DAYS = 30
+
+# The branch copies start at when a book is added (and that every copy was at
+# before branches existed)
+MAIN_BRANCH_ID = 1
+
+_fan_out_pool: Optional[ThreadPoolExecutor] = None
+_fan_out_pid: Optional[int] = None
+_fan_out_lock = threading.Lock()
+
+# Called with (book_id, available_copies) after each committed availability
+# change made by this process; see add_availability_listener()
+_availability_listeners: List[Callable[[int, int], None]] = []
+
+# Reads made while a query deadline is set (query_deadline(), or per request
+# by the app) are aborted once it passes: every connection opened under one
+# checks the clock every PROGRESS_STEPS SQLite VM instructions. Writes always
+# run to completion.
+PROGRESS_STEPS = 1000
+
+_query_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    'query_deadline', default=None
+)
+_timeout_counts: Dict[str, int] = {}
+_timeout_lock = threading.Lock()
+
+# File mtimes come from a coarse clock, so a write only counts as older than a
+# snapshot if it happened at least this long before the snapshot started
+_MTIME_SLACK_NS = 1_000_000_000
+
+class QueryTimeoutError(Exception):
+    """A read was aborted because the current query deadline passed."""
+
+    def __init__(self, helper: str):
+        super().__init__(f'{helper} did not finish before the query deadline')
+        self.helper = helper
+
+def set_query_deadline(seconds: Optional[float]) -> contextvars.Token:
+    """Abort reads in this context after seconds (None: no deadline); returns a token for reset."""
+    return _query_deadline.set(None if seconds is None else time.monotonic() + seconds)
+
+def reset_query_deadline(token: contextvars.Token) -> None:
+    """Restore the deadline that was in effect before set_query_deadline."""
+    _query_deadline.reset(token)
+
+@contextmanager
+def query_deadline(seconds: Optional[float]) -> Iterator[None]:
+    """Abort reads made inside the block once seconds have passed."""
+    token = set_query_deadline(seconds)
+    try:
+        yield
+    finally:
+        reset_query_deadline(token)
+
+def _apply_deadline(conn: sqlite3.Connection) -> sqlite3.Connection:
+    deadline = _query_deadline.get()
+    if deadline is not None:
+        # a true return value makes SQLite abort the running statement ("interrupted")
+        conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_STEPS)
+    return conn
+
+def _deadline_bound(helper: Callable) -> Callable:
+    """Turn a statement aborted by the query deadline into QueryTimeoutError, counted per helper."""
+    @functools.wraps(helper)
+    def wrapper(*args, **kwargs):
+        try:
+            return helper(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if _query_deadline.get() is None or 'interrupted' not in str(e):
+                raise
+            with _timeout_lock:
+                _timeout_counts[helper.__name__] = _timeout_counts.get(helper.__name__, 0) + 1
+            raise QueryTimeoutError(helper.__name__) from e
+    return wrapper
+
+def get_query_timeout_counts() -> Dict[str, int]:
+    """How many reads each helper had aborted by a query deadline in this process."""
+    with _timeout_lock:
+        return dict(_timeout_counts)
+
 def get_db_connection():
     """Get a database connection."""
-    conn = sqlite3.connect(DATABASE)
+    conn = sqlite3.connect(DATABASE, timeout=BUSY_TIMEOUT)
     conn.row_factory = sqlite3.Row  # This enables column access by name
+    return _apply_deadline(conn)
+
+def get_read_connection():
+    """Get a read-only connection for queries that tolerate REPLICA_MAX_STALENESS."""
+    path = DATABASE
+    if READ_REPLICA:
+        if _replica_age_ns() > REPLICA_MAX_STALENESS * 1e9:
+            with _replica_lock:
+                if _replica_age_ns() > REPLICA_MAX_STALENESS * 1e9:
+                    refresh_read_replica()
+        path = READ_REPLICA
+    conn = sqlite3.connect(f'{Path(path).resolve().as_uri()}?mode=ro', uri=True, timeout=BUSY_TIMEOUT)
+    conn.row_factory = sqlite3.Row
+    return _apply_deadline(conn)
+
+def _mtime_ns(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def _replica_age_ns() -> float:
+    # the replica's mtime is set to when its snapshot was taken
+    taken = _mtime_ns(READ_REPLICA)
+    return float('inf') if taken is None else time.time_ns() - taken
+
+def refresh_read_replica() -> bool:
+    """
+    Snapshot DATABASE into READ_REPLICA with the SQLite backup API.
+
+    The copy is written beside the replica and renamed over it, so readers
+    never see a half-written file. If nothing was written to the primary since
+    the last snapshot, the existing replica is just marked fresh.
+    """
+    replica = READ_REPLICA
+    if not replica:
+        return False
+    started = time.time_ns()
+    taken = _mtime_ns(replica)
+    changed = [_mtime_ns(DATABASE), _mtime_ns(DATABASE + '-wal')]
+    if taken is not None and all(mtime is None or mtime < taken - _MTIME_SLACK_NS for mtime in changed):
+        os.utime(replica, ns=(started, started))
+        return True
+
+    temporary = f'{replica}.{os.getpid()}.{threading.get_ident()}.tmp'
+    source = get_db_connection()
+    source.set_progress_handler(None, 0)
+    target = sqlite3.connect(temporary)
+    try:
+        source.backup(target)
+        # a rollback-journal copy can be read with mode=ro without -wal/-shm files
+        target.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        target.close()
+        source.close()
+    # stamp the copy with when it was started, so writes made during the copy
+    # still count as newer than the snapshot
+    os.utime(temporary, ns=(started, started))
+    try:
+        os.replace(temporary, replica)
+    except OSError:
+        # e.g. Windows refuses to replace a file readers have open; retry next time
+        os.remove(temporary)
+        return False
+    return True
+
+def _file_uri(path: str, read_only: bool) -> str:
+    uri = Path(path).resolve().as_uri()
+    return f'{uri}?mode=ro' if read_only else uri
+
+def shard_index(patron_id: str, count: Optional[int] = None) -> int:
+    """Which of count (default SHARD_COUNT) loan shards holds patron_id's loans."""
+    # crc32 rather than hash(): it has to agree across processes and restarts
+    return zlib.crc32(patron_id.encode('utf-8')) % (count or SHARD_COUNT)
+
+def shard_paths(count: Optional[int] = None) -> List[str]:
+    """Loan shard files for a layout of count (default SHARD_COUNT) shards."""
+    count = count or SHARD_COUNT
+    if count == 1:
+        return [DATABASE]
+    base, extension = os.path.splitext(DATABASE)
+    # the count is part of the name so layouts never share files mid-rebalance
+    return [f'{base}.shard{i}-of-{count}{extension or ".db"}' for i in range(count)]
+
+def _connect_shard(path: str, read_only: bool = False, with_books: bool = True) -> sqlite3.Connection:
+    if path == DATABASE:
+        return get_read_connection() if read_only else get_db_connection()
+    conn = _apply_deadline(sqlite3.connect(_file_uri(path, read_only), uri=True, timeout=BUSY_TIMEOUT))
+    conn.row_factory = sqlite3.Row
+    if with_books:
+        # books lives in the primary; attached, unqualified "books" in joins resolves there
+        conn.execute('ATTACH DATABASE ? AS catalog', (_file_uri(DATABASE, read_only=True),))
     return conn
 
-def init_database():
-    """Initialize the database with required tables."""
-    conn = get_db_connection()
-    
-    # Create books table
-    conn.execute('''
+def get_shard_connection(patron_id: str, read_only: bool = False, with_books: bool = True) -> sqlite3.Connection:
+    """
+    Get a connection to the shard holding patron_id's loans.
+
+    The primary is attached so queries can join books; queries that only
+    touch borrow_records pass with_books=False to skip that extra open.
+    """
+    return _connect_shard(shard_paths()[shard_index(patron_id)], read_only, with_books)
+
+def fan_out_query(query: str, params: Tuple = (), with_books: bool = False) -> List[Dict]:
+    """
+    Run a read-only query against every loan shard and concatenate the rows.
+
+    Shards are queried in parallel on a thread pool (sqlite3 releases the GIL
+    while a statement runs); rows come back grouped in shard order. Pass
+    with_books=True if the query joins books.
+    """
+    # pool threads don't share this thread's context, so hand the deadline over
+    deadline = _query_deadline.get()
+
+    def run(path: str) -> List[Dict]:
+        token = _query_deadline.set(deadline)
+        conn = _connect_shard(path, read_only=True, with_books=with_books)
+        try:
+            return [dict(row) for row in conn.execute(query, params)]
+        finally:
+            conn.close()
+            _query_deadline.reset(token)
+
+    paths = shard_paths()
+    if len(paths) == 1:
+        return run(paths[0])
+    rows: List[Dict] = []
+    for shard_rows in _get_fan_out_pool().map(run, paths):
+        rows.extend(shard_rows)
+    return rows
+
+def _get_fan_out_pool() -> ThreadPoolExecutor:
+    global _fan_out_pool, _fan_out_pid
+    with _fan_out_lock:
+        # a forked worker doesn't inherit the parent's pool threads
+        if _fan_out_pool is None or _fan_out_pid != os.getpid():
+            _fan_out_pool = ThreadPoolExecutor(max_workers=min(32, SHARD_COUNT), thread_name_prefix='shard')
+            _fan_out_pid = os.getpid()
+        return _fan_out_pool
+
+def init_shards(count: int) -> None:
+    """Create or migrate the loan shard files for a layout of count shards."""
+    for path in shard_paths(count):
+        if path != DATABASE:
+            conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+            conn.row_factory = sqlite3.Row
+            _apply_migrations(conn, _SHARD_MIGRATIONS)
+
+def rebalance_shards(
+    old_count: int,
+    new_count: int,
+    batch_size: int = 5000,
+    progress: Optional[Callable[[int], None]] = None,
+) -> Dict[str, int]:
+    """
+    Move every loan from the old_count shard layout into the new_count layout.
+
+    Each source shard is scanned once in id order. A batch's rows are copied
+    into their new shard and deleted from the source in one transaction over
+    both files (the target is ATTACHed), so each loan is in exactly one place
+    at every commit. Archived loans then follow into the new shards' archives
+    (see _rebalance_archives). Under WAL that transaction is atomic per file
+    rather than across files, so run this with the app stopped. Returns
+    moved/kept counts for loans and for archived loans.
+    """
+    init_shards(new_count)
+    targets = shard_paths(new_count)
+    moved = kept = 0
+    columns = 'patron_id, book_id, borrow_date, due_date, return_date, copy_id, branch_id, return_branch_id'
+    for source in shard_paths(old_count):
+        conn = sqlite3.connect(source, timeout=BUSY_TIMEOUT, isolation_level=None)
+        attached: "OrderedDict[int, str]" = OrderedDict()
+        last_id = 0
+        try:
+            while True:
+                rows = conn.execute(
+                    'SELECT id, patron_id FROM borrow_records WHERE id > ? ORDER BY id LIMIT ?',
+                    (last_id, batch_size),
+                ).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                by_target: Dict[int, List[int]] = {}
+                for record_id, patron_id in rows:
+                    target = shard_index(patron_id, new_count)
+                    if targets[target] == source:
+                        kept += 1
+                    else:
+                        by_target.setdefault(target, []).append(record_id)
+                for target, ids in by_target.items():
+                    alias = _attach_target(conn, attached, target, targets[target])
+                    conn.execute('CREATE TEMP TABLE IF NOT EXISTS moving (id INTEGER PRIMARY KEY)')
+                    conn.execute('BEGIN IMMEDIATE')
+                    conn.execute('DELETE FROM temp.moving')
+                    conn.executemany('INSERT INTO temp.moving (id) VALUES (?)', [(i,) for i in ids])
+                    conn.execute(
+                        f'INSERT INTO {alias}.borrow_records ({columns}) '
+                        f'SELECT {columns} FROM main.borrow_records WHERE id IN (SELECT id FROM temp.moving)'
+                    )
+                    conn.execute('DELETE FROM main.borrow_records WHERE id IN (SELECT id FROM temp.moving)')
+                    conn.execute('COMMIT')
+                    moved += len(ids)
+                if progress:
+                    progress(moved + kept)
+        finally:
+            conn.close()
+    archived = _rebalance_archives(old_count, new_count, batch_size)
+    return {'moved': moved, 'kept': kept, 'archived_moved': archived['moved'], 'archived_kept': archived['kept']}
+
+def _rebalance_archives(old_count: int, new_count: int, batch_size: int) -> Dict[str, int]:
+    """
+    Move archived loans from the old layout's archive files into the archives
+    of their new shards.
+
+    An archived loan keeps an id from its shard's id sequence (archive_loans
+    relies on that to skip rows it already copied), so a moved row gets fresh
+    ids from its new shard's sqlite_sequence, which is advanced in the same
+    transaction that copies the batch and deletes it from the old archive.
+    """
+    targets = shard_paths(new_count)
+    moved = kept = 0
+    columns = 'patron_id, book_id, borrow_date, due_date, return_date, copy_id, branch_id, return_branch_id, archived_at'
+    for source in (archive_path(path) for path in shard_paths(old_count)):
+        if not os.path.exists(source):
+            continue
+        _apply_migrations(sqlite3.connect(source, timeout=BUSY_TIMEOUT), _ARCHIVE_MIGRATIONS)
+        conn = sqlite3.connect(source, timeout=BUSY_TIMEOUT, isolation_level=None)
+        attached: "OrderedDict[int, str]" = OrderedDict()
+        last_id = 0
+        try:
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS moving (id INTEGER PRIMARY KEY)')
+            while True:
+                rows = conn.execute(
+                    'SELECT id, patron_id FROM borrow_records_archive WHERE id > ? ORDER BY id LIMIT ?',
+                    (last_id, batch_size),
+                ).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                by_target: Dict[int, List[int]] = {}
+                for record_id, patron_id in rows:
+                    target = shard_index(patron_id, new_count)
+                    if archive_path(targets[target]) == source:
+                        kept += 1
+                    else:
+                        by_target.setdefault(target, []).append(record_id)
+                for target, ids in by_target.items():
+                    if target not in attached:
+                        _apply_migrations(sqlite3.connect(archive_path(targets[target]), timeout=BUSY_TIMEOUT),
+                                          _ARCHIVE_MIGRATIONS)
+                    # the shard and its archive are attached together, as shardN and shardN_archive
+                    alias = _attach_target(conn, attached, target, targets[target], with_archive=True)
+                    conn.execute('BEGIN IMMEDIATE')
+                    conn.execute('DELETE FROM temp.moving')
+                    conn.executemany('INSERT INTO temp.moving (id) VALUES (?)', [(i,) for i in ids])
+                    sequence = conn.execute(
+                        f"SELECT seq FROM {alias}.sqlite_sequence WHERE name = 'borrow_records'"
+                    ).fetchone()
+                    base = sequence[0] if sequence else 0
+                    conn.execute(
+                        f'INSERT INTO {alias}_archive.borrow_records_archive (id, {columns}) '
+                        f'SELECT ? + ROW_NUMBER() OVER (ORDER BY id), {columns} FROM main.borrow_records_archive '
+                        f'WHERE id IN (SELECT id FROM temp.moving)',
+                        (base,),
+                    )
+                    if sequence:
+                        conn.execute(f"UPDATE {alias}.sqlite_sequence SET seq = ? WHERE name = 'borrow_records'",
+                                     (base + len(ids),))
+                    else:
+                        conn.execute(f"INSERT INTO {alias}.sqlite_sequence (name, seq) VALUES ('borrow_records', ?)",
+                                     (len(ids),))
+                    conn.execute('DELETE FROM main.borrow_records_archive WHERE id IN (SELECT id FROM temp.moving)')
+                    conn.execute('COMMIT')
+                    moved += len(ids)
+        finally:
+            conn.close()
+    return {'moved': moved, 'kept': kept}
+
+def archive_path(shard_path: str) -> str:
+    """Archive file for the loan shard at shard_path (library.db -> library.archive.db)."""
+    base, extension = os.path.splitext(shard_path)
+    return f'{base}.archive{extension or ".db"}'
+
+def archive_loans(
+    cutoff: datetime,
+    batch_size: int = 5000,
+    progress: Optional[Callable[[int], None]] = None,
+) -> int:
+    """
+    Move loans returned before cutoff out of borrow_records into the archives.
+
+    Each shard is scanned once in id order. A batch is first copied into the
+    shard's archive (INSERT OR IGNORE on the original id) and committed, then
+    deleted from the hot table in a transaction that also bumps the catalog
+    version, so cached status pages drop them. An interrupted run loses
+    nothing and simply finishes the batch when run again. Returns the number
+    of loans archived.
+    """
+    archived = 0
+    cutoff_text = cutoff.isoformat()
+    columns = 'id, patron_id, book_id, borrow_date, due_date, return_date, copy_id, branch_id, return_branch_id'
+    for path in shard_paths():
+        target = archive_path(path)
+        _apply_migrations(sqlite3.connect(target, timeout=BUSY_TIMEOUT), _ARCHIVE_MIGRATIONS)
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        try:
+            conn.execute('ATTACH DATABASE ? AS archive', (target,))
+            # catalog_state lives in the primary, which a separate shard attaches
+            catalog = 'main' if path == DATABASE else 'catalog'
+            if catalog != 'main':
+                conn.execute('ATTACH DATABASE ? AS catalog', (DATABASE,))
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS archiving (id INTEGER PRIMARY KEY)')
+            last_id = 0
+            while True:
+                conn.execute('DELETE FROM temp.archiving')
+                conn.execute(
+                    '''
+                    INSERT INTO temp.archiving (id)
+                    SELECT id FROM main.borrow_records
+                    WHERE id > ? AND return_date IS NOT NULL AND return_date < ?
+                    ORDER BY id LIMIT ?
+                    ''',
+                    (last_id, cutoff_text, batch_size),
+                )
+                count, last_id = conn.execute('SELECT COUNT(*), MAX(id) FROM temp.archiving').fetchone()
+                if not count:
+                    break
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute(
+                    f'''
+                    INSERT OR IGNORE INTO archive.borrow_records_archive ({columns}, archived_at)
+                    SELECT {columns}, ? FROM main.borrow_records
+                    WHERE id IN (SELECT id FROM temp.archiving)
+                    ''',
+                    (datetime.now().isoformat(),),
+                )
+                conn.execute('COMMIT')
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('DELETE FROM main.borrow_records WHERE id IN (SELECT id FROM temp.archiving)')
+                # the loans leave the status pages' history, so cached pages must go too
+                conn.execute(f'UPDATE {catalog}.catalog_state SET version = version + 1 WHERE id = 1')
+                conn.execute('COMMIT')
+                archived += count
+                if progress:
+                    progress(archived)
+        finally:
+            conn.close()
+    return archived
+
+def get_loan_table_stats(vacuum: bool = False) -> Dict[str, int]:
+    """
+    Rows and bytes held by borrow_records and its indexes, summed over shards.
+
+    Bytes come from the dbstat table where SQLite has it; otherwise they are
+    the pages in use in each shard file. vacuum=True first rewrites each shard
+    file so space freed by archiving goes back to the filesystem.
+    """
+    rows = size = 0
+    for path in shard_paths():
+        conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+        try:
+            if vacuum:
+                conn.execute('VACUUM')
+            rows += conn.execute('SELECT COUNT(*) FROM borrow_records').fetchone()[0]
+            try:
+                size += conn.execute(
+                    '''
+                    SELECT COALESCE(SUM(pgsize), 0) FROM dbstat
+                    WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = 'borrow_records')
+                    '''
+                ).fetchone()[0]
+            except sqlite3.OperationalError:
+                page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+                pages = conn.execute('PRAGMA page_count').fetchone()[0]
+                free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                size += (pages - free) * page_size
+        finally:
+            conn.close()
+    return {'rows': rows, 'bytes': size}
+
+def _attach_target(
+    conn: sqlite3.Connection,
+    attached: "OrderedDict[int, str]",
+    target: int,
+    path: str,
+    with_archive: bool = False,
+) -> str:
+    # SQLite allows 10 attached databases by default; keep the most recent few
+    if target in attached:
+        attached.move_to_end(target)
+        return attached[target]
+    if len(attached) >= (4 if with_archive else 8):
+        _, alias = attached.popitem(last=False)
+        conn.execute(f'DETACH DATABASE {alias}')
+        if with_archive:
+            conn.execute(f'DETACH DATABASE {alias}_archive')
+    alias = f'shard{target}'
+    conn.execute(f'ATTACH DATABASE ? AS {alias}', (path,))
+    if with_archive:
+        conn.execute(f'ATTACH DATABASE ? AS {alias}_archive', (archive_path(path),))
+    attached[target] = alias
+    return alias
+
+def _is_locked_error(error: Exception) -> bool:
+    """Return True if the error means another connection holds the write lock."""
+    message = str(error).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+def _write_with_retries(
+    work: Callable[[sqlite3.Connection], object],
+    connect: Optional[Callable[[], sqlite3.Connection]] = None,
+) -> Tuple[bool, object]:
+    """
+    Run work(conn) and commit, returning (success, what work returned).
+
+    connect picks the database (default the primary, e.g. a loan shard
+    instead). Retries with exponential backoff while the database is locked by
+    another worker process; any other error fails immediately.
+    """
+    for attempt in range(WRITE_RETRIES + 1):
+        conn = (connect or get_db_connection)()
+        # a write that has started is allowed to finish; deadlines only cut reads short
+        conn.set_progress_handler(None, 0)
+        try:
+            result = work(conn)
+            conn.commit()
+            return True, result
+        except sqlite3.OperationalError as e:
+            if not _is_locked_error(e) or attempt == WRITE_RETRIES:
+                return False, None
+        except Exception:
+            return False, None
+        finally:
+            conn.close()
+        time.sleep(RETRY_BACKOFF * (2 ** attempt))
+    return False, None
+
+def _execute_write(
+    query: str,
+    params: Tuple,
+    many: bool = False,
+    connect: Optional[Callable[[], sqlite3.Connection]] = None,
+) -> bool:
+    """
+    Execute a single write statement and commit it.
+
+    With many=True, params is a sequence of parameter tuples written by one
+    executemany in a single transaction.
+    """
+    if many:
+        return _write_with_retries(lambda conn: conn.executemany(query, params), connect)[0]
+    return _write_with_retries(lambda conn: conn.execute(query, params), connect)[0]
+
+def _execute_write_returning(
+    query: str,
+    params: Tuple,
+    connect: Optional[Callable[[], sqlite3.Connection]] = None,
+) -> Optional[List[Dict]]:
+    """Execute an INSERT/UPDATE ... RETURNING and commit it; the rows, or None if it failed."""
+    ok, rows = _write_with_retries(
+        lambda conn: [dict(row) for row in conn.execute(query, params).fetchall()], connect
+    )
+    return rows if ok else None
+
+# Loan table DDL, shared by the primary (migration 1) and every loan shard file
+_BORROW_RECORDS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS borrow_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        patron_id TEXT NOT NULL,
+        book_id INTEGER NOT NULL,
+        borrow_date TEXT NOT NULL,
+        due_date TEXT NOT NULL,
+        return_date TEXT,
+        FOREIGN KEY (book_id) REFERENCES books (id)
+    )
+'''
+
+# Patron-scoped loan lookups, and active loans of one book
+_BORROW_RECORDS_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_borrow_records_patron ON borrow_records (patron_id, return_date)',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_borrow_records_active_book ON borrow_records (book_id)
+    WHERE return_date IS NULL
+    ''',
+)
+
+# Loans by when they were last touched (borrowed, or returned), for
+# reconciling only the books with loan activity since a watermark
+_BORROW_RECORDS_TOUCHED_INDEX = '''
+    CREATE INDEX IF NOT EXISTS idx_borrow_records_touched
+    ON borrow_records (COALESCE(return_date, borrow_date))
+'''
+
+# Which branch lent a loan's copy, and which branch it came back to
+_BORROW_RECORDS_BRANCH_COLUMNS = (
+    'ALTER TABLE borrow_records ADD COLUMN branch_id INTEGER',
+    'ALTER TABLE borrow_records ADD COLUMN return_branch_id INTEGER',
+)
+
+# books.branch_availability for one book: {"CODE": [available, total], ...}
+# in branch order, from its branch_inventory rows
+_BRANCH_AVAILABILITY = '''
+    SELECT json_group_object(code, json_array(available_copies, total_copies)) FROM (
+        SELECT br.code, bi.available_copies, bi.total_copies
+        FROM branch_inventory bi JOIN branches br ON br.id = bi.branch_id
+        WHERE bi.book_id = {book_id} AND bi.total_copies > 0
+        ORDER BY bi.branch_id
+    )
+'''
+
+# What one copy adds to its branch's counts: withdrawn copies aren't counted
+_COPY_TOTAL = "({row}.status != 'withdrawn')"
+_COPY_AVAILABLE = "({row}.status = 'available')"
+
+# Schema migrations, applied in order. PRAGMA user_version records how many have
+# run, so once the schema is current startup costs a single PRAGMA read.
+_MIGRATIONS: List[Tuple[str, ...]] = [
+    (
+        '''
         CREATE TABLE IF NOT EXISTS books (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             title TEXT NOT NULL,
@@ -30,24 +657,391 @@ def init_database():
             total_copies INTEGER NOT NULL,
             available_copies INTEGER NOT NULL
         )
-    ''')
-    
-    # Create borrow_records table
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS borrow_records (
+        ''',
+        _BORROW_RECORDS_TABLE,
+    ),
+    # 2: catalog version counter, bumped by triggers on every change to books
+    # (insert_book, update_book_availability, ...) so caches can key on it
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS catalog_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+        ''',
+        'INSERT OR IGNORE INTO catalog_state (id, version) VALUES (1, 0)',
+        '''
+        CREATE TRIGGER IF NOT EXISTS books_version_insert AFTER INSERT ON books
+        BEGIN
+            UPDATE catalog_state SET version = version + 1 WHERE id = 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS books_version_update AFTER UPDATE ON books
+        BEGIN
+            UPDATE catalog_state SET version = version + 1 WHERE id = 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS books_version_delete AFTER DELETE ON books
+        BEGIN
+            UPDATE catalog_state SET version = version + 1 WHERE id = 1;
+        END
+        ''',
+    ),
+    # 3: integer ISBN key (the ISBN-13 as a number) with a unique index, so
+    # ISBN-10, hyphenated and 13-digit forms of one ISBN resolve to one row
+    (
+        'ALTER TABLE books ADD COLUMN isbn_key INTEGER',
+        '''
+        UPDATE books SET isbn_key = CAST(isbn AS INTEGER)
+        WHERE length(isbn) = 13 AND isbn NOT GLOB '*[^0-9]*'
+        ''',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_books_isbn_key ON books (isbn_key)',
+    ),
+    # 4: borrow/return/payment events for analytics, written in batches by the
+    # background writer in services/events.py
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            payload TEXT NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_events_kind_created ON events (kind, created_at)',
+    ),
+    # 5: loan lookups by patron and by book, which used to scan borrow_records
+    _BORROW_RECORDS_INDEXES,
+    # 6: holds queue. status: waiting -> ready (a returned copy is set aside,
+    # until expires_at) -> fulfilled, or cancelled/expired. The partial index
+    # keeps finding a book's next waiting hold O(log n).
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS holds (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             patron_id TEXT NOT NULL,
             book_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'waiting',
+            ready_at TEXT,
+            expires_at TEXT,
+            FOREIGN KEY (book_id) REFERENCES books (id)
+        )
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_holds_queue ON holds (book_id, created_at)
+        WHERE status = 'waiting'
+        ''',
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_holds_open ON holds (patron_id, book_id)
+        WHERE status IN ('waiting', 'ready')
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_holds_ready ON holds (expires_at)
+        WHERE status = 'ready'
+        ''',
+    ),
+    # 7: bookkeeping for the background maintenance tasks, shared by all
+    # worker processes so each task runs in one of them at a time
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS maintenance_state (
+            task TEXT PRIMARY KEY,
+            last_started TEXT,
+            last_finished TEXT,
+            last_seconds REAL,
+            last_reclaimed INTEGER,
+            changes_at_run INTEGER
+        )
+        ''',
+        '''
+        INSERT OR IGNORE INTO maintenance_state (task)
+        VALUES ('checkpoint'), ('optimize'), ('analyze'), ('vacuum')
+        ''',
+    ),
+    # 8: inventory reconciliation (services/reconciliation.py): the watermark
+    # incremental runs start from, and what the last run found
+    (
+        _BORROW_RECORDS_TOUCHED_INDEX,
+        '''
+        CREATE TABLE IF NOT EXISTS reconcile_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            watermark TEXT,
+            last_finished TEXT,
+            checked INTEGER,
+            drifted INTEGER,
+            repaired INTEGER
+        )
+        ''',
+        'INSERT OR IGNORE INTO reconcile_state (id) VALUES (1)',
+    ),
+    # 9: physical copies. status: available (on the shelf), on_hold (set
+    # aside for a ready hold), on_loan (patron_id has it; NULL for loans made
+    # before copies were tracked) or withdrawn. Existing books get one copy
+    # per total_copies, split by their counters. (book_id, status) serves the
+    # "first available copy" lookup, with the rowid giving a stable order.
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS copies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER NOT NULL,
+            barcode TEXT NOT NULL UNIQUE,
+            status TEXT NOT NULL DEFAULT 'available',
+            patron_id TEXT,
+            updated_at TEXT,
+            FOREIGN KEY (book_id) REFERENCES books (id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_copies_book_status ON copies (book_id, status)',
+        '''
+        WITH RECURSIVE n(i) AS (
+            SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < (SELECT MAX(total_copies) FROM books)
+        )
+        INSERT INTO copies (book_id, barcode, status)
+        SELECT b.id, printf('%08d%04d', b.id, n.i),
+               CASE
+                   WHEN n.i <= b.available_copies THEN 'available'
+                   WHEN n.i <= b.available_copies + (
+                       SELECT COUNT(*) FROM holds h WHERE h.book_id = b.id AND h.status = 'ready'
+                   ) THEN 'on_hold'
+                   ELSE 'on_loan'
+               END
+        FROM books b JOIN n ON n.i <= b.total_copies
+        ORDER BY b.id, n.i
+        ''',
+        'ALTER TABLE borrow_records ADD COLUMN copy_id INTEGER',
+    ),
+    # 10: branches. Every copy sits at a branch (existing ones at MAIN);
+    # branch_inventory keeps per-branch counts and is maintained by triggers
+    # on copies, and books.branch_availability mirrors a book's rows so the
+    # catalog still reads only books. Loans record the lending and returning
+    # branch. The title index lets the catalog's ORDER BY title skip a sort.
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS branches (
+            id INTEGER PRIMARY KEY,
+            code TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL
+        )
+        ''',
+        "INSERT OR IGNORE INTO branches (id, code, name) VALUES (1, 'MAIN', 'Main Library')",
+        'ALTER TABLE copies ADD COLUMN branch_id INTEGER NOT NULL DEFAULT 1',
+        *_BORROW_RECORDS_BRANCH_COLUMNS,
+        'ALTER TABLE books ADD COLUMN branch_availability TEXT',
+        '''
+        CREATE TABLE IF NOT EXISTS branch_inventory (
+            book_id INTEGER NOT NULL,
+            branch_id INTEGER NOT NULL,
+            total_copies INTEGER NOT NULL,
+            available_copies INTEGER NOT NULL,
+            PRIMARY KEY (book_id, branch_id)
+        ) WITHOUT ROWID
+        ''',
+        f'''
+        INSERT INTO branch_inventory (book_id, branch_id, total_copies, available_copies)
+        SELECT book_id, branch_id, SUM({_COPY_TOTAL.format(row='copies')}),
+               SUM({_COPY_AVAILABLE.format(row='copies')})
+        FROM copies GROUP BY book_id, branch_id
+        ''',
+        f'UPDATE books SET branch_availability = ({_BRANCH_AVAILABILITY.format(book_id="books.id")})',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS copies_inventory_insert AFTER INSERT ON copies
+        BEGIN
+            INSERT INTO branch_inventory (book_id, branch_id, total_copies, available_copies)
+            VALUES (NEW.book_id, NEW.branch_id, {_COPY_TOTAL.format(row='NEW')},
+                    {_COPY_AVAILABLE.format(row='NEW')})
+            ON CONFLICT (book_id, branch_id) DO UPDATE SET
+                total_copies = total_copies + excluded.total_copies,
+                available_copies = available_copies + excluded.available_copies;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS copies_inventory_delete AFTER DELETE ON copies
+        BEGIN
+            UPDATE branch_inventory SET
+                total_copies = total_copies - {_COPY_TOTAL.format(row='OLD')},
+                available_copies = available_copies - {_COPY_AVAILABLE.format(row='OLD')}
+            WHERE book_id = OLD.book_id AND branch_id = OLD.branch_id;
+        END
+        ''',
+        # a status change within a branch adjusts its row once; lending a
+        # held copy (on_hold -> on_loan) changes no count and fires nothing
+        f'''
+        CREATE TRIGGER IF NOT EXISTS copies_inventory_status AFTER UPDATE OF status ON copies
+        WHEN OLD.branch_id = NEW.branch_id
+            AND ({_COPY_TOTAL.format(row='OLD')} != {_COPY_TOTAL.format(row='NEW')}
+                 OR {_COPY_AVAILABLE.format(row='OLD')} != {_COPY_AVAILABLE.format(row='NEW')})
+        BEGIN
+            UPDATE branch_inventory SET
+                total_copies = total_copies
+                    - {_COPY_TOTAL.format(row='OLD')} + {_COPY_TOTAL.format(row='NEW')},
+                available_copies = available_copies
+                    - {_COPY_AVAILABLE.format(row='OLD')} + {_COPY_AVAILABLE.format(row='NEW')}
+            WHERE book_id = NEW.book_id AND branch_id = NEW.branch_id;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS copies_inventory_move AFTER UPDATE OF status, branch_id ON copies
+        WHEN OLD.branch_id != NEW.branch_id
+        BEGIN
+            UPDATE branch_inventory SET
+                total_copies = total_copies - {_COPY_TOTAL.format(row='OLD')},
+                available_copies = available_copies - {_COPY_AVAILABLE.format(row='OLD')}
+            WHERE book_id = OLD.book_id AND branch_id = OLD.branch_id;
+            INSERT INTO branch_inventory (book_id, branch_id, total_copies, available_copies)
+            VALUES (NEW.book_id, NEW.branch_id, {_COPY_TOTAL.format(row='NEW')},
+                    {_COPY_AVAILABLE.format(row='NEW')})
+            ON CONFLICT (book_id, branch_id) DO UPDATE SET
+                total_copies = total_copies + excluded.total_copies,
+                available_copies = available_copies + excluded.available_copies;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS branch_inventory_insert AFTER INSERT ON branch_inventory
+        BEGIN
+            UPDATE books SET branch_availability = ({_BRANCH_AVAILABILITY.format(book_id="NEW.book_id")})
+            WHERE id = NEW.book_id;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS branch_inventory_update AFTER UPDATE ON branch_inventory
+        BEGIN
+            UPDATE books SET branch_availability = ({_BRANCH_AVAILABILITY.format(book_id="NEW.book_id")})
+            WHERE id = NEW.book_id;
+        END
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_books_title ON books (title)',
+    ),
+    # 11: borrow popularity counters, added to by each borrow as it is made
+    # (services/popularity.py): one row per book per day for the last
+    # POPULARITY_DAYS days, and all-time totals. version goes up with every
+    # addition (or rebuild from the loans, which also sets rebuilt_at), and
+    # each bucket row keeps the version that last changed it.
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS popularity_daily (
+            day TEXT NOT NULL,
+            book_id INTEGER NOT NULL,
+            borrows INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (day, book_id)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS popularity_totals (
+            book_id INTEGER PRIMARY KEY,
+            borrows INTEGER NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS popularity_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0,
+            rebuilt_at TEXT
+        )
+        ''',
+        'INSERT OR IGNORE INTO popularity_state (id) VALUES (1)',
+    ),
+    # 12: hold changes move the catalog version too. A borrow through a ready
+    # hold touches no books row, yet pages cached on the version (/status)
+    # must show the new loan.
+    (
+        '''
+        CREATE TRIGGER IF NOT EXISTS holds_version_insert AFTER INSERT ON holds
+        BEGIN
+            UPDATE catalog_state SET version = version + 1 WHERE id = 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS holds_version_update AFTER UPDATE ON holds
+        BEGIN
+            UPDATE catalog_state SET version = version + 1 WHERE id = 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS holds_version_delete AFTER DELETE ON holds
+        BEGIN
+            UPDATE catalog_state SET version = version + 1 WHERE id = 1;
+        END
+        ''',
+    ),
+    # 13: snapshots restored over this file (services/backup.py). A restore
+    # can take books away, which in-memory indexes that only load newer rows
+    # (services/catalog_index.py) have to notice and rebuild for.
+    (
+        'ALTER TABLE catalog_state ADD COLUMN restores INTEGER NOT NULL DEFAULT 0',
+    ),
+]
+
+SCHEMA_VERSION = len(_MIGRATIONS)
+
+# Migrations for loan shard files (see SHARD_COUNT); versioned the same way
+_SHARD_MIGRATIONS: List[Tuple[str, ...]] = [
+    (_BORROW_RECORDS_TABLE, *_BORROW_RECORDS_INDEXES),
+    (_BORROW_RECORDS_TOUCHED_INDEX,),
+    ('ALTER TABLE borrow_records ADD COLUMN copy_id INTEGER',),
+    _BORROW_RECORDS_BRANCH_COLUMNS,
+]
+
+# Migrations for loan archive files (see archive_loans); ids are the loans'
+# ids in the shard they were archived from
+_ARCHIVE_MIGRATIONS: List[Tuple[str, ...]] = [
+    (
+        '''
+        CREATE TABLE IF NOT EXISTS borrow_records_archive (
+            id INTEGER PRIMARY KEY,
+            patron_id TEXT NOT NULL,
+            book_id INTEGER NOT NULL,
             borrow_date TEXT NOT NULL,
             due_date TEXT NOT NULL,
-            return_date TEXT,
-            FOREIGN KEY (book_id) REFERENCES books (id)
+            return_date TEXT NOT NULL,
+            archived_at TEXT NOT NULL
         )
-    ''')
-    
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_archive_patron ON borrow_records_archive (patron_id)',
+    ),
+    ('ALTER TABLE borrow_records_archive ADD COLUMN copy_id INTEGER',),
+    tuple(statement.replace('borrow_records', 'borrow_records_archive')
+          for statement in _BORROW_RECORDS_BRANCH_COLUMNS),
+]
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Return the number of migrations applied to the database behind conn."""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def _apply_migrations(conn: sqlite3.Connection, migrations: List[Tuple[str, ...]]) -> None:
+    """Apply the migrations conn's database hasn't had yet, then close conn."""
+    version = get_schema_version(conn)
+    if version >= len(migrations):
+        conn.close()
+        return
+    if version == 0:
+        # only takes effect on a file with no tables yet; lets the maintenance
+        # scheduler hand pages freed by archiving back with incremental_vacuum
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+
+    # WAL lets worker processes keep reading while one of them writes
+    conn.execute('PRAGMA journal_mode=WAL')
+
+    # Take the write lock before re-reading the version so concurrent starters
+    # don't apply the same migration twice
+    conn.execute('BEGIN IMMEDIATE')
+    version = get_schema_version(conn)
+    for statements in migrations[version:]:
+        for statement in statements:
+            conn.execute(statement)
+    conn.execute(f'PRAGMA user_version = {len(migrations)}')
     conn.commit()
     conn.close()
 
+def init_database():
+    """Initialize the database with required tables, applying any pending migrations."""
+    _apply_migrations(get_db_connection(), _MIGRATIONS)
+    if SHARD_COUNT > 1:
+        init_shards(SHARD_COUNT)
+
 def add_sample_data():
     """Add sample data to the database if it's empty."""
     conn = get_db_connection()
@@ -62,52 +1056,119 @@ def add_sample_data():
         ]
         
         for title, author, isbn, copies in sample_books:
-            conn.execute('''
-                INSERT INTO books (title, author, isbn, total_copies, available_copies)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (title, author, isbn, copies, copies))
-        
-        # Make 1984 unavailable by adding a borrow record
-        conn.execute('''
-            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
-            VALUES (?, ?, ?, ?)
-        ''', ('123456', 3, 
-              (datetime.now() - timedelta(days=5)).isoformat(),
-              (datetime.now() + timedelta(days=9)).isoformat()))
+            cursor = conn.execute('''
+                INSERT INTO books (title, author, isbn, isbn_key, total_copies, available_copies)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (title, author, isbn, isbn_key(isbn), copies, copies))
+            _insert_copies(conn, cursor.lastrowid, copies, copies)
         
         # Update available copies for 1984
         conn.execute('UPDATE books SET available_copies = 0 WHERE id = 3')
         
         conn.commit()
+
+        # Make 1984 unavailable by lending its copy (the loan is in the patron's shard)
+        borrow_date = datetime.now() - timedelta(days=5)
+        copy = allocate_copy(3, '123456', borrow_date)
+        insert_borrow_record('123456', 3, borrow_date, datetime.now() + timedelta(days=9),
+                             copy['id'] if copy else None)
     
     conn.close()
 
 # Helper Functions for Database Operations
 
+def _book_dict(row: sqlite3.Row) -> Dict:
+    """A books row as a dict, with branch_availability unpacked into branches."""
+    book = dict(row)
+    availability = json.loads(book.pop('branch_availability', None) or '{}')
+    book['branches'] = [
+        {'code': code, 'available': available, 'total': total}
+        for code, (available, total) in availability.items()
+    ]
+    return book
+
+@_deadline_bound
+def get_catalog_version() -> int:
+    """Get the catalog version counter, which changes whenever any book row changes."""
+    conn = get_read_connection()
+    row = conn.execute('SELECT version FROM catalog_state WHERE id = 1').fetchone()
+    conn.close()
+    return row['version'] if row else 0
+
+@_deadline_bound
+def get_catalog_restores() -> int:
+    """Get how many snapshots have been restored over the catalog."""
+    conn = get_read_connection()
+    row = conn.execute('SELECT restores FROM catalog_state WHERE id = 1').fetchone()
+    conn.close()
+    return row['restores'] if row else 0
+
+def get_catalog_stamp() -> Tuple[str, int]:
+    """Identify the current catalog state: which database file, at which version."""
+    return (DATABASE, get_catalog_version())
+
+@_deadline_bound
 def get_all_books() -> List[Dict]:
     """Get all books from the database."""
-    conn = get_db_connection()
+    conn = get_read_connection()
     books = conn.execute('SELECT * FROM books ORDER BY title').fetchall()
     conn.close()
-    return [dict(book) for book in books]
+    return [_book_dict(book) for book in books]
+
+@_deadline_bound
+def get_book_availability() -> List[Tuple[int, int]]:
+    """Get (id, available_copies) for every book, by id."""
+    conn = get_read_connection()
+    rows = conn.execute('SELECT id, available_copies FROM books ORDER BY id').fetchall()
+    conn.close()
+    return [(row['id'], row['available_copies']) for row in rows]
 
+@_deadline_bound
+def get_books_after(book_id: int) -> List[Dict]:
+    """Get id, title and author of every book added after book_id, oldest first."""
+    conn = get_read_connection()
+    rows = conn.execute(
+        'SELECT id, title, author FROM books WHERE id > ? ORDER BY id', (book_id,)
+    ).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+@_deadline_bound
 def get_book_by_id(book_id: int) -> Optional[Dict]:
     """Get a specific book by ID."""
     conn = get_db_connection()
     book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
     conn.close()
-    return dict(book) if book else None
+    return _book_dict(book) if book else None
+
+@_deadline_bound
+def get_books_by_ids(book_ids: List[int]) -> List[Dict]:
+    """Get full rows for the given book ids, in the order the ids were given."""
+    if not book_ids:
+        return []
+    conn = get_read_connection()
+    placeholders = ','.join('?' for _ in book_ids)
+    rows = conn.execute(f'SELECT * FROM books WHERE id IN ({placeholders})', list(book_ids)).fetchall()
+    conn.close()
+    by_id = {row['id']: _book_dict(row) for row in rows}
+    return [by_id[book_id] for book_id in book_ids if book_id in by_id]
 
+@_deadline_bound
 def get_book_by_isbn(isbn: str) -> Optional[Dict]:
-    """Get a specific book by ISBN."""
+    """Get a specific book by ISBN, in ISBN-10, ISBN-13 or hyphenated form."""
+    key = isbn_key(isbn)
     conn = get_db_connection()
-    book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
+    if key is not None:
+        book = conn.execute('SELECT * FROM books WHERE isbn_key = ?', (key,)).fetchone()
+    else:
+        book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
     conn.close()
-    return dict(book) if book else None
+    return _book_dict(book) if book else None
 
+@_deadline_bound
 def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
     """Get currently borrowed books for a patron."""
-    conn = get_db_connection()
+    conn = get_shard_connection(patron_id, read_only=True)
     records = conn.execute('''
         SELECT br.*, b.title, b.author 
         FROM borrow_records br 
@@ -130,9 +1191,10 @@ def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
     
     return borrowed_books
 
+@_deadline_bound
 def get_patron_borrow_count(patron_id: str) -> int:
     """Get the number of books currently borrowed by a patron."""
-    conn = get_db_connection()
+    conn = get_shard_connection(patron_id, with_books=False)
     count = conn.execute('''
         SELECT COUNT(*) as count FROM borrow_records 
         WHERE patron_id = ? AND return_date IS NULL
@@ -140,24 +1202,29 @@ def get_patron_borrow_count(patron_id: str) -> int:
     conn.close()
     return count
 
-def get_active_borrow_record(patron_id: str, book_id: int) -> Optional[Dict]:
-    """Return the active borrow record for a patron/book pair if it exists."""
-    conn = get_db_connection()
+@_deadline_bound
+def get_active_borrow_record(patron_id: str, book_id: int,
+                             copy_id: Optional[int] = None) -> Optional[Dict]:
+    """Return the active borrow record for a patron/book pair (of that copy, if given) if it exists."""
+    conn = get_shard_connection(patron_id)
     row = conn.execute(
         '''
         SELECT br.*, b.title, b.author, b.isbn 
         FROM borrow_records br
         JOIN books b ON br.book_id = b.id
         WHERE br.patron_id = ? AND br.book_id = ? AND br.return_date IS NULL
+          AND (? IS NULL OR br.copy_id = ?)
+        ORDER BY br.id
         ''',
-        (patron_id, book_id),
+        (patron_id, book_id, copy_id, copy_id),
     ).fetchone()
     conn.close()
     return dict(row) if row else None
 
+@_deadline_bound
 def get_patron_borrow_records(patron_id: str) -> List[Dict]:
     """Fetch all borrow records for a patron, including book details."""
-    conn = get_db_connection()
+    conn = get_shard_connection(patron_id, read_only=True)
     rows = conn.execute(
         '''
         SELECT br.*, b.title, b.author, b.isbn
@@ -171,12 +1238,92 @@ def get_patron_borrow_records(patron_id: str) -> List[Dict]:
     conn.close()
     return [dict(row) for row in rows]
 
+@_deadline_bound
+def get_archived_borrow_records(patron_id: str) -> List[Dict]:
+    """Fetch a patron's archived (long-returned) borrow records, including book details."""
+    path = archive_path(shard_paths()[shard_index(patron_id)])
+    if not os.path.exists(path):
+        return []
+    conn = _connect_shard(path, read_only=True)
+    rows = conn.execute(
+        '''
+        SELECT br.id, br.patron_id, br.book_id, br.borrow_date, br.due_date, br.return_date,
+               b.title, b.author, b.isbn
+        FROM borrow_records_archive br
+        JOIN books b ON br.book_id = b.id
+        WHERE br.patron_id = ?
+        ORDER BY br.borrow_date DESC
+        ''',
+        (patron_id,),
+    ).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def iter_loans_by_patron(active_only: bool = True) -> Iterator[Tuple[str, List[Dict]]]:
+    """
+    Yield (patron_id, borrow records newest first) for every patron, shard by shard.
+
+    Each shard is read with one query ordered by patron_id (served by the
+    patron index) and grouped as it streams, so memory holds one patron's
+    loans at a time. active_only limits it to patrons with an open loan.
+    """
+    where = ('WHERE br.patron_id IN (SELECT patron_id FROM borrow_records WHERE return_date IS NULL)'
+             if active_only else '')
+    for path in shard_paths():
+        conn = _connect_shard(path, read_only=True)
+        try:
+            rows = conn.execute(
+                f'''
+                SELECT br.*, b.title, b.author, b.isbn
+                FROM borrow_records br
+                JOIN books b ON br.book_id = b.id
+                {where}
+                ORDER BY br.patron_id, br.borrow_date DESC
+                '''
+            )
+            for patron_id, records in groupby(rows, key=lambda row: row['patron_id']):
+                yield patron_id, [dict(record) for record in records]
+        finally:
+            conn.close()
+
+def iter_patron_books() -> Iterator[Tuple[str, List[int]]]:
+    """
+    Yield (patron_id, distinct book ids) for every patron who has borrowed,
+    shard by shard, including their archived loans.
+
+    Like iter_loans_by_patron, each shard (with its archive attached) is read
+    in patron order off the patron indexes and grouped as it streams, but only
+    the two ids are read, so memory holds one patron's book ids at a time.
+    """
+    for path in shard_paths():
+        conn = _connect_shard(path, read_only=True, with_books=False)
+        try:
+            query = 'SELECT patron_id, book_id FROM borrow_records'
+            target = archive_path(path)
+            if os.path.exists(target):
+                conn.execute('ATTACH DATABASE ? AS archive', (_file_uri(target, read_only=True),))
+                query += ' UNION ALL SELECT patron_id, book_id FROM archive.borrow_records_archive'
+            rows = conn.execute(f'{query} ORDER BY patron_id')
+            for patron_id, records in groupby(rows, key=lambda row: row[0]):
+                yield patron_id, sorted({record[1] for record in records})
+        finally:
+            conn.close()
+
+@_deadline_bound
+def get_active_loans_for_book(book_id: int) -> List[Dict]:
+    """Get every open borrow record for a book, across all loan shards."""
+    rows = fan_out_query(
+        'SELECT * FROM borrow_records WHERE book_id = ? AND return_date IS NULL', (book_id,)
+    )
+    return sorted(rows, key=lambda row: row['due_date'])
+
+@_deadline_bound
 def search_books(search_term: str, search_type: str) -> List[Dict]:
     """
     Search for books with case-insensitive partial matching for title/author and
     exact matching for ISBN.
     """
-    conn = get_db_connection()
+    conn = get_read_connection()
     term = search_term.strip()
     if search_type == 'title':
         rows = conn.execute(
@@ -197,72 +1344,538 @@ def search_books(search_term: str, search_type: str) -> List[Dict]:
             (f'%{term}%',),
         ).fetchall()
     elif search_type == 'isbn':
-        rows = conn.execute(
-            'SELECT * FROM books WHERE isbn = ?',
-            (term,),
-        ).fetchall()
+        key = isbn_key(term)
+        if key is not None:
+            rows = conn.execute('SELECT * FROM books WHERE isbn_key = ?', (key,)).fetchall()
+        else:
+            rows = conn.execute('SELECT * FROM books WHERE isbn = ?', (term,)).fetchall()
     else:
         conn.close()
         return []
     conn.close()
+    return [_book_dict(row) for row in rows]
+
+@_deadline_bound
+def get_hold(hold_id: int) -> Optional[Dict]:
+    """Get a hold by id."""
+    conn = get_db_connection()
+    row = conn.execute('SELECT * FROM holds WHERE id = ?', (hold_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+@_deadline_bound
+def get_open_hold(patron_id: str, book_id: int) -> Optional[Dict]:
+    """Get a patron's waiting or ready hold on a book, if any."""
+    conn = get_db_connection()
+    row = conn.execute(
+        '''
+        SELECT * FROM holds
+        WHERE patron_id = ? AND book_id = ? AND status IN ('waiting', 'ready')
+        ''',
+        (patron_id, book_id),
+    ).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+@_deadline_bound
+def get_patron_holds(patron_id: str) -> List[Dict]:
+    """
+    Get a patron's waiting and ready holds with book details, oldest first.
+
+    Waiting holds carry their 1-based place in the book's queue.
+    """
+    conn = get_db_connection()
+    rows = conn.execute(
+        '''
+        SELECT h.*, b.title, b.author,
+               CASE WHEN h.status = 'waiting' THEN (
+                   SELECT COUNT(*) FROM holds w
+                   WHERE w.book_id = h.book_id AND w.status = 'waiting'
+                     AND (w.created_at, w.id) < (h.created_at, h.id)
+               ) + 1 END AS position
+        FROM holds h
+        JOIN books b ON h.book_id = b.id
+        WHERE h.patron_id = ? AND h.status IN ('waiting', 'ready')
+        ORDER BY h.created_at, h.id
+        ''',
+        (patron_id,),
+    ).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+@_deadline_bound
+def get_expired_holds(now: datetime) -> List[Dict]:
+    """Get ready holds whose pickup window ended before now."""
+    conn = get_db_connection()
+    rows = conn.execute(
+        "SELECT * FROM holds WHERE status = 'ready' AND expires_at < ? ORDER BY expires_at",
+        (now.isoformat(),),
+    ).fetchall()
+    conn.close()
     return [dict(row) for row in rows]
 
+@_deadline_bound
+def get_events(kind: Optional[str] = None, limit: int = 100) -> List[Dict]:
+    """Get the most recent analytics events, newest first, optionally only one kind."""
+    conn = get_read_connection()
+    if kind is None:
+        rows = conn.execute('SELECT * FROM events ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+    else:
+        rows = conn.execute(
+            'SELECT * FROM events WHERE kind = ? ORDER BY id DESC LIMIT ?', (kind, limit)
+        ).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def get_maintenance_state() -> List[Dict]:
+    """Get when each maintenance task last ran, how long it took and what it reclaimed."""
+    conn = get_db_connection()
+    rows = conn.execute('SELECT * FROM maintenance_state ORDER BY task').fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def claim_maintenance_task(task: str, now: datetime, not_since: datetime) -> bool:
+    """
+    Mark task started at now unless it was started after not_since.
+
+    One UPDATE decides, so when several workers find a task due only one runs it.
+    """
+    rows = _execute_write_returning('''
+        UPDATE maintenance_state SET last_started = ?
+        WHERE task = ? AND (last_started IS NULL OR last_started <= ?)
+        RETURNING task
+    ''', (now.isoformat(), task, not_since.isoformat()))
+    return bool(rows)
+
+def record_maintenance_run(task: str, finished: datetime, seconds: float, reclaimed: int,
+                           changes: Optional[int] = None) -> bool:
+    """Record a finished maintenance task run."""
+    return _execute_write('''
+        UPDATE maintenance_state
+        SET last_finished = ?, last_seconds = ?, last_reclaimed = ?,
+            changes_at_run = COALESCE(?, changes_at_run)
+        WHERE task = ?
+    ''', (finished.isoformat(), seconds, reclaimed, changes, task))
+
+def copy_barcode(book_id: int, number: int) -> str:
+    """Barcode of a book's number-th copy (1-based), as printed on its label."""
+    return f'{book_id:08d}{number:04d}'
+
+def _insert_copies(conn: sqlite3.Connection, book_id: int, total_copies: int, available_copies: int,
+                   branch_id: int = MAIN_BRANCH_ID) -> None:
+    # copies beyond available_copies are out on loans made without a copy
+    conn.executemany(
+        'INSERT INTO copies (book_id, barcode, status, branch_id) VALUES (?, ?, ?, ?)',
+        [(book_id, copy_barcode(book_id, n), 'available' if n <= available_copies else 'on_loan', branch_id)
+         for n in range(1, total_copies + 1)],
+    )
+
 def insert_book(title: str, author: str, isbn: str, total_copies: int, available_copies: int) -> bool:
-    """Insert a new book into the database."""
+    """Insert a new book, and a copy row for each of its copies, into the database."""
+    def work(conn: sqlite3.Connection) -> None:
+        cursor = conn.execute('''
+            INSERT INTO books (title, author, isbn, isbn_key, total_copies, available_copies)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (title, author, isbn, isbn_key(isbn), total_copies, available_copies))
+        _insert_copies(conn, cursor.lastrowid, total_copies, available_copies)
+
+    return _write_with_retries(work)[0]
+
+def insert_borrow_record(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime,
+                         copy_id: Optional[int] = None, branch_id: Optional[int] = None) -> bool:
+    """Insert a new borrow record (of copy copy_id lent by branch_id, if known) into the database."""
+    return _execute_write('''
+        INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, copy_id, branch_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat(), copy_id, branch_id),
+        connect=lambda: get_shard_connection(patron_id, with_books=False))
+
+def allocate_copy(book_id: int, patron_id: str, now: datetime, from_status: str = 'available',
+                  branch_id: Optional[int] = None) -> Optional[Dict]:
+    """
+    Lend the first copy of a book in from_status (at branch_id, if given) to
+    patron_id; the copy, or None if there is none. A copy set aside for
+    another patron's hold (on_hold with their patron_id) is never taken; the
+    copy set aside for patron_id is taken first.
+
+    One UPDATE ... RETURNING finds and claims the copy under the write lock, so
+    concurrent borrowers can never be handed the same copy. A book has few
+    copies, so the branch is filtered off the (book_id, status) index.
+    """
+    branch_filter = 'AND branch_id = ?' if branch_id is not None else ''
+    params = [patron_id, now.isoformat(), book_id, from_status, patron_id]
+    if branch_id is not None:
+        params.append(branch_id)
+    rows = _execute_write_returning(f'''
+        UPDATE copies SET status = 'on_loan', patron_id = ?, updated_at = ?
+        WHERE id = (
+            SELECT id FROM copies
+            WHERE book_id = ? AND status = ? AND (patron_id IS NULL OR patron_id = ?) {branch_filter}
+            ORDER BY patron_id IS NULL, id LIMIT 1
+        )
+        RETURNING *
+    ''', tuple(params))
+    return rows[0] if rows else None
+
+def move_copy(book_id: int, from_status: str, to_status: str, now: datetime,
+              copy_id: Optional[int] = None, branch_id: Optional[int] = None,
+              patron_id: Optional[str] = None) -> Optional[Dict]:
+    """
+    Move copy copy_id, or else any copy of the book in from_status that no
+    patron holds, to to_status (and to branch_id, if given, e.g. the branch
+    it was returned to), held for patron_id (the patron an on_hold copy is
+    set aside for); the copy, or None if there was none.
+    """
+    rows = _execute_write_returning('''
+        UPDATE copies SET status = ?, patron_id = ?, branch_id = COALESCE(?, branch_id), updated_at = ?
+        WHERE id = COALESCE(?, (
+            SELECT id FROM copies WHERE book_id = ? AND status = ? AND patron_id IS NULL
+            ORDER BY id LIMIT 1
+        )) AND status = ?
+        RETURNING *
+    ''', (to_status, patron_id, branch_id, now.isoformat(), copy_id, book_id, from_status, from_status))
+    return rows[0] if rows else None
+
+def pass_on_held_copy(book_id: int, from_patron_id: str, to_patron_id: Optional[str],
+                      now: datetime) -> Optional[Dict]:
+    """
+    Hand the copy of a book set aside for from_patron_id's hold on to
+    to_patron_id's hold, or back on the shelf if to_patron_id is None; the
+    copy, or None if there was none. Copies set aside before holds recorded
+    their patron (patron_id NULL) are used when no copy carries from_patron_id.
+    """
+    rows = _execute_write_returning('''
+        UPDATE copies SET status = CASE WHEN ? IS NULL THEN 'available' ELSE 'on_hold' END,
+                          patron_id = ?, updated_at = ?
+        WHERE id = (
+            SELECT id FROM copies
+            WHERE book_id = ? AND status = 'on_hold' AND (patron_id IS NULL OR patron_id = ?)
+            ORDER BY patron_id IS NULL, id LIMIT 1
+        )
+        RETURNING *
+    ''', (to_patron_id, to_patron_id, now.isoformat(), book_id, from_patron_id))
+    return rows[0] if rows else None
+
+def transfer_copy(copy_id: int, branch_id: int, now: datetime) -> Optional[Dict]:
+    """Move a copy that isn't out on loan to branch_id; the copy, or None if it can't move."""
+    rows = _execute_write_returning('''
+        UPDATE copies SET branch_id = ?, updated_at = ?
+        WHERE id = ? AND status != 'on_loan'
+        RETURNING *
+    ''', (branch_id, now.isoformat(), copy_id))
+    return rows[0] if rows else None
+
+@_deadline_bound
+def get_branches() -> List[Dict]:
+    """Get every branch, by id."""
+    conn = get_read_connection()
+    rows = conn.execute('SELECT * FROM branches ORDER BY id').fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+@_deadline_bound
+def get_branch_by_code(code: str) -> Optional[Dict]:
+    """Get a branch by its code (case-insensitive)."""
     conn = get_db_connection()
-    try:
-        conn.execute('''
-            INSERT INTO books (title, author, isbn, total_copies, available_copies)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (title, author, isbn, total_copies, available_copies))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        conn.close()
-        return False
+    row = conn.execute('SELECT * FROM branches WHERE code = ?', (code.upper(),)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+@_deadline_bound
+def get_branch_totals() -> List[Dict]:
+    """Get every branch with its total and available copies across all books."""
+    conn = get_read_connection()
+    rows = conn.execute('''
+        SELECT br.*, COALESCE(SUM(bi.total_copies), 0) AS total_copies,
+               COALESCE(SUM(bi.available_copies), 0) AS available_copies
+        FROM branches br LEFT JOIN branch_inventory bi ON bi.branch_id = br.id
+        GROUP BY br.id ORDER BY br.id
+    ''').fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def insert_branch(code: str, name: str) -> bool:
+    """Insert a new branch."""
+    return _execute_write('INSERT INTO branches (code, name) VALUES (?, ?)', (code.upper(), name))
 
-def insert_borrow_record(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime) -> bool:
-    """Insert a new borrow record into the database."""
+def book_has_copies(book_id: int) -> bool:
+    """Return True if the book's physical copies are tracked in copies."""
     conn = get_db_connection()
-    try:
-        conn.execute('''
-            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
-            VALUES (?, ?, ?, ?)
-        ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat()))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        conn.close()
-        return False
+    row = conn.execute('SELECT 1 FROM copies WHERE book_id = ? LIMIT 1', (book_id,)).fetchone()
+    conn.close()
+    return row is not None
+
+@_deadline_bound
+def get_copy_by_barcode(barcode: str) -> Optional[Dict]:
+    """Get a copy and its book by barcode, in one lookup on the barcode index."""
+    conn = get_db_connection()
+    row = conn.execute('''
+        SELECT c.*, b.title, b.author, b.isbn
+        FROM copies c JOIN books b ON b.id = c.book_id
+        WHERE c.barcode = ?
+    ''', (barcode,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+@_deadline_bound
+def get_book_copies(book_id: int) -> List[Dict]:
+    """Get every copy of a book, in barcode order."""
+    conn = get_db_connection()
+    rows = conn.execute('SELECT * FROM copies WHERE book_id = ? ORDER BY id', (book_id,)).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def add_availability_listener(listener: Callable[[int, int], None]) -> None:
+    """Call listener(book_id, available_copies) after every availability change in this process."""
+    if listener not in _availability_listeners:
+        _availability_listeners.append(listener)
 
 def update_book_availability(book_id: int, change: int) -> bool:
     """Update the available copies of a book by a given amount (+1 for return, -1 for borrow)."""
-    conn = get_db_connection()
-    try:
-        conn.execute('''
-            UPDATE books SET available_copies = available_copies + ? WHERE id = ?
-        ''', (change, book_id))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        conn.close()
+    rows = _execute_write_returning('''
+        UPDATE books SET available_copies = available_copies + ? WHERE id = ?
+        RETURNING id, available_copies
+    ''', (change, book_id))
+    if rows is None:
         return False
+    for row in rows:
+        for listener in _availability_listeners:
+            listener(row['id'], row['available_copies'])
+    return True
 
-def update_borrow_record_return_date(patron_id: str, book_id: int, return_date: datetime) -> bool:
-    """Update the return date for a borrow record."""
+def get_availability_inputs(book_ids: Optional[Iterable[int]] = None) -> List[Dict]:
+    """
+    Get id, title, total_copies, available_copies and the number of ready
+    holds of every book (or just book_ids), in one grouped query.
+    """
+    query = '''
+        SELECT b.id, b.title, b.total_copies, b.available_copies, COALESCE(h.ready, 0) AS ready_holds
+        FROM books b
+        LEFT JOIN (
+            SELECT book_id, COUNT(*) AS ready FROM holds WHERE status = 'ready' GROUP BY book_id
+        ) h ON h.book_id = b.id
+    '''
+    params: Tuple = ()
+    if book_ids is not None:
+        query += ' WHERE b.id IN (SELECT value FROM json_each(?))'
+        params = (json.dumps(list(book_ids)),)
     conn = get_db_connection()
-    try:
-        conn.execute('''
-            UPDATE borrow_records 
-            SET return_date = ? 
-            WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
-        ''', (return_date.isoformat(), patron_id, book_id))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        conn.close()
-        return False
+    rows = conn.execute(query + ' ORDER BY b.id', params).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def get_active_loan_counts(book_ids: Optional[Iterable[int]] = None) -> Dict[int, int]:
+    """Count active loans per book across every loan shard, one grouped query per shard."""
+    query = 'SELECT book_id, COUNT(*) AS loans FROM borrow_records WHERE return_date IS NULL'
+    params: Tuple = ()
+    if book_ids is not None:
+        query += ' AND book_id IN (SELECT value FROM json_each(?))'
+        params = (json.dumps(list(book_ids)),)
+    counts: Dict[int, int] = {}
+    for row in fan_out_query(query + ' GROUP BY book_id', params):
+        counts[row['book_id']] = counts.get(row['book_id'], 0) + row['loans']
+    return counts
+
+def get_books_touched_since(since: datetime) -> List[int]:
+    """Get the ids of books with a loan borrowed or returned, or a hold placed or readied, since since."""
+    touched = {row['book_id'] for row in fan_out_query(
+        'SELECT DISTINCT book_id FROM borrow_records WHERE COALESCE(return_date, borrow_date) >= ?',
+        (since.isoformat(),),
+    )}
+    conn = get_db_connection()
+    touched.update(row['book_id'] for row in conn.execute(
+        'SELECT DISTINCT book_id FROM holds WHERE COALESCE(ready_at, created_at) >= ?', (since.isoformat(),)
+    ))
+    conn.close()
+    return sorted(touched)
+
+def set_book_availability(changes: List[Tuple[int, int, int]]) -> List[Tuple[int, int]]:
+    """
+    Set available_copies for each (book_id, expected, new) in one transaction,
+    skipping books whose available_copies no longer equals expected.
+
+    Returns the (book_id, new) pairs that were written.
+    """
+    def work(conn: sqlite3.Connection) -> List[Tuple[int, int]]:
+        written = []
+        for book_id, expected, new in changes:
+            cursor = conn.execute(
+                'UPDATE books SET available_copies = ? WHERE id = ? AND available_copies = ?',
+                (new, book_id, expected),
+            )
+            if cursor.rowcount:
+                written.append((book_id, new))
+        return written
+
+    ok, written = _write_with_retries(work)
+    if not ok:
+        return []
+    for book_id, available in written:
+        for listener in _availability_listeners:
+            listener(book_id, available)
+    return written
+
+def get_reconcile_state() -> Dict:
+    """Get the reconciliation watermark and what the last run found."""
+    conn = get_db_connection()
+    row = conn.execute('SELECT * FROM reconcile_state WHERE id = 1').fetchone()
+    conn.close()
+    return dict(row)
+
+def record_reconcile_run(watermark: datetime, finished: datetime, checked: int, drifted: int,
+                         repaired: int) -> bool:
+    """Record a finished reconciliation run and move the watermark."""
+    return _execute_write('''
+        UPDATE reconcile_state
+        SET watermark = ?, last_finished = ?, checked = ?, drifted = ?, repaired = ?
+        WHERE id = 1
+    ''', (watermark.isoformat(), finished.isoformat(), checked, drifted, repaired))
+
+def update_borrow_record_return_date(patron_id: str, book_id: int, return_date: datetime,
+                                     branch_id: Optional[int] = None,
+                                     record_id: Optional[int] = None) -> bool:
+    """
+    Update the return date (and the branch it was returned to, if known) for a borrow record:
+    the one with record_id if given, else every active one for the patron/book pair.
+    """
+    return _execute_write('''
+        UPDATE borrow_records 
+        SET return_date = ?, return_branch_id = ?
+        WHERE patron_id = ? AND book_id = ? AND return_date IS NULL AND (? IS NULL OR id = ?)
+    ''', (return_date.isoformat(), branch_id, patron_id, book_id, record_id, record_id),
+        connect=lambda: get_shard_connection(patron_id, with_books=False))
+
+def insert_events(events: List[Tuple[str, str, str]]) -> bool:
+    """Insert a batch of (kind, created_at, payload) events in a single transaction."""
+    def work(conn: sqlite3.Connection) -> None:
+        conn.executemany('INSERT INTO events (kind, created_at, payload) VALUES (?, ?, ?)', events)
+
+    return _write_with_retries(work)[0]
+
+def add_borrow_counts(borrow_counts: List[Tuple[str, int, int]]) -> bool:
+    """Add (day, book_id, borrows) rows to the popularity counters in a single transaction."""
+    return _write_with_retries(lambda conn: _add_borrow_counts(conn, borrow_counts))[0]
+
+def _add_borrow_counts(conn: sqlite3.Connection, borrow_counts: List[Tuple[str, int, int]]) -> None:
+    version = conn.execute(
+        'UPDATE popularity_state SET version = version + 1 WHERE id = 1 RETURNING version'
+    ).fetchone()[0]
+    conn.executemany('''
+        INSERT INTO popularity_daily (day, book_id, borrows, version) VALUES (?, ?, ?, ?)
+        ON CONFLICT (day, book_id) DO UPDATE SET
+            borrows = borrows + excluded.borrows, version = excluded.version
+    ''', [(day, book_id, borrows, version) for day, book_id, borrows in borrow_counts])
+    totals: Dict[int, int] = {}
+    for _, book_id, borrows in borrow_counts:
+        totals[book_id] = totals.get(book_id, 0) + borrows
+    conn.executemany('''
+        INSERT INTO popularity_totals (book_id, borrows) VALUES (?, ?)
+        ON CONFLICT (book_id) DO UPDATE SET borrows = borrows + excluded.borrows
+    ''', sorted(totals.items()))
+    # buckets that have left the longest window; a range on the primary key
+    newest = max(day for day, _, _ in borrow_counts)
+    cutoff = (datetime.fromisoformat(newest) - timedelta(days=POPULARITY_DAYS - 1)).date().isoformat()
+    conn.execute('DELETE FROM popularity_daily WHERE day < ?', (cutoff,))
+
+@_deadline_bound
+def get_popularity_state() -> Dict:
+    """Get the popularity counters' version and when they were last rebuilt."""
+    conn = get_db_connection()
+    row = conn.execute('SELECT version, rebuilt_at FROM popularity_state WHERE id = 1').fetchone()
+    conn.close()
+    return dict(row) if row else {'version': 0, 'rebuilt_at': None}
+
+@_deadline_bound
+def get_popularity_counts(
+    since_day: str,
+    with_totals: bool = True,
+    after_version: int = -1,
+) -> Tuple[Dict, List[Tuple[str, int, int]], List[Tuple[int, int]]]:
+    """
+    Get the popularity state, the (day, book_id, borrows) buckets from
+    since_day on that changed after after_version and (with_totals) every
+    (book_id, borrows) all-time count, read in one transaction so they all match.
+    """
+    conn = get_db_connection()
+    conn.execute('BEGIN')
+    state = conn.execute('SELECT version, rebuilt_at FROM popularity_state WHERE id = 1').fetchone()
+    daily = conn.execute(
+        'SELECT day, book_id, borrows FROM popularity_daily WHERE day >= ? AND version > ?',
+        (since_day, after_version),
+    ).fetchall()
+    totals = conn.execute('SELECT book_id, borrows FROM popularity_totals').fetchall() if with_totals else []
+    conn.execute('COMMIT')
+    conn.close()
+    return dict(state), [tuple(row) for row in daily], [tuple(row) for row in totals]
+
+def rebuild_popularity(now: datetime) -> Dict:
+    """
+    Recount the popularity counters from every loan, in the shards and their
+    archives, replacing them in one transaction. Returns row counts.
+    """
+    query = '''
+        SELECT substr(borrow_date, 1, 10) AS day, book_id, COUNT(*) AS borrows
+        FROM {table} GROUP BY day, book_id
+    '''
+    daily: Dict[Tuple[str, int], int] = {}
+    rows = fan_out_query(query.format(table='borrow_records'), (), with_books=False)
+    for path in shard_paths():
+        target = archive_path(path)
+        if os.path.exists(target):
+            conn = _connect_shard(target, read_only=True, with_books=False)
+            rows += [dict(row) for row in conn.execute(query.format(table='borrow_records_archive'))]
+            conn.close()
+    for row in rows:
+        key = (row['day'], row['book_id'])
+        daily[key] = daily.get(key, 0) + row['borrows']
+    totals: Dict[int, int] = {}
+    for (_, book_id), borrows in daily.items():
+        totals[book_id] = totals.get(book_id, 0) + borrows
+    cutoff = (now - timedelta(days=POPULARITY_DAYS - 1)).date().isoformat()
+    recent = sorted((day, book_id, borrows) for (day, book_id), borrows in daily.items() if day >= cutoff)
+
+    def work(conn: sqlite3.Connection) -> None:
+        version = conn.execute(
+            'UPDATE popularity_state SET version = version + 1, rebuilt_at = ? WHERE id = 1 RETURNING version',
+            (now.isoformat(),),
+        ).fetchone()[0]
+        conn.execute('DELETE FROM popularity_daily')
+        conn.execute('DELETE FROM popularity_totals')
+        conn.executemany('INSERT INTO popularity_daily (day, book_id, borrows, version) VALUES (?, ?, ?, ?)',
+                         [(day, book_id, borrows, version) for day, book_id, borrows in recent])
+        conn.executemany('INSERT INTO popularity_totals (book_id, borrows) VALUES (?, ?)', sorted(totals.items()))
+
+    if not _write_with_retries(work)[0]:
+        raise sqlite3.OperationalError('could not write the rebuilt popularity counters')
+    return {'daily_rows': len(recent), 'books': len(totals), 'loans': sum(totals.values())}
+
+def insert_hold(patron_id: str, book_id: int, created_at: datetime) -> bool:
+    """Insert a waiting hold; fails if the patron already has an open hold on the book."""
+    return _execute_write('''
+        INSERT INTO holds (patron_id, book_id, created_at) VALUES (?, ?, ?)
+    ''', (patron_id, book_id, created_at.isoformat()))
+
+def assign_next_hold(book_id: int, ready_at: datetime, expires_at: datetime) -> Optional[Dict]:
+    """
+    Mark the oldest waiting hold on a book ready, in one statement, and return it.
+
+    Returns None if nobody is waiting (or the write failed).
+    """
+    rows = _execute_write_returning('''
+        UPDATE holds SET status = 'ready', ready_at = ?, expires_at = ?
+        WHERE id = (
+            SELECT id FROM holds WHERE book_id = ? AND status = 'waiting'
+            ORDER BY created_at, id LIMIT 1
+        )
+        RETURNING *
+    ''', (ready_at.isoformat(), expires_at.isoformat(), book_id))
+    return rows[0] if rows else None
+
+def update_hold_status(hold_id: int, status: str, from_statuses: Tuple[str, ...]) -> Optional[Dict]:
+    """Move a hold to status if it is currently in one of from_statuses; the updated hold or None."""
+    placeholders = ','.join('?' for _ in from_statuses)
+    rows = _execute_write_returning(f'''
+        UPDATE holds SET status = ? WHERE id = ? AND status IN ({placeholders})
+        RETURNING *
+    ''', (status, hold_id, *from_statuses))
+    return rows[0] if rows else None
@@ -0,0 +1,25 @@
+"""gunicorn settings for the pre-fork production server."""
+
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+# gthread workers, so an open server-sent event stream (/api/holds/stream,
+# /api/stream/availability) ties up one thread rather than a whole worker
+worker_class = os.environ.get("WEB_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("WEB_THREADS", "16"))
+timeout = int(os.environ.get("WEB_TIMEOUT", "30"))
+accesslog = "-"
+
+
+def on_starting(server):
+    """Apply schema migrations once, in the master, before any worker forks."""
+    import database
+    from database import add_sample_data, init_database
+
+    # the same LOAN_SHARDS create_app reads in each worker
+    database.SHARD_COUNT = int(os.environ.get("LOAN_SHARDS", "1"))
+    init_database()
+    if os.environ.get("SAMPLE_DATA") == "1":
+        add_sample_data()
@@ -2,16 +2,27 @@
 Routes Package - Initialize all route blueprints
 """
 
-from .catalog_routes import catalog_bp
-from .borrowing_routes import borrowing_bp
-from .search_routes import search_bp
-from .api_routes import api_bp
-from .status_routes import status_bp
-
 def register_blueprints(app):
-    """Register all route blueprints with the Flask app."""
+    """
+    Register all route blueprints with the Flask app.
+
+    Blueprint modules are imported here rather than at package import time so
+    that importing `routes` alone (as the routes.* helper modules do) doesn't
+    pull in every view. Importing `app` is not cheap either way: it imports the
+    services, indexes and caches at module level so create_app can configure them.
+    """
+    from .catalog_routes import catalog_bp
+    from .borrowing_routes import borrowing_bp
+    from .search_routes import search_bp
+    from .api_routes import api_bp
+    from .status_routes import status_bp
+    from .holds_routes import holds_bp
+    from .copies_routes import copies_bp
+
     app.register_blueprint(catalog_bp)
     app.register_blueprint(borrowing_bp)
     app.register_blueprint(search_bp)
     app.register_blueprint(api_bp)
     app.register_blueprint(status_bp)
+    app.register_blueprint(holds_bp)
+    app.register_blueprint(copies_bp)
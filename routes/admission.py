@@ -0,0 +1,198 @@
+"""
+Admission Control - Rate limits and write concurrency for circulation endpoints
+
+Borrow, return, hold and late-fee requests pass through token buckets keyed
+by patron ID and by client IP, and requests that write also need one of a
+fixed number of write slots. A request over any limit is answered with 429
+and Retry-After before it reaches the view, so one misbehaving self-checkout
+client can't queue up on SQLite's single writer ahead of everyone else.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional
+
+from flask import Response, current_app, g, jsonify, make_response, request
+
+# Endpoints that are rate limited; the ones that write also take a write slot
+# (for any method but GET, so the return form itself stays cheap to load)
+LIMITED_ENDPOINTS = {
+    'borrowing.borrow_book',
+    'borrowing.return_book',
+    'borrowing.place_hold',
+    'api.get_late_fee',
+    'holds.create_hold',
+    'holds.delete_hold',
+    'copies.return_scanned_copy',
+    'copies.transfer_scanned_copy',
+}
+WRITE_ENDPOINTS = {
+    'borrowing.borrow_book',
+    'borrowing.return_book',
+    'borrowing.place_hold',
+    'holds.create_hold',
+    'holds.delete_hold',
+    'copies.return_scanned_copy',
+    'copies.transfer_scanned_copy',
+}
+
+# Longest patron ID kept as a bucket key; real ones are 6 digits
+_MAX_KEY_LENGTH = 32
+
+
+class TokenBuckets:
+    """
+    Token buckets (`rate` tokens/second, at most `burst`) for up to `max_keys` keys.
+
+    Each bucket is a two-item list [tokens, last refill time] in an OrderedDict
+    kept in LRU order, so memory stays bounded however many patrons or
+    addresses show up. An evicted bucket starts full again if its key returns;
+    with max_keys well above the number of active clients that only happens to
+    keys idle long enough to have refilled anyway.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def take(self, key: Hashable, now: Optional[float] = None) -> float:
+        """Take a token for key; 0.0 if admitted, else seconds until one is available."""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                return 0.0
+            return (1.0 - bucket[0]) / self.rate
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class AdmissionControl:
+    """Per-patron and per-IP token buckets plus a limit on concurrent writes."""
+
+    def __init__(
+        self,
+        patron_rate: float,
+        patron_burst: float,
+        ip_rate: float,
+        ip_burst: float,
+        max_keys: int,
+        max_concurrent_writes: int,
+        write_wait: float,
+    ):
+        self.patrons = TokenBuckets(patron_rate, patron_burst, max_keys)
+        self.addresses = TokenBuckets(ip_rate, ip_burst, max_keys)
+        self.write_wait = write_wait
+        self.max_concurrent_writes = max_concurrent_writes
+        self._write_slots = threading.BoundedSemaphore(max_concurrent_writes)
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.shed: Dict[str, int] = {'patron': 0, 'ip': 0, 'writes': 0}
+
+    def acquire_write_slot(self) -> bool:
+        return self._write_slots.acquire(timeout=self.write_wait)
+
+    def release_write_slot(self) -> None:
+        self._write_slots.release()
+
+    def count(self, shed_by: Optional[str] = None) -> None:
+        with self._lock:
+            if shed_by is None:
+                self.admitted += 1
+            else:
+                self.shed[shed_by] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'admitted': self.admitted,
+                'shed': dict(self.shed),
+                'patron_buckets': len(self.patrons),
+                'ip_buckets': len(self.addresses),
+                'evictions': self.patrons.evictions + self.addresses.evictions,
+                'max_concurrent_writes': self.max_concurrent_writes,
+            }
+
+
+def _patron_key() -> Optional[str]:
+    patron_id = (request.view_args or {}).get('patron_id') or request.values.get('patron_id')
+    if patron_id is None and request.is_json:
+        patron_id = (request.get_json(silent=True) or {}).get('patron_id')
+    patron_id = str(patron_id or '').strip()
+    return patron_id[:_MAX_KEY_LENGTH] or None
+
+
+def _too_many(message: str, retry_after: float) -> Response:
+    if request.path.startswith('/api/'):
+        response = make_response(jsonify({'error': message}), 429)
+    else:
+        response = make_response(message, 429)
+        response.mimetype = 'text/plain'
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def _admit() -> Optional[Response]:
+    if request.endpoint not in LIMITED_ENDPOINTS:
+        return None
+    control: AdmissionControl = current_app.extensions['admission']
+
+    wait = control.addresses.take(request.remote_addr or '')
+    if wait:
+        control.count('ip')
+        return _too_many('Too many requests from this address. Please slow down.', wait)
+    patron_id = _patron_key()
+    if patron_id is not None:
+        wait = control.patrons.take(patron_id)
+        if wait:
+            control.count('patron')
+            return _too_many('Too many requests for this patron. Please slow down.', wait)
+
+    if request.endpoint in WRITE_ENDPOINTS and request.method != 'GET':
+        if not control.acquire_write_slot():
+            control.count('writes')
+            return _too_many('The library system is busy. Please try again shortly.', control.write_wait)
+        g.admission_write_slot = True
+    control.count()
+    return None
+
+
+def _release(exc: Optional[BaseException] = None) -> None:
+    if g.pop('admission_write_slot', False):
+        current_app.extensions['admission'].release_write_slot()
+
+
+def init_admission_control(app) -> None:
+    """Attach admission control to the app, configured from its ADMISSION_* settings."""
+    if not app.config['ADMISSION_CONTROL']:
+        return
+    config = app.config
+    app.extensions['admission'] = AdmissionControl(
+        patron_rate=config['ADMISSION_PATRON_RATE'],
+        patron_burst=config['ADMISSION_PATRON_BURST'],
+        ip_rate=config['ADMISSION_IP_RATE'],
+        ip_burst=config['ADMISSION_IP_BURST'],
+        max_keys=config['ADMISSION_MAX_KEYS'],
+        max_concurrent_writes=config['ADMISSION_MAX_CONCURRENT_WRITES'],
+        write_wait=config['ADMISSION_WRITE_WAIT'],
+    )
+    app.before_request(_admit)
+    app.teardown_request(_release)
@@ -2,10 +2,27 @@
 API Routes - JSON API endpoints
 """
 
-from flask import Blueprint, jsonify, request
-from services.library_service import calculate_late_fee_for_book, search_books_in_catalog
+import json
+import time
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from database import get_catalog_version, get_maintenance_state, get_query_timeout_counts
+from services.library_service import (
+    calculate_late_fee_for_book,
+    get_late_fee_version,
+    search_books_in_catalog,
+    suggest_books,
+)
+from services.availability_feed import availability_feed
+from services.events import event_bus
+from services.popularity import MAX_TOP, WINDOWS, popular_books
+from services.recommendations import NEIGHBOURS, related_books
+from services.search_cache import search_cache
+from services.single_flight import single_flight
+from .caching import compress_response, conditional_json
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
+api_bp.after_request(compress_response)
 
 @api_bp.route('/late_fee/<patron_id>/<int:book_id>')
 def get_late_fee(patron_id, book_id):
@@ -13,8 +30,12 @@ def get_late_fee(patron_id, book_id):
     Calculate late fee for a specific book borrowed by a patron.
     API endpoint for R4: Late Fee Calculation
     """
-    result = calculate_late_fee_for_book(patron_id, book_id)
-    return jsonify(result), 501 if 'not implemented' in result.get('status', '') else 200
+    def build():
+        result = calculate_late_fee_for_book(patron_id, book_id)
+        return jsonify(result), 501 if 'not implemented' in result.get('status', '') else 200
+
+    # ETag follows the loan row, so kiosks re-polling an unchanged fee get a 304
+    return conditional_json(get_late_fee_version(patron_id, book_id), build, private=True)
 
 @api_bp.route('/search')
 def search_books_api():
@@ -28,12 +49,152 @@ def search_books_api():
     if not search_term:
         return jsonify({'error': 'Search term is required'}), 400
     
-    # Use business logic function
-    books = search_books_in_catalog(search_term, search_type)
-    
-    return jsonify({
-        'search_term': search_term,
-        'search_type': search_type,
-        'results': books,
-        'count': len(books)
-    })
+    def build():
+        # Use business logic function
+        books = search_books_in_catalog(search_term, search_type)
+        
+        return jsonify({
+            'search_term': search_term,
+            'search_type': search_type,
+            'results': books,
+            'count': len(books)
+        })
+
+    # Results only change when the catalog does
+    return conditional_json((search_term, search_type, get_catalog_version()), build)
+
+@api_bp.route('/suggest')
+def suggest_books_api():
+    """
+    Search-as-you-type suggestions for titles and authors.
+    Returns up to `limit` books whose words start with what the patron typed.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query is required'}), 400
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+
+    suggestions = suggest_books(query, limit)
+    return jsonify({'query': query, 'suggestions': suggestions, 'count': len(suggestions)})
+
+@api_bp.route('/popular')
+def popular_books_api():
+    """
+    Most borrowed books this week, this month or of all time (?window=week|month|all).
+    Served from the in-memory popularity counters, not from the loan history.
+    """
+    window = request.args.get('window', 'week')
+    if window not in WINDOWS:
+        return jsonify({'error': f"window must be one of {', '.join(WINDOWS)}"}), 400
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if not 1 <= limit <= MAX_TOP:
+        return jsonify({'error': f'limit must be between 1 and {MAX_TOP}'}), 400
+
+    books = popular_books(window, limit)
+    return jsonify({'window': window, 'days': WINDOWS[window], 'books': books, 'count': len(books)})
+
+@api_bp.route('/books/<int:book_id>/related')
+def related_books_api(book_id):
+    """
+    Books most often borrowed by the patrons who borrowed this one, best first.
+    Read from the co-borrow index built offline; empty until it has been built.
+    """
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if not 1 <= limit <= NEIGHBOURS:
+        return jsonify({'error': f'limit must be between 1 and {NEIGHBOURS}'}), 400
+
+    books = related_books(book_id, limit)
+    return jsonify({'book_id': book_id, 'related': books, 'count': len(books)})
+
+@api_bp.route('/search/stats')
+def search_cache_stats():
+    """Hit ratio and size of this worker's search result cache."""
+    return jsonify(search_cache.stats())
+
+@api_bp.route('/coalescing/stats')
+def single_flight_stats():
+    """How many of this worker's catalog, search and late-fee reads were shared."""
+    return jsonify(single_flight.stats())
+
+@api_bp.route('/admission/stats')
+def admission_stats():
+    """Admitted and shed circulation requests in this worker, and bucket counts."""
+    control = current_app.extensions.get('admission')
+    if control is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(control.stats(), enabled=True))
+
+@api_bp.route('/deadlines/stats')
+def query_timeout_stats():
+    """Reads this worker aborted at their query deadline, per database helper."""
+    counts = get_query_timeout_counts()
+    return jsonify({'timeouts': counts, 'total': sum(counts.values())})
+
+@api_bp.route('/maintenance/status')
+def maintenance_status():
+    """When each background maintenance task last ran, its duration and the bytes it reclaimed."""
+    return jsonify({'tasks': get_maintenance_state()})
+
+@api_bp.route('/events/stats')
+def event_bus_stats():
+    """Queue depth and written/dropped counts of this worker's analytics event writer."""
+    return jsonify(event_bus.stats())
+
+@api_bp.route('/stream/availability')
+def stream_availability():
+    """
+    Server-sent events with live available_copies for kiosks and the catalog page.
+
+    One `snapshot` event ({"version": ..., "books": [[book_id, available], ...]})
+    followed by `availability` events carrying only the books that changed.
+    A client that falls too far behind gets a fresh snapshot instead. The
+    stream ends after AVAILABILITY_STREAM_MAX_SECONDS and EventSource reconnects.
+    """
+    keepalive = current_app.config['AVAILABILITY_STREAM_KEEPALIVE_SECONDS']
+    max_seconds = current_app.config['AVAILABILITY_STREAM_MAX_SECONDS']
+
+    def event(name, data):
+        return f"event: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+    def snapshot():
+        version, available = availability_feed.snapshot()
+        return event('snapshot', {'version': version, 'books': sorted(available.items())})
+
+    def events():
+        with availability_feed.subscribe() as subscription:
+            deadline = time.monotonic() + max_seconds
+            yield f"retry: {int(keepalive * 1000)}\n\n"
+            yield snapshot()
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                delta = subscription.get(timeout=min(keepalive, remaining))
+                if delta is None:
+                    yield ": keepalive\n\n"
+                    continue
+                if subscription.overflowed:
+                    subscription.overflowed = False
+                    subscription.drain()
+                    yield snapshot()
+                    continue
+                # coalesce whatever queued up while we were writing; the last count wins
+                changes = dict(delta)
+                for more in subscription.drain():
+                    changes.update(more)
+                yield event('availability', sorted(changes.items()))
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
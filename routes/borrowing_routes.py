@@ -3,7 +3,9 @@ Borrowing Routes - Book borrowing and returning endpoints
 """
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash
+from database import get_branches
 from services.library_service import borrow_book_by_patron, return_book_by_patron
+from services.hold_service import place_hold as place_hold_for_patron
 
 borrowing_bp = Blueprint('borrowing', __name__)
 
@@ -21,20 +23,40 @@ def borrow_book():
         flash('Invalid book ID.', 'error')
         return redirect(url_for('catalog.catalog'))
     
-    # Use business logic function
-    success, message = borrow_book_by_patron(patron_id, book_id)
+    # Use business logic function; no branch lends from whichever has a copy
+    success, message = borrow_book_by_patron(patron_id, book_id, request.form.get('branch'))
     
     flash(message, 'success' if success else 'error')
     return redirect(url_for('catalog.catalog'))
 
+@borrowing_bp.route('/hold', methods=['POST'])
+def place_hold():
+    """
+    Place a hold on a checked-out book from the catalog.
+    The copy is set aside when it is returned; see /api/holds/stream.
+    """
+    patron_id = request.form.get('patron_id', '').strip()
+
+    try:
+        book_id = int(request.form.get('book_id', ''))
+    except (ValueError, TypeError):
+        flash('Invalid book ID.', 'error')
+        return redirect(url_for('catalog.catalog'))
+
+    success, message, _ = place_hold_for_patron(patron_id, book_id)
+
+    flash(message, 'success' if success else 'error')
+    return redirect(url_for('catalog.catalog'))
+
 @borrowing_bp.route('/return', methods=['GET', 'POST'])
 def return_book():
     """
     Process book return.
     Web interface for R3: Book Return Processing
     """
+    branches = get_branches()
     if request.method == 'GET':
-        return render_template('return_book.html')
+        return render_template('return_book.html', branches=branches)
     
     patron_id = request.form.get('patron_id', '').strip()
     
@@ -42,10 +64,10 @@ def return_book():
         book_id = int(request.form.get('book_id', ''))
     except (ValueError, TypeError):
         flash('Invalid book ID.', 'error')
-        return render_template('return_book.html')
+        return render_template('return_book.html', branches=branches)
     
     # Use business logic function
-    success, message = return_book_by_patron(patron_id, book_id)
+    success, message = return_book_by_patron(patron_id, book_id, request.form.get('branch'))
     
     flash(message, 'success' if success else 'error')
-    return render_template('return_book.html')
+    return render_template('return_book.html', branches=branches)
@@ -0,0 +1,176 @@
+"""
+Render Cache - Cached page bodies, conditional (ETag) responses and compression
+
+Pages whose content only depends on the catalog (plus a few request values)
+are cached keyed on the catalog version counter from database.py, so any
+write to `books` invalidates them everywhere, including other worker processes.
+"""
+
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Tuple
+
+from flask import Response, current_app, make_response, request, session
+
+from database import get_catalog_version
+from services.single_flight import single_flight
+
+try:  # optional: brotli compresses JSON noticeably better than gzip
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+
+class RenderCache:
+    """Bounded LRU map of cache key -> rendered page body."""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: Hashable, body: str) -> None:
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def init_render_cache(app) -> None:
+    """Attach a render cache to the app and precompile its templates."""
+    app.extensions['render_cache'] = RenderCache(app.config['RENDER_CACHE_SIZE'])
+    if app.config['PRECOMPILE_TEMPLATES']:
+        # Jinja keeps compiled templates in its own cache; loading every template
+        # now moves the compile cost out of the first request for each page.
+        for name in app.jinja_env.list_templates(extensions=['html']):
+            app.jinja_env.get_template(name)
+
+
+def make_etag(*parts: Hashable) -> str:
+    """Build a stable ETag value from key parts."""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def not_modified(etag: str, cache_control: str = 'no-cache') -> Optional[Response]:
+    """Return a 304 response if the client already holds this ETag, else None."""
+    # If-None-Match uses weak comparison, so compressed (weak) variants match too
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def api_cache_control(private: bool = False) -> str:
+    """Cache-Control value for API responses, from the API_CACHE_MAX_AGE setting."""
+    max_age = current_app.config['API_CACHE_MAX_AGE']
+    scope = 'private' if private else 'public'
+    if max_age <= 0:
+        return f'{scope}, no-cache'
+    return f'{scope}, max-age={max_age}'
+
+
+def conditional_json(etag_parts: Tuple, build: Callable[[], Response], *, private: bool = False) -> Response:
+    """
+    Answer with 304 if the client's ETag matches `etag_parts`, else call `build`.
+
+    `build` only runs on a miss, so a revalidating client never pays for the
+    underlying query or JSON serialization.
+    """
+    etag = make_etag(request.endpoint, *etag_parts)
+    cache_control = api_cache_control(private)
+    early = not_modified(etag, cache_control)
+    if early is not None:
+        return early
+    response = make_response(build())
+    if response.status_code == 200:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def compress_response(response: Response) -> Response:
+    """Compress large JSON bodies with brotli or gzip when the client accepts it."""
+    config = current_app.config
+    if (
+        not config['API_COMPRESSION']
+        or response.status_code != 200
+        or response.direct_passthrough
+        or 'Content-Encoding' in response.headers
+        or response.mimetype != 'application/json'
+    ):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < config['API_COMPRESS_MIN_SIZE']:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        response.set_data(brotli.compress(body))
+        response.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        return response
+
+    # the encoded bytes differ from the identity body, so the validator is weak
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def cached_page(key: Tuple, render: Callable[[], str]) -> Response:
+    """
+    Serve a page rendered by `render`, cached on `key` plus the catalog version.
+
+    Pages are rendered fresh (and not cached) when flash messages are waiting in
+    the session, since those are shown once and belong to a single response.
+    """
+    if not current_app.config['RENDER_CACHE'] or session.get('_flashes'):
+        return make_response(render())
+
+    full_key = (request.endpoint, *key, get_catalog_version())
+    etag = make_etag(*full_key)
+    early = not_modified(etag)
+    if early is not None:
+        return early
+
+    cache: RenderCache = current_app.extensions['render_cache']
+    body = cache.get(full_key)
+    if body is None:
+        def render_and_store() -> str:
+            fresh = render()
+            cache.put(full_key, fresh)
+            return fresh
+
+        # a burst of requests for a page that just went stale renders it once
+        body = single_flight.do(('page', *full_key), render_and_store)
+
+    response = make_response(body)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
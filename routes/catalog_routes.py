@@ -3,8 +3,8 @@ Catalog Routes - Book catalog related endpoints
 """
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash
-from database import get_all_books
-from services.library_service import add_book_to_catalog
+from services.library_service import add_book_to_catalog, get_catalog_books
+from .caching import cached_page
 
 catalog_bp = Blueprint('catalog', __name__)
 
@@ -19,8 +19,7 @@ def catalog():
     Display all books in the catalog.
     Implements R2: Book Catalog Display
     """
-    books = get_all_books()
-    return render_template('catalog.html', books=books)
+    return cached_page((), lambda: render_template('catalog.html', books=get_catalog_books()))
 
 @catalog_bp.route('/add_book', methods=['GET', 'POST'])
 def add_book():
@@ -0,0 +1,60 @@
+"""
+Copy Routes - JSON API for physical copies, barcode scans and branches
+"""
+
+from flask import Blueprint, jsonify, request
+
+from database import get_branch_totals
+from services.copy_service import list_copies, lookup_copy, move_copy_to_branch, return_copy
+from .caching import compress_response
+
+copies_bp = Blueprint('copies', __name__, url_prefix='/api')
+copies_bp.after_request(compress_response)
+
+
+@copies_bp.route('/copies/<barcode>')
+def get_copy(barcode):
+    """Resolve a scanned barcode to its copy, book and (if lent) patron."""
+    copy = lookup_copy(barcode)
+    if copy is None:
+        return jsonify({'error': 'Copy not found.'}), 404
+    return jsonify(copy)
+
+
+@copies_bp.route('/copies/<barcode>/return', methods=['POST'])
+def return_scanned_copy(barcode):
+    """Return the loan a scanned copy is out on, at the branch in the optional JSON body."""
+    payload = request.get_json(silent=True) or {}
+    success, message = return_copy(barcode, payload.get('branch'))
+    if success:
+        return jsonify({'message': message})
+    if message.startswith(('Invalid', 'Unknown')):
+        return jsonify({'error': message}), 400
+    return jsonify({'error': message}), 404 if 'not found' in message else 409
+
+
+@copies_bp.route('/copies/<barcode>/transfer', methods=['POST'])
+def transfer_scanned_copy(barcode):
+    """Send a copy on the shelf (or held) to the branch in the JSON body."""
+    payload = request.get_json(silent=True) or {}
+    success, message = move_copy_to_branch(barcode, str(payload.get('branch') or ''))
+    if success:
+        return jsonify({'message': message})
+    if message.startswith(('Invalid', 'Unknown')):
+        return jsonify({'error': message}), 400
+    return jsonify({'error': message}), 404 if 'not found' in message else 409
+
+
+@copies_bp.route('/branches')
+def list_branches():
+    """Every branch with its total and available copies."""
+    return jsonify({'branches': get_branch_totals()})
+
+
+@copies_bp.route('/books/<int:book_id>/copies')
+def get_book_copies(book_id):
+    """Every copy of a book with its barcode and status."""
+    copies = list_copies(book_id)
+    if copies is None:
+        return jsonify({'error': 'Book not found.'}), 404
+    return jsonify({'book_id': book_id, 'copies': copies, 'count': len(copies)})
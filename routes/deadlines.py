@@ -0,0 +1,47 @@
+"""
+Query Deadlines - A time budget for the database reads of each request
+
+Every request gets QUERY_DEADLINE_SECONDS for its reads. database.py aborts a
+statement still running past that point (through SQLite's progress handler)
+and raises QueryTimeoutError, which is answered here with 503 and
+Retry-After instead of pinning the worker on one pathological search or
+patron history.
+"""
+
+from flask import current_app, g, jsonify, make_response, request
+
+from database import QueryTimeoutError, reset_query_deadline, set_query_deadline
+
+# Long-lived event streams read in short bursts for minutes; they are not held
+# to a per-request budget
+STREAMING_ENDPOINTS = {'api.stream_availability', 'holds.stream_holds'}
+
+
+def _start_deadline() -> None:
+    seconds = current_app.config['QUERY_DEADLINE_SECONDS']
+    if seconds and request.endpoint not in STREAMING_ENDPOINTS:
+        g.query_deadline_token = set_query_deadline(seconds)
+
+
+def _clear_deadline(exc=None) -> None:
+    token = g.pop('query_deadline_token', None)
+    if token is not None:
+        reset_query_deadline(token)
+
+
+def _timed_out(error: QueryTimeoutError):
+    message = 'The library system took too long to answer. Please try again.'
+    if request.path.startswith('/api/'):
+        response = make_response(jsonify({'error': message}), 503)
+    else:
+        response = make_response(message, 503)
+        response.mimetype = 'text/plain'
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+def init_query_deadlines(app) -> None:
+    """Give every request's reads QUERY_DEADLINE_SECONDS and answer timeouts with 503."""
+    app.before_request(_start_deadline)
+    app.teardown_request(_clear_deadline)
+    app.register_error_handler(QueryTimeoutError, _timed_out)
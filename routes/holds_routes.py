@@ -0,0 +1,112 @@
+"""
+Hold Routes - JSON API and server-sent event stream for book holds
+"""
+
+import json
+import time
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+
+from services.hold_service import cancel_hold, hold_topic, list_holds, place_hold, ready_holds
+from services.pubsub import pubsub
+from .caching import compress_response
+
+holds_bp = Blueprint('holds', __name__, url_prefix='/api/holds')
+holds_bp.after_request(compress_response)
+
+
+def _error_status(message: str) -> int:
+    if message.startswith('Invalid'):
+        return 400
+    if 'not found' in message:
+        return 404
+    return 409
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str, separators=(',', ':'))}\n\n"
+
+
+@holds_bp.route('', methods=['POST'])
+def create_hold():
+    """
+    Place a hold on a checked-out book.
+    Takes patron_id and book_id as JSON or form fields.
+    """
+    data = request.get_json(silent=True) or request.form
+    patron_id = str(data.get('patron_id', '')).strip()
+    try:
+        book_id = int(data.get('book_id', ''))
+    except (ValueError, TypeError):
+        return jsonify({'error': 'Invalid book ID.'}), 400
+
+    success, message, hold = place_hold(patron_id, book_id)
+    if not success:
+        return jsonify({'error': message}), _error_status(message)
+    return jsonify({'message': message, 'hold': hold}), 201
+
+
+@holds_bp.route('')
+def get_holds():
+    """A patron's waiting and ready holds, with their place in each queue."""
+    patron_id = request.args.get('patron_id', '').strip()
+    if not patron_id.isdigit() or len(patron_id) != 6:
+        return jsonify({'error': 'Invalid patron ID. Must be exactly 6 digits.'}), 400
+    holds = list_holds(patron_id)
+    return jsonify({'patron_id': patron_id, 'holds': holds, 'count': len(holds)})
+
+
+@holds_bp.route('/<int:hold_id>', methods=['DELETE'])
+def delete_hold(hold_id):
+    """Cancel a hold; a copy set aside for it goes to the next patron in line."""
+    patron_id = request.args.get('patron_id', '').strip()
+    success, message = cancel_hold(patron_id, hold_id)
+    if not success:
+        return jsonify({'error': message}), _error_status(message)
+    return jsonify({'message': message})
+
+
+@holds_bp.route('/stream')
+def stream_holds():
+    """
+    Server-sent events: a `hold_ready` event for each of the patron's holds
+    with a copy set aside, first those already ready and then as copies are
+    returned. Replaces polling /catalog for a checked-out book.
+
+    Returns in this worker wake the stream straight away; every
+    HOLD_STREAM_POLL_SECONDS it also re-reads the patron's ready holds, which
+    catches returns handled by other worker processes and doubles as a
+    keepalive. The stream ends after HOLD_STREAM_MAX_SECONDS and the browser's
+    EventSource reconnects.
+    """
+    patron_id = request.args.get('patron_id', '').strip()
+    if not patron_id.isdigit() or len(patron_id) != 6:
+        return jsonify({'error': 'Invalid patron ID. Must be exactly 6 digits.'}), 400
+    poll_seconds = current_app.config['HOLD_STREAM_POLL_SECONDS']
+    max_seconds = current_app.config['HOLD_STREAM_MAX_SECONDS']
+
+    def events():
+        # subscribed before the first read, so a hold made ready in between still wakes us
+        with pubsub.subscribe(hold_topic(patron_id)) as subscription:
+            deadline = time.monotonic() + max_seconds
+            sent = set()
+            yield f"retry: {int(poll_seconds * 1000)}\n\n"
+            while True:
+                fresh = [hold for hold in ready_holds(patron_id) if hold['id'] not in sent]
+                for hold in fresh:
+                    sent.add(hold['id'])
+                    yield _sse('hold_ready', hold)
+                if not fresh:
+                    yield ": keepalive\n\n"
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                # messages are only wake-ups; the database read above is the source of truth
+                if subscription.get(timeout=min(poll_seconds, remaining)) is not None:
+                    subscription.drain()
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
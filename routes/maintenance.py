@@ -0,0 +1,49 @@
+"""
+Maintenance Hooks - Tell the background maintenance scheduler about live traffic
+
+Every request marks this worker busy while it runs, so the scheduler in
+services.maintenance only checkpoints, analyzes or vacuums once the worker
+has been quiet for MAINTENANCE_QUIET_SECONDS, and stops between steps as soon
+as a request comes in. The first request in each worker process also starts
+its scheduler thread, so pre-fork servers get one per worker after the fork.
+"""
+
+from typing import Optional
+
+from flask import g
+
+from services.maintenance import scheduler
+
+
+def _request_started() -> None:
+    scheduler.traffic.started()
+    g.maintenance_traffic = True
+    scheduler.ensure_running()
+
+
+def _request_finished(exc: Optional[BaseException] = None) -> None:
+    # Teardown runs even when an earlier before_request hook (admission
+    # control's 429) answered first and _request_started never counted it
+    if g.pop('maintenance_traffic', False):
+        scheduler.traffic.finished()
+
+
+def init_maintenance(app) -> None:
+    """Configure the maintenance scheduler from the app's MAINTENANCE_* settings and start it."""
+    config = app.config
+    scheduler.configure(
+        enabled=config['MAINTENANCE_ENABLED'],
+        tick=config['MAINTENANCE_TICK_SECONDS'],
+        quiet_seconds=config['MAINTENANCE_QUIET_SECONDS'],
+        window=config['MAINTENANCE_WINDOW'],
+        intervals=config['MAINTENANCE_INTERVALS'],
+        analyze_changes=config['MAINTENANCE_ANALYZE_CHANGES'],
+        checkpoint_wal_bytes=config['MAINTENANCE_CHECKPOINT_WAL_BYTES'],
+        vacuum_free_ratio=config['MAINTENANCE_VACUUM_FREE_RATIO'],
+        vacuum_step_pages=config['MAINTENANCE_VACUUM_STEP_PAGES'],
+    )
+    if not config['MAINTENANCE_ENABLED']:
+        return
+    app.before_request(_request_started)
+    app.teardown_request(_request_finished)
+    scheduler.ensure_running()
@@ -4,6 +4,7 @@ Search Routes - Book search functionality
 
 from flask import Blueprint, render_template, request, flash
 from services.library_service import search_books_in_catalog
+from .caching import cached_page
 
 search_bp = Blueprint('search', __name__)
 
@@ -19,10 +20,13 @@ def search_books():
     if not search_term:
         return render_template('search.html', books=[], search_term='', search_type=search_type)
     
-    # Use business logic function
-    books = search_books_in_catalog(search_term, search_type)
-    
-    if not books:
-        flash('Search functionality is not yet implemented.', 'error')
-    
-    return render_template('search.html', books=books, search_term=search_term, search_type=search_type)
+    def render():
+        # Use business logic function
+        books = search_books_in_catalog(search_term, search_type)
+        
+        if not books:
+            flash('Search functionality is not yet implemented.', 'error')
+        
+        return render_template('search.html', books=books, search_term=search_term, search_type=search_type)
+
+    return cached_page((search_term, search_type), render)
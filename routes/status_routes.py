@@ -2,9 +2,12 @@
 Status Routes - Patron status reporting endpoints
 """
 
+from datetime import date
+
 from flask import Blueprint, render_template, request, flash
 
 from services.library_service import get_patron_status_report
+from .caching import cached_page
 
 status_bp = Blueprint("status", __name__)
 
@@ -15,17 +18,24 @@ def patron_status():
     Display patron status report.
     Web interface for R7: Patron Status Report
     """
-    patron_id = ""
-    report = None
-
     if request.method == "POST":
         patron_id = request.form.get("patron_id", "").strip()
     else:
         patron_id = request.args.get("patron_id", "").strip()
+    # archived loans are only read when the patron asks for their full history
+    full_history = request.values.get("history") == "all"
+
+    def render():
+        report = None
+        if patron_id:
+            report = get_patron_status_report(patron_id, include_archived=full_history)
+            if report.get("status", "").startswith("Invalid patron ID"):
+                flash(report["status"], "error")
+                report = None
+        return render_template(
+            "patron_status.html", patron_id=patron_id, report=report, full_history=full_history
+        )
 
-    if patron_id:
-        report = get_patron_status_report(patron_id)
-        if report.get("status", "").startswith("Invalid patron ID"):
-            flash(report["status"], "error")
-            report = None
-    return render_template("patron_status.html", patron_id=patron_id, report=report)
+    # every borrow and return changes a book's availability and so the catalog
+    # version; late fees also grow by the day
+    return cached_page((patron_id, full_history, date.today().isoformat()), render)
@@ -1,6 +1,15 @@
 """service layer package."""
 
 from . import library_service
-from .payment_service import PaymentGateway, PaymentGatewayError
 
 __all__ = ["library_service", "PaymentGateway", "PaymentGatewayError"]
+
+
+def __getattr__(name: str):
+    # the payment gateway is only used by the fee payment flow, so importing
+    # it is deferred until first access
+    if name in ("PaymentGateway", "PaymentGatewayError"):
+        from . import payment_service
+
+        return getattr(payment_service, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
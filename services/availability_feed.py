@@ -0,0 +1,118 @@
+"""live available_copies per book for the availability event stream."""
+
+from __future__ import annotations
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from database import get_book_availability, get_catalog_stamp
+from services.pubsub import PubSub, Subscription, pubsub
+
+Delta = List[Tuple[int, int]]
+
+
+class AvailabilityFeed:
+    """(book_id, available_copies) deltas published to every stream in this worker.
+
+    changes made by this process arrive through the update_book_availability
+    listener (changed()), which only queues them: one dispatcher thread per
+    process coalesces and publishes them, so the borrow or return that made
+    the change doesn't pay for waking thousands of streams. the same thread
+    catches changes made by other worker processes by re-reading availability
+    when the catalog version has moved, at most every poll_interval seconds,
+    however many streams are open. deltas carry absolute counts, so a change
+    seen by both paths is harmless to apply twice.
+    """
+
+    topic = "availability"
+
+    def __init__(self, hub: PubSub = pubsub, poll_interval: float = 1.0):
+        self.poll_interval = poll_interval
+        self._hub = hub
+        self._lock = threading.Lock()
+        self._stamp: Optional[Tuple[str, int]] = None
+        self._available: Dict[int, int] = {}
+        self._pending: "queue.SimpleQueue[Tuple[int, int]]" = queue.SimpleQueue()
+        self._dispatcher: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def subscribe(self) -> Subscription:
+        """subscribe to deltas; take the snapshot after this so no change falls in between."""
+        subscription = self._hub.subscribe(self.topic)
+        self._ensure_dispatcher()
+        return subscription
+
+    def snapshot(self) -> Tuple[int, Dict[int, int]]:
+        """current catalog version and available copies of every book."""
+        self.refresh()
+        with self._lock:
+            return self._stamp[1], dict(self._available)
+
+    def changed(self, book_id: int, available_copies: int) -> None:
+        """listener for update_book_availability."""
+        with self._lock:
+            if self._stamp is not None:
+                self._available[book_id] = available_copies
+            # under the lock the dispatcher swaps _pending with, or this could
+            # land in the queue it is discarding
+            if self._hub.subscriber_count(self.topic):
+                self._pending.put((book_id, available_copies))
+
+    def refresh(self) -> Delta:
+        """re-read availability if the catalog version moved and publish what changed."""
+        stamp = get_catalog_stamp()
+        with self._lock:
+            if stamp == self._stamp:
+                return []
+        rows = get_book_availability()
+        with self._lock:
+            first_load = self._stamp is None or self._stamp[0] != stamp[0]
+            changes = [(book_id, count) for book_id, count in rows if self._available.get(book_id) != count]
+            self._available = dict(rows)
+            self._stamp = stamp
+        if changes and not first_load:
+            self._hub.publish(self.topic, changes)
+        return changes
+
+    def _ensure_dispatcher(self) -> None:
+        with self._lock:
+            if self._dispatcher is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._dispatcher = threading.Thread(target=self._run, name="availability-feed", daemon=True)
+            self._dispatcher.start()
+
+    def _run(self) -> None:
+        polled = time.monotonic()
+        while True:
+            # coalesce a burst of writes; the last count for a book wins
+            changes: Dict[int, int] = {}
+            try:
+                changes.update([self._pending.get(timeout=self.poll_interval)])
+                while True:
+                    changes.update([self._pending.get_nowait()])
+            except queue.Empty:
+                pass
+            if changes:
+                self._hub.publish(self.topic, sorted(changes.items()))
+            if time.monotonic() - polled < self.poll_interval:
+                continue
+            polled = time.monotonic()
+            with self._lock:
+                # checked under the lock so a subscriber arriving now restarts us
+                if not self._hub.subscriber_count(self.topic):
+                    self._dispatcher = None
+                    self._pending = queue.SimpleQueue()
+                    return
+            try:
+                self.refresh()
+            except sqlite3.Error:
+                pass
+
+availability_feed = AvailabilityFeed()
+
+__all__ = ["AvailabilityFeed", "availability_feed"]
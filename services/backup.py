@@ -0,0 +1,296 @@
+"""online snapshots of every database file with the sqlite backup API, taken in small paced steps."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import database
+from services.maintenance import maintenance_files
+
+log = logging.getLogger(__name__)
+
+BACKUP_DIR = "backups"
+# complete snapshots kept; older ones are deleted after each new snapshot
+KEEP = 7
+# pages copied per backup step, and the pause between steps
+STEP_PAGES = 256
+STEP_SLEEP = 0.05
+
+MANIFEST = "manifest.json"
+_PARTIAL = ".partial"
+
+
+class BackupError(Exception):
+    """raised when a snapshot is missing or fails verification."""
+
+
+def _stamp(path: str) -> List[Optional[int]]:
+    # any committed write moves the size or mtime of the file or its -wal; an
+    # empty -wal (as opening a connection leaves behind) holds nothing
+    stamp = []
+    for name in (path, path + "-wal"):
+        try:
+            st = os.stat(name)
+        except FileNotFoundError:
+            st = None
+        stamp += [st.st_mtime_ns, st.st_size] if st and st.st_size else [None, None]
+    return stamp
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _open_snapshot_file(path: Path) -> sqlite3.Connection:
+    # immutable: reading a snapshot never creates -wal/-shm files beside it
+    return sqlite3.connect(f"{path.resolve().as_uri()}?immutable=1", uri=True)
+
+
+def copy_online(source: str, target: Path, pages: int, sleep: float) -> int:
+    """copy the database at source to target without blocking its writers; returns pages copied.
+
+    the source connection pins one read snapshot for the whole copy. without it
+    every commit from a live worker restarts the backup from page one, and a
+    paced copy of a busy database never finishes. in WAL mode the pinned
+    snapshot doesn't block writers, it only holds back checkpoints until the
+    copy is done.
+    """
+    src = sqlite3.connect(database._file_uri(source, read_only=True), uri=True,
+                          timeout=database.BUSY_TIMEOUT, isolation_level=None)
+    dst = sqlite3.connect(target)
+    try:
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        src.backup(dst, pages=pages, progress=lambda status, remaining, total: time.sleep(sleep))
+        src.execute("COMMIT")
+        # a self-contained rollback-journal file, readable and restorable on its own
+        dst.execute("PRAGMA journal_mode=DELETE")
+        return dst.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        dst.close()
+        src.close()
+
+
+def list_snapshots(backup_dir: Optional[str] = None) -> List[Dict]:
+    """manifests of the complete snapshots in backup_dir, oldest first."""
+    root = Path(backup_dir or BACKUP_DIR)
+    if not root.is_dir():
+        return []
+    manifests = []
+    for entry in sorted(root.iterdir()):
+        if entry.name.endswith(_PARTIAL) or not (entry / MANIFEST).is_file():
+            continue
+        manifests.append(json.loads((entry / MANIFEST).read_text()))
+    return manifests
+
+
+def create_snapshot(
+    backup_dir: Optional[str] = None,
+    pages: Optional[int] = None,
+    sleep: Optional[float] = None,
+    keep: Optional[int] = None,
+) -> Dict:
+    """snapshot every database file into a new directory under backup_dir; returns its manifest.
+
+    files unchanged since the previous snapshot are hard-linked from it
+    instead of copied again, so archives and idle shards cost no extra space.
+    each snapshot is written to a .partial directory, verified, then
+    renamed, so a crash never leaves something that looks complete.
+    """
+    root = Path(backup_dir or BACKUP_DIR)
+    pages = pages or STEP_PAGES
+    sleep = STEP_SLEEP if sleep is None else sleep
+    keep = KEEP if keep is None else keep
+
+    started = time.perf_counter()
+    name = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    partial = root / (name + _PARTIAL)
+    partial.mkdir(parents=True)
+    previous = (list_snapshots(str(root)) or [None])[-1]
+    previous_files = {entry["name"]: entry for entry in previous["files"]} if previous else {}
+
+    files = []
+    try:
+        for path in maintenance_files():
+            file_name = os.path.basename(path)
+            stamp = _stamp(path)
+            old = previous_files.get(file_name)
+            if old is not None and old["source_stamp"] == stamp:
+                try:
+                    os.link(root / previous["name"] / file_name, partial / file_name)
+                except OSError:
+                    shutil.copyfile(root / previous["name"] / file_name, partial / file_name)
+                files.append(dict(old, linked=True))
+                continue
+            copied = copy_online(path, partial / file_name, pages, sleep)
+            files.append({
+                "name": file_name,
+                "pages": copied,
+                "bytes": (partial / file_name).stat().st_size,
+                "sha256": _sha256(partial / file_name),
+                "source_stamp": stamp,
+                "linked": False,
+            })
+        manifest = {
+            "name": name,
+            "created": datetime.now().isoformat(),
+            "primary": os.path.basename(database.DATABASE),
+            "seconds": round(time.perf_counter() - started, 3),
+            "files": files,
+        }
+        (partial / MANIFEST).write_text(json.dumps(manifest, indent=2))
+        problems = _verify_dir(partial, manifest)
+        if problems:
+            raise BackupError(f"snapshot {name} failed verification: {'; '.join(problems)}")
+        partial.rename(root / name)
+    except BaseException:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+
+    removed = prune_snapshots(keep, str(root))
+    copied = [entry for entry in files if not entry["linked"]]
+    log.info(
+        "backup %s: copied %d file(s) (%d bytes), linked %d unchanged, %.2fs, pruned %d old snapshot(s)",
+        name, len(copied), sum(entry["bytes"] for entry in copied), len(files) - len(copied),
+        manifest["seconds"], len(removed),
+    )
+    return manifest
+
+
+def prune_snapshots(keep: int, backup_dir: Optional[str] = None) -> List[str]:
+    """delete all but the newest keep snapshots; returns the names deleted."""
+    root = Path(backup_dir or BACKUP_DIR)
+    snapshots = list_snapshots(str(root))
+    doomed = [manifest["name"] for manifest in snapshots[:max(0, len(snapshots) - keep)]]
+    for name in doomed:
+        # newer snapshots hard-linking the same files keep their own link
+        shutil.rmtree(root / name)
+    return doomed
+
+
+def _verify_dir(directory: Path, manifest: Dict) -> List[str]:
+    problems = []
+    for entry in manifest["files"]:
+        path = directory / entry["name"]
+        if not path.is_file():
+            problems.append(f"{entry['name']} is missing")
+            continue
+        if _sha256(path) != entry["sha256"]:
+            problems.append(f"{entry['name']} checksum mismatch")
+            continue
+        conn = _open_snapshot_file(path)
+        try:
+            result = conn.execute("PRAGMA quick_check").fetchone()[0]
+        except sqlite3.DatabaseError as e:
+            result = str(e)
+        finally:
+            conn.close()
+        if result != "ok":
+            problems.append(f"{entry['name']} is corrupt: {result}")
+    return problems
+
+
+def _catalog_state(conn: sqlite3.Connection) -> Tuple[int, int]:
+    # (version, restores) of a primary file; zero for what an older one lacks
+    for query in ("SELECT version, restores FROM catalog_state WHERE id = 1",
+                  "SELECT version, 0 FROM catalog_state WHERE id = 1"):
+        try:
+            row = conn.execute(query).fetchone()
+        except sqlite3.OperationalError:
+            continue
+        return (row[0], row[1]) if row else (0, 0)
+    return 0, 0
+
+
+def _mark_restored(path: str, live: Tuple[int, int]) -> None:
+    # a snapshot from an older release first catches up on migrations, as it would when a worker starts
+    database._apply_migrations(sqlite3.connect(path, timeout=database.BUSY_TIMEOUT), database._MIGRATIONS)
+    conn = sqlite3.connect(path, timeout=database.BUSY_TIMEOUT)
+    try:
+        # move the catalog version past anything workers have cached pages under, and
+        # count the restore so their in-memory catalog indexes rebuild instead of syncing forward
+        conn.execute("UPDATE catalog_state SET version = MAX(version, ?) + 1, restores = MAX(restores, ?) + 1"
+                     " WHERE id = 1", live)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _load_manifest(name: str, backup_dir: Optional[str]) -> Dict:
+    directory = Path(backup_dir or BACKUP_DIR) / name
+    try:
+        return json.loads((directory / MANIFEST).read_text())
+    except FileNotFoundError:
+        raise BackupError(f"no snapshot named {name}") from None
+
+
+def verify_snapshot(name: str, backup_dir: Optional[str] = None) -> List[str]:
+    """check a snapshot's files against its manifest checksums and sqlite's quick_check; [] if sound."""
+    return _verify_dir(Path(backup_dir or BACKUP_DIR) / name, _load_manifest(name, backup_dir))
+
+
+def unrestored_files(name: str, backup_dir: Optional[str] = None) -> List[str]:
+    """live database files (loan shards, archives) that snapshot name has no copy of."""
+    names = {entry["name"] for entry in _load_manifest(name, backup_dir)["files"]}
+    return [path for path in maintenance_files()
+            if path != database.DATABASE and os.path.basename(path) not in names]
+
+
+def restore_snapshot(name: str, backup_dir: Optional[str] = None) -> List[str]:
+    """verify a snapshot, then copy each of its files back over the live database; returns paths restored.
+
+    the copy goes through the backup API into the live file, so it is one
+    write transaction per file that running workers simply see as new data.
+    library.db is restored last, after the loan shards and archives. live
+    shards and archives the snapshot has no copy of are left as they are and
+    logged as a warning (see unrestored_files): they hold loans from after it.
+    """
+    manifest = _load_manifest(name, backup_dir)
+    directory = Path(backup_dir or BACKUP_DIR) / name
+    problems = _verify_dir(directory, manifest)
+    if problems:
+        raise BackupError(f"snapshot {name} failed verification: {'; '.join(problems)}")
+
+    live_dir = os.path.dirname(database.DATABASE)
+    entries = sorted(manifest["files"], key=lambda entry: entry["name"] == manifest["primary"])
+    restored = []
+    for entry in entries:
+        if entry["name"] == manifest["primary"]:
+            target = database.DATABASE
+        else:
+            target = os.path.join(live_dir, entry["name"])
+        src = _open_snapshot_file(directory / entry["name"])
+        dst = sqlite3.connect(target, timeout=database.BUSY_TIMEOUT)
+        try:
+            live = _catalog_state(dst)
+            src.backup(dst)
+            dst.execute("PRAGMA journal_mode=WAL")
+        finally:
+            dst.close()
+            src.close()
+        if target == database.DATABASE:
+            _mark_restored(target, live)
+        restored.append(target)
+    log.info("restored snapshot %s: %s", name, ", ".join(restored))
+    stray = unrestored_files(name, backup_dir)
+    if stray:
+        log.warning("snapshot %s has no copy of %s; left in place, move them aside if they should go",
+                    name, ", ".join(stray))
+    return restored
+
+
+__all__ = ["BackupError", "copy_online", "create_snapshot", "list_snapshots", "prune_snapshots",
+           "restore_snapshot", "unrestored_files", "verify_snapshot"]
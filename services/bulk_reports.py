@@ -0,0 +1,136 @@
+"""bulk patron status reports for the weekly notice run."""
+
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from database import iter_loans_by_patron
+from services.library_service import build_patron_status_report
+
+PatronLoans = Tuple[str, List[Dict]]
+
+FORMATS = ("jsonl", "files")
+
+
+def render_notice(report: Dict) -> str:
+    """plain-text notice body for one patron's status report."""
+    lines = [f"Library account {report['patron_id']}", ""]
+    if report["current_loans"]:
+        lines.append("Books you have out:")
+        for loan in report["current_loans"]:
+            state = f"OVERDUE, late fee ${loan['late_fee']:.2f}" if loan["is_overdue"] else "on time"
+            lines.append(f"  - {loan['title']} by {loan['author']}, due {loan['due_date']:%Y-%m-%d} ({state})")
+    else:
+        lines.append("You have no books out.")
+    lines += ["", f"Total late fees: ${report['total_late_fees']:.2f}", ""]
+    return "\n".join(lines)
+
+
+def render_reports(chunk: List[PatronLoans], now: datetime, output_format: str) -> List[Tuple[str, str]]:
+    """build and render reports for a chunk of patrons; runs in pool workers."""
+    rendered = []
+    for patron_id, records in chunk:
+        report = build_patron_status_report(patron_id, records, now)
+        if output_format == "jsonl":
+            rendered.append((patron_id, json.dumps(report, default=str, separators=(",", ":"))))
+        else:
+            rendered.append((patron_id, render_notice(report)))
+    return rendered
+
+
+def _chunks(groups: Iterable[PatronLoans], size: int) -> Iterator[List[PatronLoans]]:
+    groups = iter(groups)
+    while True:
+        chunk = list(islice(groups, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def generate_reports(
+    output: str,
+    output_format: str = "jsonl",
+    workers: Optional[int] = None,
+    chunk_size: int = 500,
+    active_only: bool = True,
+    progress: Optional[Callable[[int, float], None]] = None,
+) -> Dict:
+    """write a status report for every patron with an open loan.
+
+    patrons stream out of one ordered scan per loan shard (iter_loans_by_patron)
+    in chunks of chunk_size; fees and rendering run on a pool of worker
+    processes, at most two chunks per worker in flight so memory stays
+    bounded. output is a .jsonl file, or a directory of <patron_id>.txt
+    notices for output_format="files". workers=0 or 1 renders in-process.
+    progress(patrons_done, patrons_per_second) is called after each chunk.
+    """
+    if output_format not in FORMATS:
+        raise ValueError(f"output_format must be one of {', '.join(FORMATS)}")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    now = datetime.now()
+    started = time.perf_counter()
+    patrons = loans = 0
+
+    if output_format == "files":
+        os.makedirs(output, exist_ok=True)
+        jsonl = None
+    else:
+        jsonl = open(output, "w", encoding="utf-8")
+
+    def write(rendered: List[Tuple[str, str]]) -> None:
+        nonlocal patrons
+        for patron_id, text in rendered:
+            if jsonl is not None:
+                jsonl.write(text + "\n")
+            else:
+                with open(os.path.join(output, f"{patron_id}.txt"), "w", encoding="utf-8") as notice:
+                    notice.write(text)
+        patrons += len(rendered)
+        if progress:
+            progress(patrons, patrons / max(time.perf_counter() - started, 1e-9))
+
+    def counted(chunks: Iterator[List[PatronLoans]]) -> Iterator[List[PatronLoans]]:
+        nonlocal loans
+        for chunk in chunks:
+            loans += sum(len(records) for _, records in chunk)
+            yield chunk
+
+    chunks = counted(_chunks(iter_loans_by_patron(active_only), chunk_size))
+    try:
+        if workers <= 1:
+            for chunk in chunks:
+                write(render_reports(chunk, now, output_format))
+        else:
+            # spawn: the app may be running threads (event writer), which fork doesn't copy safely
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                pending: Deque[Future] = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(render_reports, chunk, now, output_format))
+                    if len(pending) >= 2 * workers:
+                        write(pending.popleft().result())
+                while pending:
+                    write(pending.popleft().result())
+    finally:
+        if jsonl is not None:
+            jsonl.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "patrons": patrons,
+        "loans": loans,
+        "seconds": round(elapsed, 3),
+        "patrons_per_second": round(patrons / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+__all__ = ["FORMATS", "generate_reports", "render_notice", "render_reports"]
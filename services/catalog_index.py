@@ -0,0 +1,105 @@
+"""in-memory catalog indexes kept in step with the books table."""
+
+from __future__ import annotations
+
+import re
+import threading
+import unicodedata
+from abc import ABC, abstractmethod
+from typing import Dict, Hashable, Iterable, List, Optional
+
+from database import get_books_after, get_catalog_restores, get_catalog_stamp
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize_text(text: str) -> str:
+    """lowercase and strip accents so "Émile" and "emile" index the same."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(normalize_text(text))
+
+
+class CatalogIndex(ABC):
+    """base for per-worker indexes over book titles and authors.
+
+    books are only ever appended to the catalog (titles and authors are never
+    edited), so an index stays current by loading rows with ids above the
+    highest one it has seen. that check only runs when the catalog stamp has
+    moved, which costs one single-row query per lookup. restoring a snapshot
+    is the one way books disappear, so a moved restore count rebuilds instead.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._stamp: Optional[Hashable] = None
+        self._database: Optional[str] = None
+        self._restores = 0
+        self._last_id = 0
+        self.books: Dict[int, Dict] = {}
+        self._reset()
+
+    # subclass hooks
+
+    @abstractmethod
+    def _reset(self) -> None:
+        """drop every indexed book."""
+
+    @abstractmethod
+    def _add(self, book: Dict) -> None:
+        """index one book (a dict with id, title, author)."""
+
+    def _load(self, books: List[Dict]) -> None:
+        """bulk load; subclasses can override with something faster than _add per book."""
+        for book in books:
+            self._add(book)
+
+    # public api
+
+    def load(self, books: Iterable[Dict]) -> None:
+        """replace the index contents with `books` (dicts with id, title, author)."""
+        rows = [{"id": b["id"], "title": b["title"], "author": b["author"]} for b in books]
+        with self._lock:
+            self.books = {row["id"]: row for row in rows}
+            self._last_id = max(self.books, default=0)
+            self._reset()
+            self._load(rows)
+
+    def add_book(self, book: Dict) -> None:
+        with self._lock:
+            if book["id"] in self.books:
+                return
+            row = {"id": book["id"], "title": book["title"], "author": book["author"]}
+            self.books[row["id"]] = row
+            self._last_id = max(self._last_id, row["id"])
+            self._add(row)
+
+    def rebuild(self) -> None:
+        """load the whole catalog from the database."""
+        with self._lock:
+            stamp = get_catalog_stamp()
+            self._restores = get_catalog_restores()
+            self.load(get_books_after(0))
+            self._stamp = stamp
+            self._database = stamp[0]
+
+    def sync(self) -> None:
+        """bring the index up to date with the database, incrementally where possible."""
+        stamp = get_catalog_stamp()
+        if stamp == self._stamp:
+            return
+        with self._lock:
+            if stamp == self._stamp:
+                return
+            if stamp[0] != self._database or get_catalog_restores() != self._restores:
+                self.rebuild()
+                return
+            for book in get_books_after(self._last_id):
+                self.add_book(book)
+            self._stamp = stamp
+
+    def __len__(self) -> int:
+        return len(self.books)
@@ -0,0 +1,79 @@
+"""physical copies and branches: barcode lookups, returns by scanning a copy, transfers."""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from database import (
+    get_book_by_id,
+    get_book_copies,
+    get_branch_by_code,
+    get_copy_by_barcode,
+    insert_branch,
+    transfer_copy,
+)
+from services.library_service import return_book_by_patron
+
+
+def _is_valid_barcode(barcode: str) -> bool:
+    return bool(barcode and barcode.isdigit() and len(barcode) <= 32)
+
+
+def lookup_copy(barcode: str) -> Optional[Dict]:
+    """the copy with this barcode and its book (title, author, isbn), or None."""
+    if not _is_valid_barcode(barcode):
+        return None
+    return get_copy_by_barcode(barcode)
+
+
+def list_copies(book_id: int) -> Optional[List[Dict]]:
+    """every copy of a book, or None if there's no such book."""
+    if not get_book_by_id(book_id):
+        return None
+    return get_book_copies(book_id)
+
+
+def return_copy(barcode: str, branch: Optional[str] = None) -> Tuple[bool, str]:
+    """return whatever loan the scanned copy is out on, at branch (a code) if given."""
+    if not _is_valid_barcode(barcode):
+        return False, "Invalid barcode."
+    copy = get_copy_by_barcode(barcode)
+    if copy is None:
+        return False, "Copy not found."
+    if copy["status"] != "on_loan" or copy["patron_id"] is None:
+        return False, "This copy is not out on a loan; return it with the patron ID and book."
+    return return_book_by_patron(copy["patron_id"], copy["book_id"], branch, copy_id=copy["id"])
+
+
+def move_copy_to_branch(barcode: str, branch: str) -> Tuple[bool, str]:
+    """send a copy that isn't out on loan to another branch (by code)."""
+    if not _is_valid_barcode(barcode):
+        return False, "Invalid barcode."
+    target = get_branch_by_code(branch.strip()) if branch and branch.strip() else None
+    if target is None:
+        return False, "Unknown branch."
+    copy = get_copy_by_barcode(barcode)
+    if copy is None:
+        return False, "Copy not found."
+    if transfer_copy(copy["id"], target["id"], datetime.now()) is None:
+        return False, "This copy is out on loan; return it at the branch instead."
+    return True, f'Copy {barcode} of "{copy["title"]}" is now at {target["code"]}.'
+
+
+def add_branch(code: str, name: str) -> Tuple[bool, str]:
+    """open a branch; its code (letters and digits, stored upper-case) labels it everywhere."""
+    code = (code or "").strip().upper()
+    name = (name or "").strip()
+    if not code or not code.isalnum() or len(code) > 10:
+        return False, "Branch code must be 1-10 letters or digits."
+    if not name or len(name) > 100:
+        return False, "Branch name is required (max 100 characters)."
+    if get_branch_by_code(code):
+        return False, "A branch with this code already exists."
+    if not insert_branch(code, name):
+        return False, "Database error occurred while adding the branch."
+    return True, f"Branch {code} ({name}) added."
+
+
+__all__ = ["add_branch", "list_copies", "lookup_copy", "move_copy_to_branch", "return_copy"]
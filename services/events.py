@@ -0,0 +1,245 @@
+"""write-behind event bus for borrow, return and payment analytics events."""
+
+from __future__ import annotations
+
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import database
+
+DROP_POLICIES = ("block", "drop_newest", "drop_oldest")
+
+Event = Tuple[str, str, str]
+
+
+class EventBus:
+    """bounded in-process queue drained into the events table by a background thread.
+
+    publish() never touches the database: it stamps the event and enqueues it.
+    a daemon writer takes up to batch_size events, lingering at most
+    flush_interval seconds after the first one for more to arrive, and writes
+    them with one insert_events transaction (a group commit). nothing reads
+    its counts from the events: borrows add to the popularity counters
+    themselves, so a dropped event loses only its row here. when the queue is
+    full the drop policy decides: "block" makes the publisher wait up to
+    block_timeout for room (back-pressure), "drop_newest" discards the new event
+    and "drop_oldest" discards the oldest queued one. either way dropped events
+    are counted, never raised to the request.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = 10_000,
+        batch_size: int = 500,
+        flush_interval: float = 0.2,
+        drop_policy: str = "drop_newest",
+        block_timeout: float = 0.05,
+        enabled: bool = True,
+    ):
+        self.enabled = enabled
+        self._queue: "queue.Queue[Event]" = queue.Queue(max_queue)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._flushing = threading.Event()
+        self._pid: Optional[int] = None
+        self.configure(
+            enabled=enabled,
+            max_queue=max_queue,
+            batch_size=batch_size,
+            flush_interval=flush_interval,
+            drop_policy=drop_policy,
+            block_timeout=block_timeout,
+        )
+        self.published = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.failed = 0
+
+    def configure(
+        self,
+        *,
+        enabled: bool,
+        max_queue: int,
+        batch_size: int,
+        flush_interval: float,
+        drop_policy: str,
+        block_timeout: float,
+    ) -> None:
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"drop_policy must be one of {', '.join(DROP_POLICIES)}")
+        if max_queue < 1 or batch_size < 1:
+            raise ValueError("max_queue and batch_size must be positive")
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+        if self._queue.maxsize != max_queue:
+            # events already queued are written before the queue is swapped
+            self.flush()
+            self._queue = queue.Queue(max_queue)
+
+    def publish(self, kind: str, **payload) -> bool:
+        """queue an event; returns False if the bus is off or the event was dropped."""
+        if not self.enabled:
+            return False
+        self._ensure_writer()
+        event = (kind, datetime.now().isoformat(), json.dumps(payload, default=str, separators=(",", ":")))
+        if not self._offer(event):
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.published += 1
+        return True
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """wait until every queued event is written; False if timeout ran out first."""
+        if not self._writer_alive():
+            self._drain()
+            return True
+        done = self._queue.all_tasks_done
+        deadline = time.monotonic() + timeout
+        # cut the writer's linger short instead of waiting out flush_interval
+        self._flushing.set()
+        try:
+            with done:
+                while self._queue.unfinished_tasks:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not done.wait(remaining):
+                        return False
+            return True
+        finally:
+            self._flushing.clear()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """stop the writer and write whatever is still queued (the shutdown hook)."""
+        thread = self._thread
+        if self._writer_alive():
+            self._stopping.set()
+            thread.join(timeout)
+        self._thread = None
+        self._drain()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "published": self.published,
+                "written": self.written,
+                "dropped": self.dropped,
+                "batches": self.batches,
+                "failed_batches": self.failed,
+                "queued": self._queue.qsize(),
+                "max_queue": self._queue.maxsize,
+                "drop_policy": self.drop_policy,
+            }
+
+    def _offer(self, event: Event) -> bool:
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            pass
+        if self.drop_policy == "block":
+            try:
+                self._queue.put(event, timeout=self.block_timeout)
+                return True
+            except queue.Full:
+                return False
+        if self.drop_policy == "drop_oldest":
+            try:
+                self._queue.get_nowait()
+                self._queue.task_done()
+                with self._lock:
+                    self.dropped += 1
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(event)
+                return True
+            except queue.Full:
+                return False
+        return False
+
+    def _writer_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+
+    def _ensure_writer(self) -> None:
+        if self._writer_alive():
+            return
+        with self._lock:
+            if self._writer_alive():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # forked worker: the parent's queue and writer thread didn't come along
+                self._queue = queue.Queue(self._queue.maxsize)
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            source = self._queue
+            batch = self._collect(source)
+            if batch:
+                self._write(batch)
+                for _ in batch:
+                    source.task_done()
+
+    def _collect(self, source: "queue.Queue[Event]") -> List[Event]:
+        try:
+            batch = [source.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        linger_until = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(source.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = linger_until - time.monotonic()
+            if remaining <= 0 or self._stopping.is_set() or self._flushing.is_set():
+                break
+            try:
+                batch.append(source.get(timeout=min(remaining, 0.01)))
+            except queue.Empty:
+                pass
+        return batch
+
+    def _drain(self) -> None:
+        while True:
+            batch: List[Event] = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, batch: List[Event]) -> None:
+        ok = database.insert_events(batch)
+        with self._lock:
+            self.batches += 1
+            if ok:
+                self.written += len(batch)
+            else:
+                self.failed += 1
+
+
+event_bus = EventBus()
+
+__all__ = ["DROP_POLICIES", "EventBus", "event_bus"]
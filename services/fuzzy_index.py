@@ -0,0 +1,137 @@
+"""trigram index for typo-tolerant (fuzzy) title and author search."""
+
+from __future__ import annotations
+
+import heapq
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from services.catalog_index import CatalogIndex, tokenize
+
+# at most this many ids (the newest) are read from any one trigram's posting
+# list. common trigrams ("the", "ing") would otherwise make query cost grow
+# with the catalog; for words that common, any few thousand matches will do.
+MAX_POSTINGS_PER_TRIGRAM = 5_000
+# how many trigram-overlap candidates get the (more expensive) edit distance check
+MAX_CANDIDATES = 200
+MAX_RESULTS = 50
+
+
+def trigrams(word: str) -> Set[str]:
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def allowed_typos(word: str) -> int:
+    """edits tolerated in one query word: none for very short words, then one per 4 letters."""
+    if len(word) <= 2:
+        return 0
+    return max(1, len(word) // 4)
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """edit distance between a and b, or limit + 1 once it must exceed limit.
+
+    counts insertions, deletions, substitutions and swaps of adjacent letters
+    (optimal string alignment), since "geroge" is one slip, not two.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before_previous: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i, ch_a in enumerate(a, 1):
+        current = [i]
+        for j, ch_b in enumerate(b, 1):
+            cost = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ch_a != ch_b),
+            )
+            if i > 1 and j > 1 and ch_a == b[j - 2] and a[i - 2] == ch_b:
+                cost = min(cost, before_previous[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before_previous, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class FuzzyIndex(CatalogIndex):
+    """inverted index of word trigrams -> book ids, ranked by edit distance.
+
+    posting lists are machine-int arrays appended in id order. a query counts
+    trigram overlap per book over (the newest part of) the posting lists of its
+    words, keeps the best MAX_CANDIDATES and ranks those by how many edits each
+    query word is from its closest title or author word.
+    """
+
+    def _reset(self) -> None:
+        self._postings: Dict[str, array] = defaultdict(lambda: array("q"))
+        self._words: Dict[int, Tuple[str, ...]] = {}
+
+    def _add(self, book: Dict) -> None:
+        words = tuple(dict.fromkeys(tokenize(f"{book['title']} {book['author']}")))
+        self._words[book["id"]] = words
+        grams = set()
+        for word in words:
+            grams |= trigrams(word)
+        for gram in grams:
+            self._postings[gram].append(book["id"])
+
+    def search(self, query: str, limit: int = 20) -> List[int]:
+        """ids of books matching every query word within its typo allowance, best first."""
+        query_words = list(dict.fromkeys(tokenize(query)))
+        if not query_words:
+            return []
+        limit = max(1, min(limit, MAX_RESULTS))
+
+        with self._lock:
+            overlap: Counter = Counter()
+            for word in query_words:
+                for gram in trigrams(word):
+                    postings = self._postings.get(gram)
+                    if postings is not None:
+                        overlap.update(postings[-MAX_POSTINGS_PER_TRIGRAM:])
+            candidates = heapq.nlargest(MAX_CANDIDATES, overlap.items(), key=lambda item: item[1])
+
+            # catalog words repeat a lot across candidates, so each distinct
+            # (query word, book word) pair is only measured once per query
+            distances: Dict[Tuple[str, str], int] = {}
+            ranked = []
+            for book_id, shared in candidates:
+                distance = self._distance(query_words, self._words[book_id], distances)
+                if distance is not None:
+                    ranked.append((distance, -shared, book_id))
+        ranked.sort()
+        return [book_id for _, _, book_id in ranked[:limit]]
+
+    @staticmethod
+    def _distance(
+        query_words: List[str],
+        book_words: Tuple[str, ...],
+        memo: Dict[Tuple[str, str], int],
+    ) -> Optional[int]:
+        """total edits from query words to their closest book words, None if any word is too far."""
+        total = 0
+        for word in query_words:
+            limit = allowed_typos(word)
+            best = limit + 1
+            for candidate in book_words:
+                key = (word, candidate)
+                distance = memo.get(key)
+                if distance is None:
+                    distance = memo[key] = edit_distance(word, candidate, limit)
+                if distance < best:
+                    best = distance
+                    if best == 0:
+                        break
+            if best > limit:
+                return None
+            total += best
+        return total
+
+
+fuzzy_index = FuzzyIndex()
+
+__all__ = ["FuzzyIndex", "edit_distance", "fuzzy_index", "trigrams"]
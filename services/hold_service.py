@@ -0,0 +1,160 @@
+"""holds (reservations) on checked-out books and next-in-line dispatch of returned copies."""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from database import (
+    assign_next_hold,
+    get_active_borrow_record,
+    get_book_by_id,
+    get_expired_holds,
+    get_hold,
+    get_open_hold,
+    get_patron_holds,
+    insert_hold,
+    pass_on_held_copy,
+    update_book_availability,
+    update_hold_status,
+)
+from services.events import event_bus
+from services.pubsub import pubsub
+
+# how long a copy set aside for a ready hold waits for pickup
+HOLD_PICKUP_DAYS = 3
+MAX_OPEN_HOLDS = 5
+
+
+def _is_valid_patron_id(patron_id: str) -> bool:
+    return bool(patron_id and patron_id.isdigit() and len(patron_id) == 6)
+
+
+def hold_topic(patron_id: str) -> str:
+    """pubsub topic a patron's hold stream listens on."""
+    return f"holds:{patron_id}"
+
+
+def place_hold(patron_id: str, book_id: int) -> Tuple[bool, str, Optional[Dict]]:
+    """queue patron for the next returned copy of a checked-out book."""
+    if not _is_valid_patron_id(patron_id):
+        return False, "Invalid patron ID. Must be exactly 6 digits.", None
+
+    book = get_book_by_id(book_id)
+    if not book:
+        return False, "Book not found.", None
+    if book["available_copies"] > 0:
+        return False, "This book is available; borrow it instead of placing a hold.", None
+    if get_active_borrow_record(patron_id, book_id):
+        return False, "You already have this book borrowed.", None
+    if get_open_hold(patron_id, book_id):
+        return False, "You already have a hold on this book.", None
+
+    holds = get_patron_holds(patron_id)
+    if len(holds) >= MAX_OPEN_HOLDS:
+        return False, f"You have reached the maximum of {MAX_OPEN_HOLDS} holds.", None
+
+    # the unique open-hold index settles a double submit that raced past the check above
+    if not insert_hold(patron_id, book_id, datetime.now()):
+        return False, "Database error occurred while placing the hold.", None
+
+    hold = next((h for h in get_patron_holds(patron_id) if h["book_id"] == book_id), None)
+    event_bus.publish("hold", patron_id=patron_id, book_id=book_id)
+    position = hold["position"] if hold else None
+    return True, f'Hold placed on "{book["title"]}". You are number {position} in line.', hold
+
+
+def list_holds(patron_id: str) -> List[Dict]:
+    """a patron's waiting and ready holds, oldest first."""
+    if not _is_valid_patron_id(patron_id):
+        return []
+    return get_patron_holds(patron_id)
+
+
+def ready_holds(patron_id: str) -> List[Dict]:
+    """holds with a copy set aside for the patron to pick up."""
+    return [hold for hold in list_holds(patron_id) if hold["status"] == "ready"]
+
+
+def cancel_hold(patron_id: str, hold_id: int) -> Tuple[bool, str]:
+    """cancel one of the patron's open holds; a set-aside copy goes to the next in line."""
+    if not _is_valid_patron_id(patron_id):
+        return False, "Invalid patron ID. Must be exactly 6 digits."
+
+    hold = get_hold(hold_id)
+    if not hold or hold["patron_id"] != patron_id:
+        return False, "Hold not found."
+
+    cancelled = update_hold_status(hold_id, "cancelled", ("waiting", "ready"))
+    if cancelled is None:
+        return False, "This hold is no longer open."
+    if hold["status"] == "ready":
+        release_copy(hold["book_id"], patron_id)
+    event_bus.publish("hold_cancel", patron_id=patron_id, book_id=hold["book_id"])
+    return True, "Hold cancelled."
+
+
+def dispatch_returned_copy(book_id: int) -> Optional[Dict]:
+    """set a returned copy aside for the book's oldest waiting hold and notify that patron.
+
+    returns the hold that got the copy, or None if nobody is waiting (the copy
+    goes back on the shelf and the caller adds it to availability).
+    """
+    now = datetime.now()
+    hold = assign_next_hold(book_id, now, now + timedelta(days=HOLD_PICKUP_DAYS))
+    if hold is None:
+        return None
+    pubsub.publish(hold_topic(hold["patron_id"]), hold)
+    event_bus.publish("hold_ready", patron_id=hold["patron_id"], book_id=book_id, hold_id=hold["id"])
+    return hold
+
+
+def release_copy(book_id: int, patron_id: str) -> Optional[Dict]:
+    """the copy set aside for patron_id's hold goes to the next hold, or back on the shelf."""
+    hold = dispatch_returned_copy(book_id)
+    pass_on_held_copy(book_id, patron_id, hold["patron_id"] if hold else None, datetime.now())
+    if hold is None:
+        update_book_availability(book_id, 1)
+    return hold
+
+
+def claim_hold_for_borrow(patron_id: str, book_id: int, hold: Optional[Dict]) -> bool:
+    """close the patron's open hold once they've borrowed the book.
+
+    returns True when the loan used the copy set aside for a ready hold, so
+    the caller doesn't take another one off the shelf.
+    """
+    if hold is None:
+        return False
+    if hold["status"] == "ready":
+        return update_hold_status(hold["id"], "fulfilled", ("ready",)) is not None
+    if update_hold_status(hold["id"], "fulfilled", ("waiting",)) is None:
+        # a return made the hold ready after we looked; that copy isn't needed now
+        if update_hold_status(hold["id"], "fulfilled", ("ready",)) is not None:
+            release_copy(book_id, patron_id)
+    return False
+
+
+def expire_holds(now: Optional[datetime] = None) -> int:
+    """expire ready holds past their pickup window, passing each copy on; returns how many."""
+    expired = 0
+    for hold in get_expired_holds(now or datetime.now()):
+        if update_hold_status(hold["id"], "expired", ("ready",)) is not None:
+            release_copy(hold["book_id"], hold["patron_id"])
+            expired += 1
+    return expired
+
+
+__all__ = [
+    "HOLD_PICKUP_DAYS",
+    "MAX_OPEN_HOLDS",
+    "cancel_hold",
+    "claim_hold_for_borrow",
+    "dispatch_returned_copy",
+    "expire_holds",
+    "hold_topic",
+    "list_holds",
+    "place_hold",
+    "ready_holds",
+    "release_copy",
+]
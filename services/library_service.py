@@ -6,21 +6,47 @@ Contains all the core business logic for the Library Management System
 from __future__ import annotations
 
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 from database import (
+    add_borrow_counts,
+    allocate_copy,
+    book_has_copies,
+    get_branch_by_code,
     get_book_by_id,
     get_book_by_isbn,
     get_patron_borrow_count,
     get_active_borrow_record,
+    get_open_hold,
     get_patron_borrow_records,
+    get_archived_borrow_records,
     insert_book,
     insert_borrow_record,
     update_book_availability,
     update_borrow_record_return_date,
+    move_copy,
     get_all_books,
+    get_books_by_ids,
+    get_catalog_stamp,
     search_books,
 )
-from services.payment_service import PaymentGateway, PaymentGatewayError
+from isbn import to_isbn13
+from services.events import event_bus
+from services.hold_service import claim_hold_for_borrow, dispatch_returned_copy
+from services.search_cache import normalize_search_key, search_cache
+from services.single_flight import single_flight
+from services.fuzzy_index import fuzzy_index
+from services.suggest_index import suggest_index
+
+if TYPE_CHECKING:
+    # Imported lazily at call time; only the fee payment flow needs the gateway
+    from services.payment_service import PaymentGateway
+
+# Seconds a caller waits on an identical in-flight read before running its own
+COALESCE_TIMEOUTS = {
+    "catalog": 2.0,
+    "search": 2.0,
+    "late_fee": 1.0,
+}
 
 def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -> Tuple[bool, str]:
     """
@@ -30,7 +56,7 @@ def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -
     Args:
         title: Book title (max 200 chars)
         author: Book author (max 100 chars)
-        isbn: 13-digit ISBN
+        isbn: 13-digit ISBN, or an ISBN-10 / hyphenated form (stored as ISBN-13)
         total_copies: Number of copies (positive integer)
         
     Returns:
@@ -49,11 +75,11 @@ def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -
     if len(author.strip()) > 100:
         return False, "Author must be less than 100 characters."
     
-    if len(isbn) != 13:
-        return False, "ISBN must be exactly 13 digits."
-
-    if not isbn.isdigit():
-        return False, "ISBN must be exactly 13 digits."
+    # Scanners send ISBN-10s and hyphenated forms; store every book as ISBN-13
+    normalized_isbn = to_isbn13(isbn or "")
+    if normalized_isbn is None:
+        return False, "ISBN must be exactly 13 digits (or a valid ISBN-10)."
+    isbn = normalized_isbn
     
     if not isinstance(total_copies, int) or total_copies <= 0:
         return False, "Total copies must be a positive integer."
@@ -66,11 +92,21 @@ def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -
     # Insert new book
     success = insert_book(title.strip(), author.strip(), isbn, total_copies, total_copies)
     if success:
+        # Pick up the new row now rather than on the next lookup
+        suggest_index.sync()
+        fuzzy_index.sync()
         return True, f'Book "{title.strip()}" has been successfully added to the catalog.'
     else:
         return False, "Database error occurred while adding the book."
 
-def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
+def _resolve_branch(branch: Optional[str]) -> Tuple[bool, Optional[Dict]]:
+    """(ok, branch row) for a branch code; no code means (True, None)."""
+    if not branch or not branch.strip():
+        return True, None
+    row = get_branch_by_code(branch.strip())
+    return row is not None, row
+
+def borrow_book_by_patron(patron_id: str, book_id: int, branch: Optional[str] = None) -> Tuple[bool, str]:
     """
     Allow a patron to borrow a book.
     Implements R3 as per requirements  
@@ -78,6 +114,7 @@ def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     Args:
         patron_id: 6-digit library card ID
         book_id: ID of the book to borrow
+        branch: code of the branch lending it; None lends a copy from any branch
         
     Returns:
         tuple: (success: bool, message: str)
@@ -86,13 +123,20 @@ def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
         return False, "Invalid patron ID. Must be exactly 6 digits."
     
+    known_branch, lending_branch = _resolve_branch(branch)
+    if not known_branch:
+        return False, "Unknown branch."
+
     # Check if book exists and is available
     book = get_book_by_id(book_id)
     if not book:
         return False, "Book not found."
     
-    if book['available_copies'] <= 0:
-        return False, "This book is currently not available."
+    # A ready hold means a copy is already set aside for this patron
+    hold = get_open_hold(patron_id, book_id)
+    ready = bool(hold and hold['status'] == 'ready')
+    if book['available_copies'] <= 0 and not ready:
+        return False, "This book is currently not available. You can place a hold on it."
     
     # Check patron's current borrowed books count
     current_borrowed = get_patron_borrow_count(patron_id)
@@ -104,47 +148,94 @@ def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     borrow_date = datetime.now()
     due_date = borrow_date + timedelta(days=14)
     
+    # Lend a specific copy: the one set aside for this patron's ready hold
+    # (wherever it waits), else the first on the shelf at the lending branch
+    copy_status = 'on_hold' if ready else 'available'
+    branch_id = lending_branch['id'] if lending_branch and not ready else None
+    copy = allocate_copy(book_id, patron_id, borrow_date, copy_status, branch_id)
+    if copy is None and not ready and book_has_copies(book_id):
+        if branch_id is not None:
+            elsewhere = [entry['code'] for entry in book['branches']
+                         if entry['available'] > 0 and entry['code'] != lending_branch['code']]
+            if elsewhere:
+                return False, (f"No copy is available at {lending_branch['code']}. "
+                               f"Available at: {', '.join(elsewhere)}.")
+        # Another patron took the last copy after we looked
+        return False, "This book is currently not available. You can place a hold on it."
+
     # Insert borrow record and update availability
-    borrow_success = insert_borrow_record(patron_id, book_id, borrow_date, due_date)
+    borrow_success = insert_borrow_record(patron_id, book_id, borrow_date, due_date,
+                                          copy['id'] if copy else None,
+                                          copy['branch_id'] if copy else branch_id)
     if not borrow_success:
+        if copy:
+            move_copy(book_id, 'on_loan', copy_status, borrow_date, copy_id=copy['id'],
+                      patron_id=patron_id if ready else None)
         return False, "Database error occurred while creating borrow record."
     
-    availability_success = update_book_availability(book_id, -1)
-    if not availability_success:
-        return False, "Database error occurred while updating book availability."
-    
+    if not claim_hold_for_borrow(patron_id, book_id, hold):
+        availability_success = update_book_availability(book_id, -1)
+        if not availability_success:
+            return False, "Database error occurred while updating book availability."
+
+    # Counted here rather than from the event, which the bus may drop or be
+    # disabled for; a failed count is recovered by `flask popularity rebuild`
+    add_borrow_counts([(borrow_date.date().isoformat(), book_id, 1)])
+    event_bus.publish("borrow", patron_id=patron_id, book_id=book_id, due_date=due_date.date(),
+                      branch_id=copy['branch_id'] if copy else branch_id)
     return True, f'Successfully borrowed "{book["title"]}". Due date: {due_date.strftime("%Y-%m-%d")}.'
 
-def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
+def return_book_by_patron(patron_id: str, book_id: int, branch: Optional[str] = None,
+                          copy_id: Optional[int] = None) -> Tuple[bool, str]:
     """
     Process book return by a patron.
     
-    Implements R4 as per requirements
+    Implements R4 as per requirements. The copy stays at the branch it is
+    returned to (branch code); None returns it to the branch that lent it.
+    copy_id (a scanned copy) returns the loan of that copy, else the
+    patron's oldest active loan of the book.
     """
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
         return False, "Invalid patron ID. Must be exactly 6 digits."
 
+    known_branch, return_branch = _resolve_branch(branch)
+    if not known_branch:
+        return False, "Unknown branch."
+
     book = get_book_by_id(book_id)
     if not book:
         return False, "Book not found."
 
-    active_record = get_active_borrow_record(patron_id, book_id)
+    active_record = get_active_borrow_record(patron_id, book_id, copy_id)
     if not active_record:
         return False, "No active borrow record found for this patron and book."
 
-    fee_info = calculate_late_fee_for_book(patron_id, book_id)
-
     now = datetime.now()
-    updated = update_borrow_record_return_date(patron_id, book_id, now)
+    if copy_id is None:
+        fee_info = calculate_late_fee_for_book(patron_id, book_id)
+    else:
+        # A patron may have more than one copy out; charge for the scanned one
+        fee_info = late_fee_for_due_date(datetime.fromisoformat(active_record['due_date']), now)
+
+    branch_id = return_branch['id'] if return_branch else active_record.get('branch_id')
+    updated = update_borrow_record_return_date(patron_id, book_id, now, branch_id,
+                                               record_id=active_record['id'])
     if not updated:
         return False, "Database error occurred while updating borrow record."
 
-    availability_success = update_book_availability(book_id, 1)
-    if not availability_success:
-        return False, "Database error occurred while updating book availability."
+    # The next patron in the hold queue gets the copy before it goes back on the shelf
+    hold = dispatch_returned_copy(book_id)
+    move_copy(book_id, 'on_loan', 'on_hold' if hold else 'available', now,
+              copy_id=active_record.get('copy_id'), branch_id=branch_id,
+              patron_id=hold['patron_id'] if hold else None)
+    if hold is None:
+        availability_success = update_book_availability(book_id, 1)
+        if not availability_success:
+            return False, "Database error occurred while updating book availability."
 
     fee_amount = fee_info.get("fee_amount", 0.0)
     status = fee_info.get("status", "Return processed.")
+    event_bus.publish("return", patron_id=patron_id, book_id=book_id, fee_amount=fee_amount, branch_id=branch_id)
     return True, (
         f'Book "{book["title"]}" successfully returned. '
         f'Late fee: ${fee_amount:.2f}. {status}'
@@ -156,16 +247,26 @@ def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
     
     Implements R5 as per requirements 
     """
-    record = get_active_borrow_record(patron_id, book_id)
-    if not record:
-        return {
-            "fee_amount": 0.0,
-            "days_overdue": 0,
-            "status": "No active borrow found for this patron and book.",
-        }
+    def compute() -> Dict:
+        record = get_active_borrow_record(patron_id, book_id)
+        if not record:
+            return {
+                "fee_amount": 0.0,
+                "days_overdue": 0,
+                "status": "No active borrow found for this patron and book.",
+            }
+        return late_fee_for_due_date(datetime.fromisoformat(record["due_date"]), datetime.now())
+
+    # Kiosks polling the same loan at once share one lookup; copy so callers own the result
+    fee = single_flight.do(("late_fee", patron_id, book_id), compute, COALESCE_TIMEOUTS["late_fee"])
+    return dict(fee)
+
+def late_fee_for_due_date(due_date: datetime, now: datetime) -> Dict:
+    """
+    Late fee for a loan due at due_date, as of now (no database access).
 
-    due_date = datetime.fromisoformat(record["due_date"])
-    now = datetime.now()
+    $0.50/day for the first 7 days overdue, then $1.00/day, capped at $15.00.
+    """
     days_overdue = max(0, (now - due_date).days)
 
     if days_overdue <= 0:
@@ -186,22 +287,79 @@ def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
         "status": "Book is overdue.",
     }
 
+def get_late_fee_version(patron_id: str, book_id: int) -> Tuple:
+    """
+    Return a value that changes whenever calculate_late_fee_for_book's result would.
+
+    The fee only depends on the active loan row and how many whole days it is
+    overdue, so the API can use this as an ETag without computing the fee.
+    """
+    record = get_active_borrow_record(patron_id, book_id)
+    if not record:
+        return (None,)
+    due_date = datetime.fromisoformat(record["due_date"])
+    return (record["id"], record["due_date"], max(0, (datetime.now() - due_date).days))
+
 def search_books_in_catalog(search_term: str, search_type: str) -> List[Dict]:
     """
     Search for books in the catalog.
     
-    Implements R6 as per requirements
+    Implements R6 as per requirements. Raises database.QueryTimeoutError if
+    the search runs past the current query deadline.
     """
     if not search_term or not search_type:
         return []
 
-    return search_books(search_term, search_type)
+    # Popular queries are served from the LRU until the catalog changes
+    key = normalize_search_key(search_term, search_type)
+    stamp = get_catalog_stamp()
+    cached = search_cache.get(key, stamp)
+    if cached is not None:
+        return cached
+
+    def run_search() -> List[Dict]:
+        if search_type == 'fuzzy':
+            # Typo-tolerant title/author search through the in-memory trigram index
+            fuzzy_index.sync()
+            results = get_books_by_ids(fuzzy_index.search(search_term))
+        else:
+            results = search_books(search_term, search_type)
+        search_cache.put(key, stamp, results)
+        return results
+
+    # A burst of the same uncached query runs it once; every caller gets its own rows
+    results = single_flight.do(("search", key, stamp), run_search, COALESCE_TIMEOUTS["search"])
+    return [dict(row) for row in results]
+
+def get_catalog_books() -> List[Dict]:
+    """
+    All books for the catalog page, ordered by title.
+
+    Concurrent requests (kiosks opening at once) share one query per catalog
+    version; the rows are shared too, so callers must not modify them.
+    """
+    return single_flight.do(("catalog", get_catalog_stamp()), get_all_books, COALESCE_TIMEOUTS["catalog"])
+
+def suggest_books(query: str, limit: int = 10) -> List[Dict]:
+    """
+    Typeahead suggestions for a partially typed title or author.
+
+    Served from the in-memory prefix index, which is synced with any books
+    added since the last lookup (including by other worker processes).
+    """
+    if not query or not query.strip():
+        return []
+    suggest_index.sync()
+    return suggest_index.suggest(query, limit)
 
-def get_patron_status_report(patron_id: str) -> Dict:
+def get_patron_status_report(patron_id: str, include_archived: bool = False) -> Dict:
     """
     Get status report for a patron.
     
-    Implements R7 as per requirements
+    Implements R7 as per requirements. History normally covers loans still in
+    borrow_records; include_archived adds those moved out by archive_loans.
+    Raises database.QueryTimeoutError if loading the history runs past the
+    current query deadline.
     """
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
         return {
@@ -214,6 +372,20 @@ def get_patron_status_report(patron_id: str) -> Dict:
         }
 
     records = get_patron_borrow_records(patron_id)
+    if include_archived:
+        # an interrupted archive run can leave a loan in both tables briefly
+        seen = {record["id"] for record in records}
+        records += [record for record in get_archived_borrow_records(patron_id) if record["id"] not in seen]
+        records.sort(key=lambda record: record["borrow_date"], reverse=True)
+    return build_patron_status_report(patron_id, records, datetime.now())
+
+def build_patron_status_report(patron_id: str, records: List[Dict], now: datetime) -> Dict:
+    """
+    Build a patron's status report from their borrow records, newest first.
+
+    Pure function of its arguments, so bulk report jobs can run it in worker
+    processes on records they fetched in one scan.
+    """
     current_loans: List[Dict] = []
     history: List[Dict] = []
     total_late_fees = 0.0
@@ -233,7 +405,7 @@ def get_patron_status_report(patron_id: str) -> Dict:
             ),
         }
         if record["return_date"] is None:
-            fee = calculate_late_fee_for_book(patron_id, record["book_id"])
+            fee = late_fee_for_due_date(due_date, now)
             total_late_fees += fee.get("fee_amount", 0.0)
             entry["is_overdue"] = fee.get("days_overdue", 0) > 0
             entry["late_fee"] = fee.get("fee_amount", 0.0)
@@ -272,6 +444,8 @@ def pay_late_fees(
     book_id: int,
     payment_gateway: PaymentGateway,
 ) -> Dict:
+    from services.payment_service import PaymentGatewayError
+
     if not _is_valid_patron_id(patron_id):
         return _payment_response(False, "invalid patron id; must be 6 digits.")
 
@@ -301,6 +475,9 @@ def pay_late_fees(
             amount=fee_amount,
         )
 
+    event_bus.publish(
+        "payment", patron_id=patron_id, book_id=book_id, amount=fee_amount, transaction_id=transaction_id
+    )
     return _payment_response(
         True,
         f'late fee payment recorded for "{book["title"]}".',
@@ -313,6 +490,8 @@ def refund_late_fee_payment(
     amount: float,
     payment_gateway: PaymentGateway,
 ) -> Dict:
+    from services.payment_service import PaymentGatewayError
+
     if not transaction_id or not transaction_id.strip():
         return _payment_response(False, "transaction id is required.")
 
@@ -338,6 +517,9 @@ def refund_late_fee_payment(
             amount=normalized_amount,
         )
 
+    event_bus.publish(
+        "refund", transaction_id=response.get("transaction_id", transaction_id), amount=normalized_amount
+    )
     return _payment_response(
         True,
         f"refund issued for ${normalized_amount:.2f}.",
@@ -0,0 +1,304 @@
+"""background database upkeep: WAL checkpoints, PRAGMA optimize, ANALYZE and incremental vacuum."""
+
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import database
+
+log = logging.getLogger(__name__)
+
+TASKS = ("checkpoint", "optimize", "analyze", "vacuum")
+
+DEFAULT_INTERVALS = {
+    "checkpoint": 600.0,
+    "optimize": 3600.0,
+    "analyze": 86400.0,
+    "vacuum": 3600.0,
+}
+
+# maintenance never queues behind live writers for longer than this
+BUSY_TIMEOUT = 0.2
+
+# rows ANALYZE samples per index; keeps a run to milliseconds on big tables
+ANALYSIS_LIMIT = 1000
+
+
+class TrafficMonitor:
+    """requests in flight in this worker and when the last one finished."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.last_seen = 0.0
+
+    def started(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+            self.last_seen = time.monotonic()
+
+    def finished(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.last_seen = time.monotonic()
+
+    def idle_for(self, seconds: float) -> bool:
+        with self._lock:
+            return self.in_flight == 0 and time.monotonic() - self.last_seen >= seconds
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def maintenance_files() -> List[str]:
+    """every database file the app writes: the primary, loan shards and their archives."""
+    files = [database.DATABASE]
+    for path in database.shard_paths():
+        if path != database.DATABASE:
+            files.append(path)
+        archive = database.archive_path(path)
+        if os.path.exists(archive):
+            files.append(archive)
+    return files
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    return sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+
+
+def change_count() -> int:
+    """rows ever inserted into AUTOINCREMENT tables, plus catalog changes; only ever grows."""
+    total = database.get_catalog_version()
+    for path in maintenance_files():
+        conn = _connect(path)
+        try:
+            total += conn.execute("SELECT COALESCE(SUM(seq), 0) FROM sqlite_sequence").fetchone()[0]
+        except sqlite3.OperationalError:
+            pass  # no AUTOINCREMENT table in this file
+        finally:
+            conn.close()
+    return total
+
+
+class MaintenanceScheduler:
+    """runs due maintenance tasks on a daemon thread while this worker is idle.
+
+    every tick seconds the thread checks whether this worker has been idle for
+    quiet_seconds (and, with a window of (start_hour, end_hour), whether the
+    local time is inside it), then runs each due task: checkpoint when its
+    interval passed or a -wal file outgrew checkpoint_wal_bytes, optimize on
+    its interval, analyze on its interval or after analyze_changes new rows,
+    vacuum when a file has more than vacuum_free_ratio of its pages free.
+    tasks are claimed in maintenance_state first, so with several workers
+    each due task runs once. work stops between files and between vacuum
+    steps as soon as a request arrives, and never waits more than
+    BUSY_TIMEOUT for a lock a live writer holds.
+    """
+
+    def __init__(self, traffic: Optional[TrafficMonitor] = None):
+        self.traffic = traffic or TrafficMonitor()
+        self.enabled = False
+        self.tick = 60.0
+        self.quiet_seconds = 5.0
+        self.window: Optional[Tuple[int, int]] = None
+        self.intervals = dict(DEFAULT_INTERVALS)
+        self.analyze_changes = 10_000
+        self.checkpoint_wal_bytes = 64 * 1024 * 1024
+        self.vacuum_free_ratio = 0.1
+        self.vacuum_step_pages = 256
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def configure(self, **settings) -> None:
+        for name, value in settings.items():
+            if not hasattr(self, name) or name.startswith("_"):
+                raise ValueError(f"unknown maintenance setting: {name}")
+            setattr(self, name, dict(DEFAULT_INTERVALS, **value) if name == "intervals" else value)
+
+    def ensure_running(self) -> None:
+        """start the scheduler thread in this process if it isn't running (cheap to call per request)."""
+        if not self.enabled or (self._pid == os.getpid() and self._thread is not None):
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="db-maintenance", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        thread = self._thread
+        self._stopping.set()
+        if thread is not None and self._pid == os.getpid():
+            thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.tick):
+            if not self.enabled or self.should_yield():
+                continue
+            try:
+                self.run_pending()
+            except Exception:
+                log.exception("database maintenance pass failed")
+
+    def in_window(self, now: Optional[datetime] = None) -> bool:
+        if self.window is None:
+            return True
+        start, end = self.window
+        hour = (now or datetime.now()).hour
+        return start <= hour < end if start <= end else hour >= start or hour < end
+
+    def should_yield(self) -> bool:
+        """True if live traffic (or the time of day) says maintenance should wait."""
+        return not self.traffic.idle_for(self.quiet_seconds) or not self.in_window()
+
+    def due(self, task: str, state: Dict, now: datetime) -> Optional[float]:
+        """seconds since which the task must not have started for it to run now; None if not due."""
+        interval = self.intervals[task]
+        last = datetime.fromisoformat(state["last_started"]) if state["last_started"] else None
+        if last is None or now - last >= timedelta(seconds=interval):
+            if task == "vacuum" and not self._free_pages_over_threshold():
+                return None
+            return interval
+        # thresholds bring a task forward, but never closer together than one tick
+        if now - last < timedelta(seconds=self.tick):
+            return None
+        if task == "checkpoint" and any(
+            _file_size(path + "-wal") >= self.checkpoint_wal_bytes for path in maintenance_files()
+        ):
+            return self.tick
+        if task == "analyze" and change_count() - (state["changes_at_run"] or 0) >= self.analyze_changes:
+            return self.tick
+        return None
+
+    def run_pending(self) -> List[Dict]:
+        """run every due task this worker can claim; returns what each run did."""
+        results = []
+        now = datetime.now()
+        for state in database.get_maintenance_state():
+            if self.should_yield():
+                break
+            gap = self.due(state["task"], state, now)
+            if gap is None or not database.claim_maintenance_task(
+                state["task"], now, now - timedelta(seconds=gap)
+            ):
+                continue
+            results.append(self.run_task(state["task"]))
+        return results
+
+    def run_task(self, task: str, yield_to_traffic: bool = True) -> Dict:
+        """run one task over every database file, log and record it."""
+        if task not in TASKS:
+            raise ValueError(f"task must be one of {', '.join(TASKS)}")
+        started = time.perf_counter()
+        reclaimed = files = 0
+        completed = True
+        for path in maintenance_files():
+            if yield_to_traffic and self.should_yield():
+                completed = False
+                break
+            conn = _connect(path)
+            try:
+                reclaimed += getattr(self, f"_{task}")(conn, path, yield_to_traffic)
+                files += 1
+            except sqlite3.OperationalError as e:
+                if not database._is_locked_error(e):
+                    raise
+                completed = False  # a live writer holds the file; try again next time
+            finally:
+                conn.close()
+        seconds = time.perf_counter() - started
+        changes = change_count() if task == "analyze" else None
+        database.record_maintenance_run(task, datetime.now(), seconds, reclaimed, changes)
+        log.info(
+            "maintenance %s: %d file(s) in %.3fs, %d bytes reclaimed%s",
+            task, files, seconds, reclaimed, "" if completed else " (stopped early)",
+        )
+        return {"task": task, "files": files, "seconds": round(seconds, 4),
+                "reclaimed_bytes": reclaimed, "completed": completed}
+
+    def _checkpoint(self, conn: sqlite3.Connection, path: str, yield_to_traffic: bool) -> int:
+        before = _file_size(path + "-wal")
+        # TRUNCATE also shrinks the -wal file back to nothing when no reader is using it
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        return max(0, before - _file_size(path + "-wal"))
+
+    def _optimize(self, conn: sqlite3.Connection, path: str, yield_to_traffic: bool) -> int:
+        conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+        conn.execute("PRAGMA optimize").fetchall()
+        return 0
+
+    def _analyze(self, conn: sqlite3.Connection, path: str, yield_to_traffic: bool) -> int:
+        conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+        conn.execute("ANALYZE")
+        return 0
+
+    def _vacuum(self, conn: sqlite3.Connection, path: str, yield_to_traffic: bool) -> int:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if free:
+                log.info("maintenance vacuum: %s has %d free pages but incremental vacuum is off; "
+                         "`flask maintenance run vacuum --full` converts it", path, free)
+            return 0
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        before = free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # a few hundred pages per transaction, so writers only ever wait on one short step
+        while free:
+            if yield_to_traffic and self.should_yield():
+                break
+            conn.execute(f"PRAGMA incremental_vacuum({self.vacuum_step_pages})").fetchall()
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # in WAL mode the file itself is only truncated when the pages are checkpointed
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        return (before - free) * page_size
+
+    def _free_pages_over_threshold(self) -> bool:
+        for path in maintenance_files():
+            conn = _connect(path)
+            try:
+                pages = conn.execute("PRAGMA page_count").fetchone()[0]
+                free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            finally:
+                conn.close()
+            if pages and free / pages >= self.vacuum_free_ratio:
+                return True
+        return False
+
+
+def full_vacuum() -> int:
+    """rewrite every database file with VACUUM and switch it to incremental vacuum; bytes reclaimed.
+
+    blocks writers to each file while it runs: for a maintenance window, not
+    for the background scheduler.
+    """
+    reclaimed = 0
+    for path in maintenance_files():
+        before = _file_size(path)
+        conn = sqlite3.connect(path, timeout=database.BUSY_TIMEOUT, isolation_level=None)
+        try:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+        reclaimed += max(0, before - _file_size(path))
+    return reclaimed
+
+
+scheduler = MaintenanceScheduler()
+
+__all__ = ["DEFAULT_INTERVALS", "MaintenanceScheduler", "TASKS", "TrafficMonitor",
+           "change_count", "full_vacuum", "maintenance_files", "scheduler"]
@@ -0,0 +1,183 @@
+"""borrow popularity: daily counters, sliding windows and most-borrowed rankings."""
+
+from __future__ import annotations
+
+import heapq
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import database
+
+# window name -> days it covers, ending today; None is all time
+WINDOWS: Dict[str, Optional[int]] = {"week": 7, "month": database.POPULARITY_DAYS, "all": None}
+# rankings are kept this deep; /api/popular can ask for up to this many
+MAX_TOP = 100
+
+
+def _first_day(today: date, days: int) -> str:
+    return (today - timedelta(days=days - 1)).isoformat()
+
+
+class TopN:
+    """the n most borrowed books of one window: their counts plus a min-heap on them.
+
+    counts within a window only grow between rebuilds (a day leaving it
+    re-sums everything), so a book bumped above the heap's smallest entry
+    takes that book's place. a bump of a book already in pushes a fresh entry
+    and leaves the old one to be skipped when it surfaces.
+    """
+
+    def __init__(self, n: int, counts: Dict[int, int]) -> None:
+        self.n = n
+        leaders = heapq.nlargest(n, ((borrows, -book_id) for book_id, borrows in counts.items() if borrows > 0))
+        self.counts = {-negated_id: borrows for borrows, negated_id in leaders}
+        self._heap = [(borrows, -book_id) for book_id, borrows in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def bump(self, book_id: int, borrows: int) -> bool:
+        """book_id's count in the window has grown to borrows; True if the leaders changed."""
+        if book_id in self.counts:
+            self.counts[book_id] = borrows
+            heapq.heappush(self._heap, (borrows, -book_id))
+            if len(self._heap) > 4 * self.n:
+                self._heap = [(b, -i) for i, b in self.counts.items()]
+                heapq.heapify(self._heap)
+            return True
+        if len(self.counts) >= self.n:
+            while self.counts.get(-self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            if (borrows, -book_id) <= self._heap[0]:
+                return False
+            del self.counts[-heapq.heappop(self._heap)[1]]
+        self.counts[book_id] = borrows
+        heapq.heappush(self._heap, (borrows, -book_id))
+        return True
+
+    def ranked(self) -> List[Tuple[int, int]]:
+        return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))
+
+
+class PopularityIndex:
+    """borrow counts per window, held in memory and synced from the daily buckets.
+
+    the first sync loads the last POPULARITY_DAYS daily buckets and the
+    all-time totals. after that a sync costs one read of popularity_state
+    unless the counters changed, and then reads only the bucket rows changed
+    since the version it has, from the day before the last sync on (the only
+    days borrows still add to), applying the difference to each window. when the date changes the
+    windows are re-summed from the buckets in memory; a rebuild reloads. a
+    window's leaders are a TopN, built with heapq.nlargest on first use and
+    bumped as counts grow, so a refresh costs O(changed books x log n).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._today: Optional[date] = None
+        self._state: Dict = {}
+        self._days: Dict[str, Dict[int, int]] = {}
+        self._totals: Counter = Counter()
+        self._windows: Dict[str, Counter] = {}
+        self._leaders: Dict[str, TopN] = {}
+        self._ranked: Dict[str, List[Tuple[int, int]]] = {}
+
+    def sync(self, today: Optional[date] = None) -> None:
+        today = today or date.today()
+        state = dict(database.get_popularity_state(), database=database.DATABASE)
+        with self._lock:
+            if (self._today is None or state["database"] != self._state.get("database")
+                    or state["rebuilt_at"] != self._state.get("rebuilt_at")
+                    or state["version"] < self._state.get("version", 0)):
+                # first use, another database file, a rebuild or a restored backup
+                self._load(today, state)
+                return
+            if state["version"] != self._state.get("version"):
+                self._refresh()
+            if today != self._today:
+                self._roll(today)
+
+    def top(self, window: str, limit: int = 10, today: Optional[date] = None) -> List[Tuple[int, int]]:
+        """the window's (book_id, borrows) leaders, most borrowed first (ties by book id)."""
+        if window not in WINDOWS:
+            raise ValueError(f"window must be one of {', '.join(WINDOWS)}")
+        self.sync(today)
+        with self._lock:
+            ranked = self._ranked.get(window)
+            if ranked is None:
+                if window not in self._leaders:
+                    self._leaders[window] = TopN(MAX_TOP, self._windows[window])
+                ranked = self._ranked[window] = self._leaders[window].ranked()
+            return ranked[:limit]
+
+    def _load(self, today: date, state: Dict) -> None:
+        counted, daily, totals = database.get_popularity_counts(_first_day(today, database.POPULARITY_DAYS))
+        self._state = dict(state, **counted)
+        self._days = {}
+        for day, book_id, borrows in daily:
+            self._days.setdefault(day, {})[book_id] = borrows
+        self._totals = Counter(dict(totals))
+        self._roll(today)
+
+    def _refresh(self) -> None:
+        since = (self._today - timedelta(days=1)).isoformat()
+        state, changed, _ = database.get_popularity_counts(
+            since, with_totals=False, after_version=self._state["version"]
+        )
+        starts = {window: _first_day(self._today, days) if days else "" for window, days in WINDOWS.items()}
+        for day, book_id, borrows in changed:
+            bucket = self._days.setdefault(day, {})
+            delta = borrows - bucket.get(book_id, 0)
+            bucket[book_id] = borrows
+            for window, start in starts.items():
+                if delta and day >= start:
+                    self._add(window, book_id, delta)
+        self._state.update(state)
+
+    def _add(self, window: str, book_id: int, delta: int) -> None:
+        counts = self._windows[window]
+        counts[book_id] += delta
+        leaders = self._leaders.get(window)
+        if leaders is None:
+            return
+        if delta < 0:
+            # only a rewritten bucket shrinks; rank the window afresh
+            del self._leaders[window]
+            self._ranked.pop(window, None)
+        elif leaders.bump(book_id, counts[book_id]):
+            self._ranked.pop(window, None)
+
+    def _roll(self, today: date) -> None:
+        first = _first_day(today, database.POPULARITY_DAYS)
+        self._days = {day: counts for day, counts in self._days.items() if day >= first}
+        self._today = today
+        self._windows = {}
+        for window, days in WINDOWS.items():
+            if days is None:
+                self._windows[window] = self._totals
+                continue
+            summed: Counter = Counter()
+            for day, counts in self._days.items():
+                if day >= _first_day(today, days):
+                    summed.update(counts)
+            self._windows[window] = summed
+        self._leaders.clear()
+        self._ranked.clear()
+
+
+popularity_index = PopularityIndex()
+
+
+def popular_books(window: str = "week", limit: int = 10) -> List[Dict]:
+    """the most borrowed books in a window, each with its borrows in it."""
+    leaders = popularity_index.top(window, max(1, min(limit, MAX_TOP)))
+    books = {book["id"]: book for book in database.get_books_by_ids([book_id for book_id, _ in leaders])}
+    return [dict(books[book_id], borrows=borrows) for book_id, borrows in leaders if book_id in books]
+
+
+def rebuild(now: Optional[datetime] = None) -> Dict:
+    """recount every counter from the loans themselves (after dropped events, or to backfill)."""
+    return database.rebuild_popularity(now or datetime.now())
+
+
+__all__ = ["MAX_TOP", "WINDOWS", "PopularityIndex", "TopN", "popular_books", "popularity_index", "rebuild"]
@@ -0,0 +1,100 @@
+"""in-process publish/subscribe for pushing changes to streaming clients."""
+
+from __future__ import annotations
+
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set
+
+
+class Subscription:
+    """one subscriber's bounded mailbox on a topic.
+
+    if the subscriber falls more than max_pending messages behind, the oldest
+    are dropped and `overflowed` is set so it can resynchronize from the
+    source of truth instead of trusting its partial history.
+    """
+
+    def __init__(self, hub: "PubSub", topic: str, max_pending: int):
+        self.topic = topic
+        self.overflowed = False
+        self._hub = hub
+        self._messages: Deque[Any] = deque(maxlen=max_pending)
+        self._ready = threading.Condition(threading.Lock())
+
+    def _deliver(self, message: Any) -> None:
+        with self._ready:
+            if len(self._messages) == self._messages.maxlen:
+                self.overflowed = True
+            self._messages.append(message)
+            self._ready.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Any]:
+        """next message, waiting up to timeout seconds; None if none arrived."""
+        with self._ready:
+            if not self._messages:
+                self._ready.wait(timeout)
+            return self._messages.popleft() if self._messages else None
+
+    def drain(self) -> List[Any]:
+        """every message waiting right now, oldest first."""
+        with self._ready:
+            messages = list(self._messages)
+            self._messages.clear()
+            return messages
+
+    def close(self) -> None:
+        self._hub._unsubscribe(self)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class PubSub:
+    """topic -> subscribers fan-out within one worker process.
+
+    publish() never blocks on slow subscribers: each has its own bounded
+    mailbox. other worker processes don't see these messages, so consumers
+    treat them as wake-ups and keep the database as the source of truth.
+    """
+
+    def __init__(self, max_pending: int = 256):
+        self.max_pending = max_pending
+        self._topics: Dict[str, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic: str) -> Subscription:
+        subscription = Subscription(self, topic, self.max_pending)
+        with self._lock:
+            self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def publish(self, topic: str, message: Any) -> int:
+        """deliver message to every current subscriber of topic; returns how many."""
+        with self._lock:
+            subscribers = list(self._topics.get(topic, ()))
+        for subscription in subscribers:
+            subscription._deliver(message)
+        return len(subscribers)
+
+    def subscriber_count(self, topic: Optional[str] = None) -> int:
+        with self._lock:
+            if topic is not None:
+                return len(self._topics.get(topic, ()))
+            return sum(len(subscribers) for subscribers in self._topics.values())
+
+    def _unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._topics.get(subscription.topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._topics[subscription.topic]
+
+
+pubsub = PubSub()
+
+__all__ = ["PubSub", "Subscription", "pubsub"]
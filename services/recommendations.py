@@ -0,0 +1,253 @@
+"""co-borrow recommendations: an offline item-item index over the loan history, served from a memory-mapped file."""
+
+from __future__ import annotations
+
+import heapq
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from itertools import groupby
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import database
+
+# where the index lives; None puts it beside the database (library.db -> library.related.bin)
+INDEX_PATH: Optional[str] = None
+# neighbours kept per book
+NEIGHBOURS = 20
+# patrons two books must have in common to count as related
+MIN_SHARED = 2
+# a patron with more distinct books than this is skipped: their n² pairs
+# would dominate the build and say little about any one book
+MAX_BASKET = 200
+# distinct pair counts held in memory before a sorted run is spilled to disk
+MAX_PAIRS = 1_000_000
+
+# magic, byte order, books (rows), neighbour entries, built at (unix time)
+_HEADER = struct.Struct("=7scQQd")
+_MAGIC = b"LIBREL1"
+_ORDER = b"<" if sys.byteorder == "little" else b">"
+# pair keys pack two book ids into one int: low * _SHIFT + high
+_SHIFT = 1 << 32
+_RUN_BLOCK = 1 << 16
+
+
+def index_path() -> str:
+    if INDEX_PATH:
+        return INDEX_PATH
+    base, _ = os.path.splitext(database.DATABASE)
+    return f"{base}.related.bin"
+
+
+def _count_pairs(baskets: Iterable[List[int]], runs: List, borrowers: Dict[int, int]) -> Dict[int, int]:
+    """count co-borrowed pairs, spilling a sorted run whenever MAX_PAIRS are held; returns what is left."""
+    pairs: Dict[int, int] = {}
+    for books in baskets:
+        for book_id in books:
+            borrowers[book_id] = borrowers.get(book_id, 0) + 1
+        if len(books) > MAX_BASKET:
+            continue
+        for i, low in enumerate(books):
+            base = low * _SHIFT
+            for high in books[i + 1:]:
+                key = base + high
+                pairs[key] = pairs.get(key, 0) + 1
+        if len(pairs) >= MAX_PAIRS:
+            runs.append(_spill(pairs))
+            pairs = {}
+    return pairs
+
+
+def _spill(pairs: Dict[int, int]):
+    run = tempfile.TemporaryFile()
+    flat = array("q")
+    for key in sorted(pairs):
+        flat.append(key)
+        flat.append(pairs[key])
+        if len(flat) >= 2 * _RUN_BLOCK:
+            flat.tofile(run)
+            del flat[:]
+    flat.tofile(run)
+    run.seek(0)
+    return run
+
+
+def _read_run(run) -> Iterator[Tuple[int, int]]:
+    while True:
+        flat = array("q")
+        try:
+            flat.fromfile(run, 2 * _RUN_BLOCK)
+        except EOFError:
+            # fromfile keeps the items it did read before raising
+            pass
+        if not flat:
+            run.close()
+            return
+        yield from zip(flat[::2], flat[1::2])
+
+
+def _merged(runs: List, pairs: Dict[int, int]) -> Iterator[Tuple[int, int]]:
+    """(pair key, patrons) over the spilled runs and the in-memory remainder, in key order."""
+    streams = [_read_run(run) for run in runs] + [((key, pairs[key]) for key in sorted(pairs))]
+    if len(streams) == 1:
+        return streams[0]
+    merged = heapq.merge(*streams)
+    return ((key, sum(count for _, count in group)) for key, group in groupby(merged, key=lambda item: item[0]))
+
+
+def _keep(heap: List, entry: Tuple[float, int, int], n: int) -> None:
+    if len(heap) < n:
+        heapq.heappush(heap, entry)
+    elif entry > heap[0]:
+        heapq.heapreplace(heap, entry)
+
+
+def build(
+    path: Optional[str] = None,
+    baskets: Optional[Iterable[List[int]]] = None,
+    neighbours: Optional[int] = None,
+    min_shared: Optional[int] = None,
+) -> Dict:
+    """
+    build the index from every patron's loans and write it to path (default index_path()).
+
+    baskets (each patron's sorted distinct book ids) stream from the shards
+    and archives; pairs are counted in a dict of at most MAX_PAIRS entries,
+    spilled to disk as sorted runs and merged back, so memory stays bounded by
+    MAX_PAIRS plus the index being built (books x neighbours). a pair shared
+    by at least min_shared (default MIN_SHARED) patrons is scored by cosine
+    similarity, shared / sqrt(borrowers(a) x borrowers(b)), and each book
+    keeps its neighbours (default NEIGHBOURS) best. the file is replaced
+    atomically.
+    """
+    path = path or index_path()
+    neighbours = neighbours or NEIGHBOURS
+    min_shared = min_shared or MIN_SHARED
+    if baskets is None:
+        baskets = (books for _, books in database.iter_patron_books())
+    started = time.perf_counter()
+    runs: List = []
+    borrowers: Dict[int, int] = {}
+    pairs = _count_pairs(baskets, runs, borrowers)
+    spilled = len(runs)
+
+    heaps: Dict[int, List] = {}
+    related_pairs = 0
+    for key, shared in _merged(runs, pairs):
+        if shared < min_shared:
+            continue
+        low, high = divmod(key, _SHIFT)
+        score = shared / math.sqrt(borrowers[low] * borrowers[high])
+        # ties go to the more shared book, then the lower id
+        _keep(heaps.setdefault(low, []), (score, shared, -high), neighbours)
+        _keep(heaps.setdefault(high, []), (score, shared, -low), neighbours)
+        related_pairs += 1
+    del pairs
+
+    rows = max(borrowers, default=0) + 1
+    offsets, neighbour_ids, shared_counts, scores = array("q", [0]), array("i"), array("I"), array("f")
+    for book_id in range(rows):
+        for score, shared, negated_id in sorted(heaps.pop(book_id, ()), reverse=True):
+            neighbour_ids.append(-negated_id)
+            shared_counts.append(shared)
+            scores.append(score)
+        offsets.append(len(neighbour_ids))
+
+    partial = f"{path}.partial"
+    with open(partial, "wb") as out:
+        out.write(_HEADER.pack(_MAGIC, _ORDER, rows, len(neighbour_ids), time.time()))
+        for column in (offsets, neighbour_ids, shared_counts, scores):
+            column.tofile(out)
+    os.replace(partial, path)
+    return {
+        "books": len(borrowers),
+        "related_pairs": related_pairs,
+        "neighbours": len(neighbour_ids),
+        "spilled_runs": spilled,
+        "bytes": os.path.getsize(path),
+        "seconds": time.perf_counter() - started,
+    }
+
+
+class RelatedIndex:
+    """the built index, memory-mapped and read in place.
+
+    the file is a header and four columns in compressed sparse row layout:
+    offsets (int64, one per book id plus one), then neighbour ids (int32),
+    shared patrons (uint32) and scores (float32), one entry per neighbour,
+    best first. book b's neighbours are entries offsets[b]:offsets[b+1], so a
+    lookup is two offset reads and a slice. every lookup stats the file and
+    remaps it when a build has replaced it.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self._path = path
+        self._lock = threading.Lock()
+        self._stamp: Optional[Tuple] = None
+        self._columns: Optional[Tuple] = None
+        self.built_at: Optional[float] = None
+
+    def _sync(self) -> Optional[Tuple]:
+        path = self._path or index_path()
+        try:
+            st = os.stat(path)
+            stamp = (path, st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self._stamp:
+            return self._columns
+        with self._lock:
+            if stamp != self._stamp:
+                self._columns = self._load(path) if stamp else None
+                self._stamp = stamp
+            return self._columns
+
+    def _load(self, path: str) -> Optional[Tuple]:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                return None
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, order, rows, entries, built_at = _HEADER.unpack_from(mapped)
+        if magic != _MAGIC or order != _ORDER or len(mapped) != _HEADER.size + 8 * (rows + 1) + 12 * entries:
+            # another format, a machine of the other byte order or a damaged file; rebuild it here
+            return None
+        self.built_at = built_at
+        view = memoryview(mapped)
+        columns, start = [], _HEADER.size
+        for code, length in (("q", rows + 1), ("i", entries), ("I", entries), ("f", entries)):
+            end = start + length * struct.calcsize(code)
+            columns.append(view[start:end].cast(code))
+            start = end
+        return tuple(columns)
+
+    def related(self, book_id: int, limit: int = 10) -> List[Tuple[int, int, float]]:
+        """book_id's (neighbour id, shared patrons, score) entries, best first."""
+        columns = self._sync()
+        if columns is None:
+            return []
+        offsets, neighbours, shared, scores = columns
+        if not 0 <= book_id < len(offsets) - 1:
+            return []
+        start = offsets[book_id]
+        end = min(offsets[book_id + 1], start + limit)
+        return list(zip(neighbours[start:end].tolist(), shared[start:end].tolist(), scores[start:end].tolist()))
+
+
+related_index = RelatedIndex()
+
+
+def related_books(book_id: int, limit: int = 10) -> List[Dict]:
+    """books most often borrowed by the patrons who borrowed book_id, each with shared and score."""
+    entries = related_index.related(book_id, max(1, min(limit, NEIGHBOURS)))
+    books = {book["id"]: book for book in database.get_books_by_ids([entry[0] for entry in entries])}
+    return [dict(books[neighbour], shared=shared, score=round(score, 4))
+            for neighbour, shared, score in entries if neighbour in books]
+
+
+__all__ = ["NEIGHBOURS", "RelatedIndex", "build", "index_path", "related_books", "related_index"]
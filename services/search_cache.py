@@ -0,0 +1,104 @@
+"""bounded lru cache for catalog search results."""
+
+from __future__ import annotations
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+SearchKey = Tuple[str, str]
+
+
+def normalize_search_key(search_term: str, search_type: str) -> SearchKey:
+    """map equivalent queries ("Harry ", "harry") onto one cache key."""
+    return (search_type.strip().lower(), search_term.strip().lower())
+
+
+def _result_size(results: List[Dict]) -> int:
+    # serialized length is a stable, cheap proxy for the memory a result list holds
+    return len(json.dumps(results, default=str, separators=(",", ":")))
+
+
+class SearchCache:
+    """lru of search results bounded by total result size in bytes.
+
+    entries are stamped with the catalog state they were computed against; a
+    lookup against any other state drops the whole cache, so a catalog write
+    in any worker invalidates every cached result on the next search.
+    """
+
+    def __init__(self, max_bytes: int = 4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[SearchKey, Tuple[List[Dict], int]]" = OrderedDict()
+        self._stamp: Optional[Hashable] = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: SearchKey, stamp: Hashable) -> Optional[List[Dict]]:
+        with self._lock:
+            self._check_stamp(stamp)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            results = entry[0]
+        # hand out copies so callers can't mutate the cached rows
+        return [dict(row) for row in results]
+
+    def put(self, key: SearchKey, stamp: Hashable, results: List[Dict]) -> None:
+        size = _result_size(results)
+        if size > self.max_bytes:
+            return
+        stored = [dict(row) for row in results]
+        with self._lock:
+            self._check_stamp(stamp)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (stored, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._stamp = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _check_stamp(self, stamp: Hashable) -> None:
+        if stamp == self._stamp:
+            return
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self._bytes = 0
+        self._stamp = stamp
+
+
+search_cache = SearchCache()
+
+__all__ = ["SearchCache", "normalize_search_key", "search_cache"]
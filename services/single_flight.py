@@ -0,0 +1,93 @@
+"""single-flight: concurrent identical calls share one execution."""
+
+from __future__ import annotations
+
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """collapse concurrent calls with the same key into one in-flight execution.
+
+    the first caller for a key runs fn; callers arriving while it runs wait for
+    its result (or its exception) instead of running fn themselves. nothing is
+    kept once the call finishes, so this only removes duplicate work, never
+    serves a stale result: use a cache for that. every waiter gets the same
+    object back and must treat it as read-only.
+
+    a waiter gives up on the shared call after timeout seconds and runs fn
+    itself, so one stuck execution can't hold up every request for its key.
+    """
+
+    def __init__(self, timeout: float = 5.0, enabled: bool = True):
+        self.timeout = timeout
+        self.enabled = enabled
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.shared = 0
+        self.timeouts = 0
+
+    def do(self, key: Hashable, fn: Callable[[], T], timeout: Optional[float] = None) -> T:
+        if not self.enabled:
+            return fn()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except BaseException as exc:
+                call.error = exc
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if not call.done.wait(self.timeout if timeout is None else timeout):
+            with self._lock:
+                self.timeouts += 1
+            return fn()
+        with self._lock:
+            self.shared += 1
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            calls = self.executions + self.shared
+            return {
+                "enabled": self.enabled,
+                "executions": self.executions,
+                "shared": self.shared,
+                "timeouts": self.timeouts,
+                "in_flight": len(self._calls),
+                "shared_ratio": round(self.shared / calls, 4) if calls else 0.0,
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.executions = self.shared = self.timeouts = 0
+
+
+single_flight = SingleFlight()
+
+__all__ = ["SingleFlight", "single_flight"]
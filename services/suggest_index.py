@@ -0,0 +1,82 @@
+"""prefix index over title and author tokens for typeahead suggestions."""
+
+from __future__ import annotations
+
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, List
+
+from services.catalog_index import CatalogIndex, tokenize
+
+# longer tokens are truncated: nobody types 25 characters before picking a suggestion
+MAX_TOKEN_LENGTH = 24
+MAX_TOKENS_PER_BOOK = 16
+MAX_SUGGESTIONS = 50
+
+
+def _book_tokens(book: Dict) -> List[str]:
+    tokens = tokenize(f"{book['title']} {book['author']}")
+    unique = dict.fromkeys(sys.intern(token[:MAX_TOKEN_LENGTH]) for token in tokens)
+    return list(unique)[:MAX_TOKENS_PER_BOOK]
+
+
+class PrefixIndex(CatalogIndex):
+    """sorted (token, book id) pairs searched with bisect.
+
+    tokens live in a plain sorted list (interned strings, so repeated words are
+    stored once) and ids in a parallel machine-int array, which keeps memory
+    near one pointer plus one int per indexed token.
+    """
+
+    def _reset(self) -> None:
+        self._tokens: List[str] = []
+        self._ids = array("q")
+
+    def _add(self, book: Dict) -> None:
+        for token in _book_tokens(book):
+            # new books always have the highest id, so they go after equal tokens
+            pos = bisect_right(self._tokens, token)
+            self._tokens.insert(pos, token)
+            self._ids.insert(pos, book["id"])
+
+    def _load(self, books: List[Dict]) -> None:
+        pairs = sorted((token, book["id"]) for book in books for token in _book_tokens(book))
+        self._tokens = [token for token, _ in pairs]
+        self._ids = array("q", (book_id for _, book_id in pairs))
+
+    def suggest(self, query: str, limit: int = 10) -> List[Dict]:
+        """books with a token starting with the last query word, matching all earlier words.
+
+        "harry pot" suggests books containing the word "harry" and a word
+        starting with "pot". results come in token order, then catalog order.
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+        words = [word[:MAX_TOKEN_LENGTH] for word in words]
+        *required, prefix = words
+        limit = max(1, min(limit, MAX_SUGGESTIONS))
+
+        results: List[Dict] = []
+        seen = set()
+        with self._lock:
+            pos = bisect_left(self._tokens, prefix)
+            while pos < len(self._tokens) and len(results) < limit:
+                if not self._tokens[pos].startswith(prefix):
+                    break
+                book_id = self._ids[pos]
+                pos += 1
+                if book_id in seen:
+                    continue
+                seen.add(book_id)
+                book = self.books[book_id]
+                if required and not set(required) <= set(_book_tokens(book)):
+                    continue
+                results.append(dict(book))
+        return results
+
+
+suggest_index = PrefixIndex()
+
+__all__ = ["PrefixIndex", "suggest_index"]
@@ -0,0 +1,78 @@
+"""tests for admission control on circulation endpoints."""
+
+from __future__ import annotations
+
+from app import create_app
+from routes.admission import TokenBuckets
+
+
+def _app(**config):
+    return create_app(dict({"TESTING": True}, **config))
+
+
+def test_token_bucket_refills_at_rate() -> None:
+    buckets = TokenBuckets(rate=2.0, burst=3)
+    assert [buckets.take("a", now=0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert buckets.take("a", now=0.0) == 0.5
+    assert buckets.take("a", now=0.5) == 0.0
+    # the burst caps what an idle client can save up
+    assert [buckets.take("a", now=100.0) for _ in range(4)][-1] > 0
+
+
+def test_token_buckets_evict_least_recently_used() -> None:
+    buckets = TokenBuckets(rate=1.0, burst=1, max_keys=2)
+    buckets.take("a", now=0.0)
+    buckets.take("b", now=0.0)
+    buckets.take("a", now=0.0)
+    buckets.take("c", now=0.0)
+    assert len(buckets) == 2 and buckets.evictions == 1
+    # "b" was evicted, so it starts with a full bucket; "a" is still drained
+    assert buckets.take("b", now=0.0) == 0.0
+    assert buckets.take("c", now=0.0) > 0
+
+
+def test_patron_over_limit_gets_429_with_retry_after() -> None:
+    client = _app(ADMISSION_PATRON_BURST=2, ADMISSION_PATRON_RATE=0.1).test_client()
+    for _ in range(2):
+        assert client.get("/api/late_fee/123456/3").status_code == 200
+    response = client.get("/api/late_fee/123456/3")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert "patron" in response.get_json()["error"]
+    # other patrons from the same address are unaffected
+    assert client.get("/api/late_fee/654321/3").status_code == 200
+
+
+def test_address_limit_covers_web_forms() -> None:
+    app = _app(ADMISSION_IP_BURST=1, ADMISSION_IP_RATE=0.1)
+    client = app.test_client()
+    assert client.post("/borrow", data={"patron_id": "111111", "book_id": "1"}).status_code == 302
+    response = client.post("/borrow", data={"patron_id": "222222", "book_id": "1"})
+    assert response.status_code == 429 and response.mimetype == "text/plain"
+    # pages outside the circulation endpoints are never limited
+    assert client.get("/catalog").status_code == 200
+    assert app.extensions["admission"].stats()["shed"]["ip"] == 1
+
+
+def test_writes_are_shed_when_every_slot_is_busy() -> None:
+    app = _app(ADMISSION_MAX_CONCURRENT_WRITES=1, ADMISSION_WRITE_WAIT=0.01)
+    client = app.test_client()
+    control = app.extensions["admission"]
+    assert control.acquire_write_slot()
+    try:
+        assert client.post("/return", data={"patron_id": "123456", "book_id": "3"}).status_code == 429
+        # loading the return form doesn't need a write slot
+        assert client.get("/return").status_code == 200
+    finally:
+        control.release_write_slot()
+    assert client.post("/return", data={"patron_id": "123456", "book_id": "3"}).status_code == 200
+    # the request gave its slot back
+    assert control.acquire_write_slot()
+    control.release_write_slot()
+
+
+def test_admission_control_can_be_turned_off() -> None:
+    app = _app(ADMISSION_CONTROL=False, ADMISSION_PATRON_BURST=0)
+    assert "admission" not in app.extensions
+    assert app.test_client().get("/api/late_fee/123456/3").status_code == 200
+    assert app.test_client().get("/api/admission/stats").get_json() == {"enabled": False}
@@ -0,0 +1,68 @@
+"""tests for app factory config and sqlite write contention."""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import database
+from app import create_app
+
+
+def test_create_app_seeds_sample_data_by_default() -> None:
+    app = create_app({"TESTING": True})
+    response = app.test_client().get("/catalog")
+    assert response.status_code == 200
+    assert database.get_book_by_isbn("9780743273565") is not None
+
+
+def test_create_app_skips_startup_work_when_disabled(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls = []
+    monkeypatch.setattr("app.init_database", lambda: calls.append("init"))
+    monkeypatch.setattr("app.add_sample_data", lambda: calls.append("seed"))
+    create_app({"TESTING": True, "INIT_DATABASE": False, "SAMPLE_DATA": False})
+    assert calls == []
+
+
+def _hold_write_lock() -> sqlite3.Connection:
+    conn = database.get_db_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    return conn
+
+
+def test_write_gives_up_while_database_stays_locked(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(database, "BUSY_TIMEOUT", 0.01)
+    monkeypatch.setattr(database, "WRITE_RETRIES", 1)
+    monkeypatch.setattr(database, "RETRY_BACKOFF", 0.01)
+    blocker = _hold_write_lock()
+    try:
+        assert database.insert_book("locked", "writer", "1000000000098", 1, 1) is False
+    finally:
+        blocker.rollback()
+        blocker.close()
+
+
+def test_write_retries_until_lock_released(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(database, "BUSY_TIMEOUT", 0.01)
+    monkeypatch.setattr(database, "WRITE_RETRIES", 5)
+    monkeypatch.setattr(database, "RETRY_BACKOFF", 0.02)
+    locked = threading.Event()
+
+    def hold_briefly() -> None:
+        blocker = _hold_write_lock()
+        locked.set()
+        time.sleep(0.05)
+        blocker.rollback()
+        blocker.close()
+
+    holder = threading.Thread(target=hold_briefly)
+    holder.start()
+    locked.wait()
+    try:
+        assert database.insert_book("contended", "writer", "1000000000099", 1, 1) is True
+    finally:
+        holder.join()
+    assert database.get_book_by_isbn("1000000000099") is not None
@@ -0,0 +1,84 @@
+"""tests for archiving old returned loans out of borrow_records."""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import database
+from app import create_app
+from services import library_service
+
+PATRON = "222333"
+
+
+def _add_history() -> int:
+    database.insert_book("archived book", "author", "9780000000309", 5, 5)
+    book_id = database.get_book_by_isbn("9780000000309")["id"]
+    long_ago = datetime.now() - timedelta(days=800)
+    for offset in range(3):
+        borrowed = long_ago + timedelta(days=offset * 30)
+        database.insert_borrow_record(PATRON, book_id, borrowed, borrowed + timedelta(days=14))
+        database.update_borrow_record_return_date(PATRON, book_id, borrowed + timedelta(days=7))
+    recent = datetime.now() - timedelta(days=3)
+    database.insert_borrow_record(PATRON, book_id, recent, recent + timedelta(days=14))
+    return book_id
+
+
+@pytest.mark.parametrize("shards", [1, 2])
+def test_archive_moves_old_returned_loans(monkeypatch: pytest.MonkeyPatch, shards: int) -> None:
+    monkeypatch.setattr(database, "SHARD_COUNT", shards)
+    database.init_database()
+    _add_history()
+
+    assert database.archive_loans(datetime.now() - timedelta(days=365), batch_size=2) == 3
+    assert len(database.get_patron_borrow_records(PATRON)) == 1
+    assert len(database.get_archived_borrow_records(PATRON)) == 3
+    # nothing left to move on a second run
+    assert database.archive_loans(datetime.now() - timedelta(days=365)) == 0
+
+    report = library_service.get_patron_status_report(PATRON)
+    assert report["active_count"] == 1 and report["history"] == []
+    full = library_service.get_patron_status_report(PATRON, include_archived=True)
+    assert full["active_count"] == 1
+    assert len(full["history"]) == 3
+    assert full["history"][0]["borrow_date"] > full["history"][-1]["borrow_date"]
+
+
+def test_status_page_full_history_link(monkeypatch: pytest.MonkeyPatch) -> None:
+    _add_history()
+    database.archive_loans(datetime.now() - timedelta(days=365))
+    client = create_app({"TESTING": True, "SAMPLE_DATA": False}).test_client()
+
+    page = client.get(f"/status?patron_id={PATRON}").get_data(as_text=True)
+    assert "history=all" in page
+    assert page.count("<td>archived book") == 1
+    page = client.get(f"/status?patron_id={PATRON}&history=all").get_data(as_text=True)
+    assert page.count("<td>archived book") == 4
+
+
+@pytest.mark.parametrize("shards", [1, 2])
+def test_archive_run_refreshes_a_cached_status_page(monkeypatch: pytest.MonkeyPatch, shards: int) -> None:
+    # restored after the test along with the shard count create_app sets
+    monkeypatch.setattr(database, "SHARD_COUNT", shards)
+    app = create_app({"TESTING": True, "SAMPLE_DATA": False, "LOAN_SHARDS": shards})
+    client = app.test_client()
+    _add_history()
+    before = client.get(f"/status?patron_id={PATRON}")
+    assert before.get_data(as_text=True).count("<td>archived book") == 4
+
+    result = app.test_cli_runner().invoke(args=["archive", "run", "--older-than-days", "365"])
+    assert result.exit_code == 0, result.output
+    after = client.get(f"/status?patron_id={PATRON}")
+    assert after.get_data(as_text=True).count("<td>archived book") == 1
+    assert after.headers["ETag"] != before.headers["ETag"]
+
+
+def test_archive_command_reports_reduction() -> None:
+    _add_history()
+    app = create_app({"TESTING": True, "SAMPLE_DATA": False})
+    result = app.test_cli_runner().invoke(args=["archive", "run", "--older-than-days", "365"])
+    assert result.exit_code == 0, result.output
+    assert "Archived 3 loans" in result.output
+    assert "Hot loans: 4 -> 1 rows" in result.output
@@ -0,0 +1,70 @@
+"""tests for the live availability feed and its SSE endpoint."""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+
+import database
+from app import create_app
+from services import library_service
+from services.availability_feed import AvailabilityFeed
+from services.pubsub import PubSub
+
+
+def _event(chunk: bytes):
+    name, data = chunk.decode().strip().split("\n")
+    return name.removeprefix("event: "), json.loads(data.removeprefix("data: "))
+
+
+def test_feed_publishes_local_changes_and_polled_ones() -> None:
+    hub = PubSub()
+    feed = AvailabilityFeed(hub, poll_interval=60)
+    database.insert_book("live book", "author", "9780000000408", 2, 2)
+    book_id = database.get_book_by_isbn("9780000000408")["id"]
+
+    with feed.subscribe() as subscription:
+        version, available = feed.snapshot()
+        assert available[book_id] == 2
+
+        # queued by the listener, published by the feed's dispatcher thread
+        feed.changed(book_id, 1)
+        assert subscription.get(timeout=5) == [(book_id, 1)]
+
+        # another worker's write only shows up as a moved catalog version
+        conn = sqlite3.connect(database.DATABASE)
+        conn.execute("UPDATE books SET available_copies = 0 WHERE id = ?", (book_id,))
+        conn.commit()
+        conn.close()
+        assert feed.refresh() == [(book_id, 0)]
+        assert subscription.get(timeout=1) == [(book_id, 0)]
+        assert feed.refresh() == []
+        assert feed.snapshot()[0] > version
+
+
+def test_stream_sends_snapshot_then_deltas() -> None:
+    app = create_app({"TESTING": True, "AVAILABILITY_STREAM_KEEPALIVE_SECONDS": 0.05})
+    book = database.get_book_by_isbn("9780743273565")
+    response = app.test_client().get("/api/stream/availability", buffered=False)
+    assert response.mimetype == "text/event-stream"
+    chunks = iter(response.response)
+    try:
+        assert next(chunks).startswith(b"retry: ")
+        name, snapshot = _event(next(chunks))
+        assert name == "snapshot"
+        assert [book["id"], book["available_copies"]] in snapshot["books"]
+
+        assert library_service.borrow_book_by_patron("400000", book["id"])[0] is True
+        chunk = next(chunks)
+        while chunk == b": keepalive\n\n":
+            chunk = next(chunks)
+        assert _event(chunk) == ("availability", [[book["id"], book["available_copies"] - 1]])
+    finally:
+        response.close()
+
+
+def test_catalog_page_opens_a_stream_only_when_asked() -> None:
+    page = create_app({"TESTING": True}).test_client().get("/catalog").get_data(as_text=True)
+    assert "/api/stream/availability" not in page
+    app = create_app({"TESTING": True, "CATALOG_LIVE_AVAILABILITY": True})
+    assert "/api/stream/availability" in app.test_client().get("/catalog").get_data(as_text=True)
@@ -0,0 +1,127 @@
+"""tests for online snapshots and restore."""
+
+from __future__ import annotations
+
+import os
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+import database
+from app import create_app
+from services import backup
+from services.suggest_index import PrefixIndex
+
+
+@pytest.fixture
+def backup_dir(tmp_path: Path) -> str:
+    return str(tmp_path / "backups")
+
+
+def _add_book(n: int) -> None:
+    assert database.insert_book(f"book {n}", "author", f"97800000{n:05d}", 1, 1)
+
+
+def test_paced_snapshot_finishes_under_steady_writes(backup_dir: str) -> None:
+    for n in range(200):
+        _add_book(n)
+    stop = threading.Event()
+    written = []
+
+    def writer():
+        n = 1000
+        while not stop.is_set():
+            _add_book(n)
+            written.append(n)
+            n += 1
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        manifest = backup.create_snapshot(backup_dir, pages=1, sleep=0.001)
+    finally:
+        stop.set()
+        thread.join()
+    assert written, "writes kept flowing during the backup"
+    assert backup.verify_snapshot(manifest["name"], backup_dir) == []
+    assert manifest["files"][0]["pages"] > 1
+
+
+def test_unchanged_files_are_linked_not_copied(backup_dir: str) -> None:
+    first = backup.create_snapshot(backup_dir)
+    second = backup.create_snapshot(backup_dir)
+    assert [entry["linked"] for entry in second["files"]] == [True]
+    name = os.path.basename(database.DATABASE)
+    assert os.path.samefile(Path(backup_dir, first["name"], name), Path(backup_dir, second["name"], name))
+    _add_book(1)
+    assert backup.create_snapshot(backup_dir)["files"][0]["linked"] is False
+
+
+def test_retention_keeps_the_newest_snapshots(backup_dir: str) -> None:
+    names = []
+    for n in range(3):
+        _add_book(n)
+        names.append(backup.create_snapshot(backup_dir, keep=2)["name"])
+    assert [manifest["name"] for manifest in backup.list_snapshots(backup_dir)] == names[1:]
+    assert backup.verify_snapshot(names[2], backup_dir) == []
+
+
+def test_restore_brings_data_back_and_moves_catalog_version(backup_dir: str) -> None:
+    _add_book(1)
+    manifest = backup.create_snapshot(backup_dir)
+    _add_book(2)
+    version = database.get_catalog_version()
+    assert backup.restore_snapshot(manifest["name"], backup_dir) == [database.DATABASE]
+    titles = {book["title"] for book in database.get_all_books()}
+    assert "book 1" in titles and "book 2" not in titles
+    assert database.get_catalog_version() > version
+    # the restored file is a working WAL database again
+    conn = database.get_db_connection()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+
+
+def test_restore_rebuilds_catalog_indexes_and_names_files_left_behind(backup_dir: str) -> None:
+    _add_book(1)
+    manifest = backup.create_snapshot(backup_dir)
+    _add_book(2)
+    index = PrefixIndex()
+    index.sync()
+    assert [book["title"] for book in index.suggest("book")] == ["book 1", "book 2"]
+    # loans archived after the snapshot live in a file it doesn't have
+    book_id = database.get_book_by_isbn("9780000000001")["id"]
+    long_ago = datetime.now() - timedelta(days=800)
+    database.insert_borrow_record("100001", book_id, long_ago, long_ago + timedelta(days=14))
+    database.update_borrow_record_return_date("100001", book_id, long_ago + timedelta(days=7))
+    assert database.archive_loans(datetime.now() - timedelta(days=365)) == 1
+
+    backup.restore_snapshot(manifest["name"], backup_dir)
+    index.sync()
+    assert [book["title"] for book in index.suggest("book")] == ["book 1"]
+    assert backup.unrestored_files(manifest["name"], backup_dir) == [database.archive_path(database.DATABASE)]
+
+
+def test_corrupted_snapshot_fails_verification_and_is_not_restored(backup_dir: str) -> None:
+    manifest = backup.create_snapshot(backup_dir)
+    path = Path(backup_dir, manifest["name"], os.path.basename(database.DATABASE))
+    data = bytearray(path.read_bytes())
+    data[-100] ^= 0xFF
+    path.write_bytes(bytes(data))
+    assert "checksum mismatch" in backup.verify_snapshot(manifest["name"], backup_dir)[0]
+    with pytest.raises(backup.BackupError):
+        backup.restore_snapshot(manifest["name"], backup_dir)
+    with pytest.raises(backup.BackupError, match="no snapshot"):
+        backup.verify_snapshot("missing", backup_dir)
+
+
+def test_backup_cli(backup_dir: str) -> None:
+    runner = create_app({"TESTING": True, "BACKUP_DIR": backup_dir}).test_cli_runner()
+    result = runner.invoke(args=["backup", "create"])
+    assert result.exit_code == 0 and "copied 1 file(s)" in result.output
+    name = backup.list_snapshots(backup_dir)[0]["name"]
+    assert name in runner.invoke(args=["backup", "list"]).output
+    assert "intact" in runner.invoke(args=["backup", "verify", name]).output
+    result = runner.invoke(args=["backup", "restore", name, "--yes"])
+    assert result.exit_code == 0 and "Restored 1 file(s)" in result.output
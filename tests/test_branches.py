@@ -0,0 +1,201 @@
+"""tests for branch-aware inventory."""
+
+from __future__ import annotations
+
+import sqlite3
+
+import database
+from app import create_app
+from services import copy_service, hold_service, library_service
+
+
+def _book(isbn: str, total: int) -> int:
+    assert database.insert_book(f"book {isbn}", "author", isbn, total, total)
+    return database.get_book_by_isbn(isbn)["id"]
+
+
+def _branch(code: str) -> int:
+    assert copy_service.add_branch(code, f"{code} branch")[0]
+    return database.get_branch_by_code(code)["id"]
+
+
+def _at(book_id: int) -> dict:
+    return {entry["code"]: (entry["available"], entry["total"])
+            for entry in database.get_book_by_id(book_id)["branches"]}
+
+
+def _send(book_id: int, number: int, code: str) -> None:
+    assert copy_service.move_copy_to_branch(database.copy_barcode(book_id, number), code)[0]
+
+
+def _inventory_matches_copies() -> bool:
+    conn = database.get_db_connection()
+    stored = {tuple(row) for row in conn.execute(
+        "SELECT book_id, branch_id, total_copies, available_copies FROM branch_inventory WHERE total_copies > 0")}
+    counted = {tuple(row) for row in conn.execute('''
+        SELECT book_id, branch_id, SUM(status != 'withdrawn'), SUM(status = 'available')
+        FROM copies GROUP BY book_id, branch_id HAVING SUM(status != 'withdrawn') > 0
+    ''')}
+    conn.close()
+    return stored == counted
+
+
+def test_migration_puts_existing_copies_at_main(tmp_path) -> None:
+    conn = sqlite3.connect(tmp_path / "old.db")
+    database._apply_migrations(conn, database._MIGRATIONS[:9])
+    conn = sqlite3.connect(tmp_path / "old.db")
+    conn.execute("INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES ('a', 'b', '1', 3, 2)")
+    conn.execute("INSERT INTO copies (book_id, barcode, status) VALUES (1, 'x1', 'available'), (1, 'x2', 'available'), "
+                 "(1, 'x3', 'on_loan'), (1, 'x4', 'withdrawn')")
+    conn.commit()
+    database._apply_migrations(conn, database._MIGRATIONS)
+    conn = sqlite3.connect(tmp_path / "old.db")
+    inventory = conn.execute("SELECT * FROM branch_inventory").fetchall()
+    availability = conn.execute("SELECT branch_availability FROM books").fetchone()[0]
+    conn.close()
+    assert inventory == [(1, 1, 3, 2)]
+    assert availability == '{"MAIN":[2,3]}'
+
+
+def test_counts_follow_borrows_returns_and_transfers() -> None:
+    _branch("EAST")
+    book_id = _book("9780000000301", 3)
+    _send(book_id, 3, "EAST")
+    assert _at(book_id) == {"MAIN": (2, 2), "EAST": (1, 1)}
+
+    assert library_service.borrow_book_by_patron("100001", book_id, "east")[0]
+    assert _at(book_id) == {"MAIN": (2, 2), "EAST": (0, 1)}
+    assert library_service.return_book_by_patron("100001", book_id, "MAIN")[0]
+    assert _at(book_id) == {"MAIN": (3, 3)}
+    assert _inventory_matches_copies()
+
+
+def test_borrowing_at_a_branch_lends_its_copy_or_says_where_to_go() -> None:
+    _branch("EAST")
+    book_id = _book("9780000000318", 2)
+    _send(book_id, 2, "EAST")
+
+    assert library_service.borrow_book_by_patron("100001", book_id, "EAST")[0]
+    record = database.get_active_borrow_record("100001", book_id)
+    assert record["branch_id"] == database.get_branch_by_code("EAST")["id"]
+    assert record["copy_id"] == database.get_copy_by_barcode(database.copy_barcode(book_id, 2))["id"]
+
+    success, message = library_service.borrow_book_by_patron("100002", book_id, "EAST")
+    assert not success and message == "No copy is available at EAST. Available at: MAIN."
+    assert library_service.borrow_book_by_patron("100002", book_id, "NOWHERE") == (False, "Unknown branch.")
+    assert library_service.borrow_book_by_patron("100002", book_id)[0]
+    assert database.get_book_by_id(book_id)["available_copies"] == 0
+
+
+def test_returned_copy_stays_where_it_was_returned() -> None:
+    east = _branch("EAST")
+    book_id = _book("9780000000325", 1)
+    assert library_service.borrow_book_by_patron("100001", book_id)[0]
+    assert library_service.return_book_by_patron("100001", book_id, "EAST")[0]
+
+    copy = database.get_book_copies(book_id)[0]
+    assert (copy["status"], copy["branch_id"]) == ("available", east)
+    record = database.get_patron_borrow_records("100001")[0]
+    assert (record["branch_id"], record["return_branch_id"]) == (database.MAIN_BRANCH_ID, east)
+
+    # with no branch given, a return goes back to the lending branch
+    assert library_service.borrow_book_by_patron("100001", book_id)[0]
+    assert library_service.return_book_by_patron("100001", book_id)[0]
+    assert database.get_book_copies(book_id)[0]["branch_id"] == east
+
+
+def test_ready_hold_is_picked_up_whichever_branch_is_named() -> None:
+    _branch("EAST")
+    book_id = _book("9780000000332", 1)
+    assert library_service.borrow_book_by_patron("100001", book_id)[0]
+    assert hold_service.place_hold("100002", book_id)[0]
+    assert library_service.return_book_by_patron("100001", book_id)[0]
+    assert library_service.borrow_book_by_patron("100002", book_id, "EAST")[0]
+    assert _at(book_id) == {"MAIN": (0, 1)}
+    assert _inventory_matches_copies()
+
+
+def test_copies_on_loan_cannot_be_transferred() -> None:
+    _branch("EAST")
+    book_id = _book("9780000000349", 1)
+    assert library_service.borrow_book_by_patron("100001", book_id)[0]
+    success, message = copy_service.move_copy_to_branch(database.copy_barcode(book_id, 1), "EAST")
+    assert not success and "out on loan" in message
+    assert copy_service.add_branch("east", "again") == (False, "A branch with this code already exists.")
+    assert not copy_service.add_branch("no spaces", "x")[0]
+
+
+def test_catalog_is_one_indexed_query_on_books() -> None:
+    conn = database.get_db_connection()
+    plan = " ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN SELECT * FROM books ORDER BY title"))
+    conn.close()
+    assert "idx_books_title" in plan and "TEMP B-TREE" not in plan
+
+
+def test_pages_and_api_show_availability_by_branch() -> None:
+    client = create_app({"TESTING": True}).test_client()
+    _branch("EAST")
+    book_id = _book("9780000000356", 2)
+    _send(book_id, 2, "EAST")
+
+    page = client.get("/catalog").get_data(as_text=True)
+    assert "MAIN 1/1" in page and "EAST 1/1" in page and '<option value="EAST">' in page
+    results = client.get("/api/search?q=9780000000356&type=isbn").get_json()
+    assert results["results"][0]["branches"] == [
+        {"code": "MAIN", "available": 1, "total": 1}, {"code": "EAST", "available": 1, "total": 1}]
+
+    branches = {row["code"]: row for row in client.get("/api/branches").get_json()["branches"]}
+    assert (branches["EAST"]["available_copies"], branches["EAST"]["total_copies"]) == (1, 1)
+
+    barcode = database.copy_barcode(book_id, 1)
+    response = client.post(f"/api/copies/{barcode}/transfer", json={"branch": "EAST"})
+    assert response.status_code == 200 and _at(book_id) == {"EAST": (2, 2)}
+    assert client.post(f"/api/copies/{barcode}/transfer", json={"branch": "MARS"}).status_code == 400
+
+    response = client.post("/borrow", data={"patron_id": "100001", "book_id": book_id, "branch": "EAST"})
+    assert response.status_code == 302
+    assert database.get_active_borrow_record("100001", book_id)["branch_id"] == branches["EAST"]["id"]
+    assert database.get_active_borrow_record("100001", book_id)["copy_id"] == database.get_copy_by_barcode(barcode)["id"]
+    assert client.post(f"/api/copies/{barcode}/return", json={"branch": "MAIN"}).status_code == 200
+    assert _at(book_id) == {"MAIN": (1, 1), "EAST": (1, 1)}
+
+
+def test_ready_hold_lends_the_copy_set_aside_for_that_patron() -> None:
+    _branch("EAST")
+    book_id = _book("9780000000363", 2)
+    first, second = (database.get_copy_by_barcode(database.copy_barcode(book_id, n))["id"] for n in (1, 2))
+    assert library_service.borrow_book_by_patron("100001", book_id)[0]
+    assert library_service.borrow_book_by_patron("100002", book_id)[0]
+    for patron_id in ("200001", "200002", "200003"):
+        assert hold_service.place_hold(patron_id, book_id)[0]
+
+    assert library_service.return_book_by_patron("100001", book_id)[0]
+    assert library_service.return_book_by_patron("100002", book_id, "EAST")[0]
+    held = {copy["id"]: (copy["status"], copy["patron_id"]) for copy in database.get_book_copies(book_id)}
+    assert held == {first: ("on_hold", "200001"), second: ("on_hold", "200002")}
+
+    # 200002's copy waits at EAST; the lower-numbered copy at MAIN is 200001's
+    assert library_service.borrow_book_by_patron("200002", book_id)[0]
+    assert database.get_active_borrow_record("200002", book_id)["copy_id"] == second
+
+    # a cancelled hold passes its own copy to the next patron in line
+    hold_id = hold_service.ready_holds("200001")[0]["id"]
+    assert hold_service.cancel_hold("200001", hold_id)[0]
+    assert database.get_copy_by_barcode(database.copy_barcode(book_id, 1))["patron_id"] == "200003"
+    assert library_service.borrow_book_by_patron("200003", book_id)[0]
+    assert database.get_active_borrow_record("200003", book_id)["copy_id"] == first
+    assert _inventory_matches_copies()
+
+
+def test_scanning_a_copy_returns_that_copy_of_several_out_to_one_patron() -> None:
+    book_id = _book("9780000000370", 2)
+    first, second = (database.copy_barcode(book_id, n) for n in (1, 2))
+    for _ in range(2):
+        assert library_service.borrow_book_by_patron("100001", book_id)[0]
+
+    assert copy_service.return_copy(second)[0]
+    assert database.get_copy_by_barcode(first)["status"] == "on_loan"
+    assert database.get_copy_by_barcode(second)["status"] == "available"
+    assert database.get_active_borrow_record("100001", book_id)["copy_id"] == database.get_copy_by_barcode(first)["id"]
+    assert database.get_book_by_id(book_id)["available_copies"] == 1
+    assert _inventory_matches_copies()
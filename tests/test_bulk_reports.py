@@ -0,0 +1,60 @@
+"""tests for bulk patron status report generation."""
+
+from __future__ import annotations
+
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import database
+from app import create_app
+from services import library_service
+from services.bulk_reports import generate_reports
+
+
+def _add_loans() -> None:
+    database.insert_book("bulk book", "author", "9780000000408", 50, 50)
+    book_id = database.get_book_by_isbn("9780000000408")["id"]
+    overdue = datetime.now() - timedelta(days=20)
+    for patron in ("100001", "100002", "100003"):
+        database.insert_borrow_record(patron, book_id, overdue, overdue + timedelta(days=14))
+    returned = datetime.now() - timedelta(days=40)
+    database.insert_borrow_record("100004", book_id, returned, returned + timedelta(days=14))
+    database.update_borrow_record_return_date("100004", book_id, returned + timedelta(days=3))
+
+
+@pytest.mark.parametrize("shards", [1, 3])
+def test_jsonl_reports_match_single_patron_reports(tmp_path, monkeypatch: pytest.MonkeyPatch, shards: int) -> None:
+    monkeypatch.setattr(database, "SHARD_COUNT", shards)
+    database.init_database()
+    _add_loans()
+    output = tmp_path / "notices.jsonl"
+
+    result = generate_reports(str(output), workers=0, chunk_size=2)
+
+    assert result["patrons"] == 3 and result["loans"] == 3
+    reports = {report["patron_id"]: report for report in map(json.loads, output.read_text().splitlines())}
+    assert set(reports) == {"100001", "100002", "100003"}
+    single = library_service.get_patron_status_report("100001")
+    assert reports["100001"]["total_late_fees"] == single["total_late_fees"] == 3.0
+    assert reports["100001"]["active_count"] == 1
+
+
+def test_reports_on_process_pool_write_notice_files(tmp_path) -> None:
+    _add_loans()
+    result = generate_reports(str(tmp_path / "notices"), "files", workers=2, chunk_size=1, active_only=False)
+    assert result["patrons"] == 4
+    notice = (tmp_path / "notices" / "100002.txt").read_text()
+    assert "OVERDUE, late fee $3.00" in notice
+    assert "no books out" in (tmp_path / "notices" / "100004.txt").read_text()
+
+
+def test_notices_command(tmp_path) -> None:
+    _add_loans()
+    app = create_app({"TESTING": True, "SAMPLE_DATA": False})
+    output = tmp_path / "out.jsonl"
+    result = app.test_cli_runner().invoke(args=["reports", "notices", str(output), "--workers", "1"])
+    assert result.exit_code == 0, result.output
+    assert "Wrote 3 patron reports" in result.output
+    assert len(output.read_text().splitlines()) == 3
@@ -0,0 +1,106 @@
+"""tests for in-memory catalog indexes."""
+
+from __future__ import annotations
+
+import pytest
+
+import database
+from services import library_service
+from services.catalog_index import CatalogIndex
+from services.fuzzy_index import FuzzyIndex, edit_distance
+from services.suggest_index import PrefixIndex
+
+
+def _books(*rows):
+    return [{"id": i, "title": title, "author": author} for i, (title, author) in enumerate(rows, 1)]
+
+
+def test_index_missing_a_hook_fails_when_created() -> None:
+    class TitlesOnly(CatalogIndex):
+        def _reset(self) -> None:
+            self.titles = []
+
+    with pytest.raises(TypeError):
+        TitlesOnly()
+
+
+# prefix index
+
+
+def test_prefix_index_matches_title_and_author_tokens() -> None:
+    index = PrefixIndex()
+    index.load(_books(("Harry Potter", "J. K. Rowling"), ("Hard Times", "Charles Dickens")))
+    assert {b["id"] for b in index.suggest("har")} == {1, 2}
+    assert [b["id"] for b in index.suggest("dick")] == [2]
+
+
+def test_prefix_index_requires_earlier_words() -> None:
+    index = PrefixIndex()
+    index.load(_books(("Harry Potter", "Rowling"), ("Potted Plants", "Harriet Gardener")))
+    assert [b["id"] for b in index.suggest("harry pot")] == [1]
+
+
+def test_prefix_index_normalizes_case_and_accents() -> None:
+    index = PrefixIndex()
+    index.load(_books(("Émile", "Rousseau")))
+    assert [b["id"] for b in index.suggest("EMI")] == [1]
+
+
+def test_prefix_index_incremental_add_matches_bulk_load() -> None:
+    rows = _books(("Alpha Code", "Ann"), ("Alpine Trails", "Al"), ("Beta", "Alan"))
+    bulk, incremental = PrefixIndex(), PrefixIndex()
+    bulk.load(rows)
+    for row in rows:
+        incremental.add_book(row)
+    assert bulk.suggest("al", limit=10) == incremental.suggest("al", limit=10)
+
+
+def test_prefix_index_respects_limit() -> None:
+    index = PrefixIndex()
+    index.load(_books(*[(f"series volume {i}", "author") for i in range(20)]))
+    assert len(index.suggest("series", limit=5)) == 5
+
+
+def test_suggest_books_syncs_new_catalog_rows() -> None:
+    database.insert_book("animal farm", "george orwell", "1000000000600", 1, 1)
+    assert [b["title"] for b in library_service.suggest_books("anim")] == ["animal farm"]
+
+    # written behind the service's back, e.g. by another worker process
+    database.insert_book("animal dreams", "barbara kingsolver", "1000000000601", 1, 1)
+    titles = {b["title"] for b in library_service.suggest_books("anim")}
+    assert titles == {"animal farm", "animal dreams"}
+
+
+# fuzzy index
+
+
+def test_edit_distance_with_cutoff() -> None:
+    assert edit_distance("orwell", "orwel", 2) == 1
+    assert edit_distance("kitten", "sitting", 3) == 3
+    assert edit_distance("short", "considerably longer", 2) == 3
+
+
+def test_fuzzy_index_tolerates_typos() -> None:
+    index = FuzzyIndex()
+    index.load(_books(("Nineteen Eighty-Four", "George Orwell"), ("Brave New World", "Aldous Huxley")))
+    assert index.search("geroge orwel") == [1]
+    assert index.search("huxly") == [2]
+
+
+def test_fuzzy_index_ranks_closer_matches_first() -> None:
+    index = FuzzyIndex()
+    index.load(_books(("Mockingbird Songs", "A"), ("Mockingbirds", "B")))
+    assert index.search("mockingbird") == [1, 2]
+
+
+def test_fuzzy_index_rejects_distant_words() -> None:
+    index = FuzzyIndex()
+    index.load(_books(("Dune", "Frank Herbert")))
+    assert index.search("dickens") == []
+
+
+def test_service_fuzzy_search_returns_full_rows() -> None:
+    database.insert_book("the great gatsby", "f. scott fitzgerald", "1000000000620", 3, 2)
+    results = library_service.search_books_in_catalog("graet gatsbey", "fuzzy")
+    assert [book["title"] for book in results] == ["the great gatsby"]
+    assert results[0]["available_copies"] == 2
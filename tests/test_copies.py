@@ -0,0 +1,139 @@
+"""tests for item-level copy tracking."""
+
+from __future__ import annotations
+
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import database
+from app import create_app
+from services import hold_service, library_service
+
+
+def _book(isbn: str, total: int, available: int = None) -> int:
+    assert database.insert_book(f"book {isbn}", "author", isbn, total, total if available is None else available)
+    return database.get_book_by_isbn(isbn)["id"]
+
+
+def _statuses(book_id: int) -> list:
+    return [copy["status"] for copy in database.get_book_copies(book_id)]
+
+
+def test_new_books_get_a_barcoded_copy_per_copy() -> None:
+    book_id = _book("9780000000103", 3, 2)
+    copies = database.get_book_copies(book_id)
+    assert [copy["barcode"] for copy in copies] == [database.copy_barcode(book_id, n) for n in (1, 2, 3)]
+    assert _statuses(book_id) == ["available", "available", "on_loan"]
+
+
+def test_migration_backfills_copies_from_the_counters(tmp_path) -> None:
+    conn = sqlite3.connect(tmp_path / "old.db")
+    database._apply_migrations(conn, database._MIGRATIONS[:8])
+    conn = sqlite3.connect(tmp_path / "old.db")
+    conn.execute("INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES ('a', 'b', '1', 4, 1)")
+    conn.execute("INSERT INTO holds (patron_id, book_id, created_at, status) VALUES ('100001', 1, 'x', 'ready')")
+    conn.commit()
+    database._apply_migrations(conn, database._MIGRATIONS)
+    conn = sqlite3.connect(tmp_path / "old.db")
+    rows = conn.execute("SELECT barcode, status FROM copies ORDER BY id").fetchall()
+    conn.close()
+    assert rows == [("000000010001", "available"), ("000000010002", "on_hold"),
+                    ("000000010003", "on_loan"), ("000000010004", "on_loan")]
+
+
+def test_borrow_and_return_move_a_specific_copy() -> None:
+    book_id = _book("9780000000110", 2)
+    assert library_service.borrow_book_by_patron("100001", book_id)[0]
+    record = database.get_active_borrow_record("100001", book_id)
+    copy = database.get_copy_by_barcode(database.copy_barcode(book_id, 1))
+    assert record["copy_id"] == copy["id"]
+    assert (copy["status"], copy["patron_id"]) == ("on_loan", "100001")
+
+    assert library_service.return_book_by_patron("100001", book_id)[0]
+    assert _statuses(book_id) == ["available", "available"]
+
+
+def test_concurrent_borrowers_never_share_a_copy() -> None:
+    book_id = _book("9780000000127", 3)
+    results = []
+    barrier = threading.Barrier(10)
+
+    def borrow(n: int) -> None:
+        barrier.wait()
+        results.append(library_service.borrow_book_by_patron(f"{200000 + n}", book_id)[0])
+
+    threads = [threading.Thread(target=borrow, args=(n,)) for n in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count(True) == 3
+    lent = database.get_book_copies(book_id)
+    assert {copy["status"] for copy in lent} == {"on_loan"}
+    assert len({copy["patron_id"] for copy in lent}) == 3
+    assert database.get_book_by_id(book_id)["available_copies"] == 0
+
+
+def test_copy_for_a_ready_hold_goes_to_that_patron() -> None:
+    book_id = _book("9780000000134", 1)
+    assert library_service.borrow_book_by_patron("100001", book_id)[0]
+    assert hold_service.place_hold("100002", book_id)[0]
+    assert library_service.return_book_by_patron("100001", book_id)[0]
+    assert _statuses(book_id) == ["on_hold"]
+    assert library_service.borrow_book_by_patron("100002", book_id)[0]
+    copy = database.get_book_copies(book_id)[0]
+    assert (copy["status"], copy["patron_id"]) == ("on_loan", "100002")
+
+
+def test_expired_hold_puts_its_copy_back_on_the_shelf() -> None:
+    book_id = _book("9780000000141", 1)
+    assert library_service.borrow_book_by_patron("100001", book_id)[0]
+    assert hold_service.place_hold("100002", book_id)[0]
+    assert library_service.return_book_by_patron("100001", book_id)[0]
+    assert hold_service.expire_holds(datetime.now() + timedelta(days=30)) == 1
+    assert _statuses(book_id) == ["available"]
+
+
+def test_loans_from_before_copy_tracking_release_an_untracked_copy() -> None:
+    book_id = _book("9780000000158", 2, 1)
+    now = datetime.now()
+    database.insert_borrow_record("100001", book_id, now, now + timedelta(days=14))
+    assert library_service.return_book_by_patron("100001", book_id)[0]
+    assert _statuses(book_id) == ["available", "available"]
+
+
+def test_lookups_use_the_indexes() -> None:
+    conn = database.get_db_connection()
+    plan = " ".join(row[3] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT c.*, b.title FROM copies c JOIN books b ON b.id = c.book_id WHERE c.barcode = ?",
+        ("1",),
+    ))
+    assert "USING INDEX sqlite_autoindex_copies" in plan
+    plan = " ".join(row[3] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT id FROM copies WHERE book_id = ? AND status = ? ORDER BY id LIMIT 1",
+        (1, "available"),
+    ))
+    conn.close()
+    assert "idx_copies_book_status" in plan and "TEMP B-TREE" not in plan
+
+
+def test_barcode_endpoints() -> None:
+    client = create_app({"TESTING": True}).test_client()
+    book_id = _book("9780000000165", 1)
+    barcode = database.copy_barcode(book_id, 1)
+    assert client.get(f"/api/copies/{barcode}").get_json()["status"] == "available"
+    assert client.post(f"/api/copies/{barcode}/return").status_code == 409
+
+    assert library_service.borrow_book_by_patron("100001", book_id)[0]
+    scanned = client.get(f"/api/copies/{barcode}").get_json()
+    assert (scanned["status"], scanned["patron_id"], scanned["title"]) == ("on_loan", "100001", "book 9780000000165")
+    response = client.post(f"/api/copies/{barcode}/return")
+    assert response.status_code == 200 and "successfully returned" in response.get_json()["message"]
+
+    assert client.get("/api/copies/999999999999").status_code == 404
+    assert client.post("/api/copies/not-a-barcode/return").status_code == 400
+    listing = client.get(f"/api/books/{book_id}/copies").get_json()
+    assert listing["count"] == 1 and listing["copies"][0]["status"] == "available"
+    assert client.get("/api/books/999999/copies").status_code == 404
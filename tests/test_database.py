@@ -0,0 +1,95 @@
+"""tests for database schema and helper behaviour."""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+
+import pytest
+
+import database
+
+
+def test_init_database_records_schema_version(raw_connection: sqlite3.Connection) -> None:
+    assert database.get_schema_version(raw_connection) == database.SCHEMA_VERSION
+
+
+def test_init_database_skips_current_schema(monkeypatch) -> None:
+    statements = []
+    real_connection = database.get_db_connection
+
+    def tracing_connection() -> sqlite3.Connection:
+        conn = real_connection()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(database, "get_db_connection", tracing_connection)
+    database.init_database()
+    assert statements == ["PRAGMA user_version"]
+
+
+def test_init_database_upgrades_unversioned_database(tmp_path, monkeypatch) -> None:
+    legacy_path = tmp_path / "legacy.db"
+    legacy = sqlite3.connect(legacy_path)
+    legacy.executescript(
+        """
+        CREATE TABLE books (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, author TEXT NOT NULL,
+            isbn TEXT UNIQUE NOT NULL, total_copies INTEGER NOT NULL, available_copies INTEGER NOT NULL
+        );
+        CREATE TABLE borrow_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, patron_id TEXT NOT NULL, book_id INTEGER NOT NULL,
+            borrow_date TEXT NOT NULL, due_date TEXT NOT NULL, return_date TEXT
+        );
+        INSERT INTO books (title, author, isbn, total_copies, available_copies)
+        VALUES ('kept title', 'kept author', '1000000000200', 1, 1);
+        """
+    )
+    legacy.close()
+    monkeypatch.setattr(database, "DATABASE", str(legacy_path))
+
+    database.init_database()
+
+    conn = database.get_db_connection()
+    assert database.get_schema_version(conn) == database.SCHEMA_VERSION
+    conn.close()
+    assert database.get_book_by_isbn("1000000000200")["title"] == "kept title"
+
+
+def test_read_connection_is_read_only() -> None:
+    conn = database.get_read_connection()
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM books")
+    finally:
+        conn.close()
+
+
+def test_reads_use_replica_within_staleness_bound(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(database, "READ_REPLICA", str(tmp_path / "replica.db"))
+    monkeypatch.setattr(database, "REPLICA_MAX_STALENESS", 60.0)
+    database.insert_book("first", "author", "9780000000101", 1, 1)
+    assert [book["title"] for book in database.get_all_books()] == ["first"]
+
+    database.insert_book("second", "author", "9780000000102", 1, 1)
+    # the snapshot is still fresh enough, so the new book isn't visible yet...
+    assert [book["title"] for book in database.search_books("second", "title")] == []
+    # ...while reads that guard writes see the primary
+    assert database.get_book_by_isbn("9780000000102")["title"] == "second"
+
+    monkeypatch.setattr(database, "REPLICA_MAX_STALENESS", 0.0)
+    assert [book["title"] for book in database.search_books("second", "title")] == ["second"]
+
+
+def test_replica_refresh_skips_copy_when_primary_unchanged(tmp_path, monkeypatch) -> None:
+    replica = tmp_path / "replica.db"
+    monkeypatch.setattr(database, "READ_REPLICA", str(replica))
+    assert database.refresh_read_replica() is True
+    inode = replica.stat().st_ino
+    long_ago = replica.stat().st_mtime_ns - 10 * 10**9
+    for path in (database.DATABASE, database.DATABASE + "-wal"):
+        if os.path.exists(path):
+            os.utime(path, ns=(long_ago, long_ago))
+
+    assert database.refresh_read_replica() is True
+    assert replica.stat().st_ino == inode
@@ -0,0 +1,75 @@
+"""tests for per-request query deadlines."""
+
+from __future__ import annotations
+
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import database
+from app import create_app
+
+SLOW_QUERY = """
+    WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 1000000000)
+    SELECT COUNT(*) FROM n
+"""
+
+
+@pytest.fixture
+def every_step(monkeypatch: pytest.MonkeyPatch) -> None:
+    """check the deadline on every VM step, so even tiny queries notice it."""
+    monkeypatch.setattr(database, "PROGRESS_STEPS", 1)
+
+
+def test_long_statement_is_aborted_at_the_deadline() -> None:
+    with database.query_deadline(0.05):
+        conn = database.get_read_connection()
+        started = time.monotonic()
+        with pytest.raises(sqlite3.OperationalError, match="interrupted"):
+            conn.execute(SLOW_QUERY).fetchone()
+        conn.close()
+    assert time.monotonic() - started < 2
+    # outside the block connections have no deadline
+    conn = database.get_read_connection()
+    assert conn.execute("SELECT 1").fetchone()[0] == 1
+    conn.close()
+
+
+def test_helpers_raise_query_timeout_and_count_it(every_step: None) -> None:
+    database.insert_book("slow book", "author", "9780000000507", 1, 1)
+    before = database.get_query_timeout_counts().get("search_books", 0)
+    with database.query_deadline(0):
+        with pytest.raises(database.QueryTimeoutError) as raised:
+            database.search_books("slow", "title")
+        # writes are never cut short
+        assert database.insert_book("written anyway", "author", "9780000000514", 1, 1) is True
+    assert raised.value.helper == "search_books"
+    assert database.get_query_timeout_counts()["search_books"] == before + 1
+    assert len(database.search_books("slow", "title")) == 1
+
+
+def test_deadline_reaches_fan_out_threads(monkeypatch: pytest.MonkeyPatch, every_step: None) -> None:
+    monkeypatch.setattr(database, "SHARD_COUNT", 2)
+    database.init_database()
+    now = datetime.now()
+    database.insert_book("sharded", "author", "9780000000521", 2, 2)
+    database.insert_borrow_record("100001", 1, now, now + timedelta(days=14))
+    with database.query_deadline(0):
+        with pytest.raises(database.QueryTimeoutError):
+            database.get_active_loans_for_book(1)
+    assert len(database.get_active_loans_for_book(1)) == 1
+
+
+def test_request_over_its_deadline_gets_503(every_step: None) -> None:
+    app = create_app({"TESTING": True, "QUERY_DEADLINE_SECONDS": 1e-9})
+    client = app.test_client()
+    response = client.get("/api/search?q=gatsby")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert "too long" in response.get_json()["error"]
+    assert client.get("/catalog").status_code == 503
+    assert client.get("/api/deadlines/stats").get_json()["total"] >= 2
+    # the deadline ends with the request
+    assert database.get_all_books()
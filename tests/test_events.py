@@ -0,0 +1,63 @@
+"""tests for the write-behind analytics event bus."""
+
+from __future__ import annotations
+
+import json
+
+import pytest
+
+import database
+from services import library_service
+from services.events import EventBus, event_bus
+
+
+def test_events_are_batched_into_the_events_table() -> None:
+    bus = EventBus(batch_size=50, flush_interval=0.05)
+    for i in range(120):
+        assert bus.publish("borrow", patron_id="123456", book_id=i) is True
+    assert bus.flush() is True
+    events = database.get_events("borrow", limit=500)
+    assert len(events) == 120
+    assert json.loads(events[0]["payload"]) == {"patron_id": "123456", "book_id": 119}
+    stats = bus.stats()
+    assert stats["written"] == 120
+    assert stats["batches"] <= 120 // 50 + 2
+    bus.close()
+
+
+def test_disabled_bus_publishes_nothing() -> None:
+    bus = EventBus(enabled=False)
+    assert bus.publish("borrow", patron_id="123456") is False
+    bus.flush()
+    assert database.get_events() == []
+
+
+@pytest.mark.parametrize(
+    "policy, kept",
+    [("drop_newest", [0, 1]), ("drop_oldest", [2, 3]), ("block", [0, 1])],
+)
+def test_full_queue_follows_drop_policy(monkeypatch: pytest.MonkeyPatch, policy: str, kept: list) -> None:
+    bus = EventBus(max_queue=2, drop_policy=policy, block_timeout=0.01)
+    # no writer thread, so nothing drains the queue until close()
+    monkeypatch.setattr(bus, "_ensure_writer", lambda: None)
+    for i in range(4):
+        bus.publish("return", n=i)
+    assert bus.stats()["dropped"] == 2
+    bus.close()
+    written = [json.loads(event["payload"])["n"] for event in reversed(database.get_events())]
+    assert written == kept
+
+
+def test_invalid_drop_policy_rejected() -> None:
+    with pytest.raises(ValueError):
+        EventBus(drop_policy="spill")
+
+
+def test_borrow_and_return_publish_events() -> None:
+    database.insert_book("event book", "author", "9780000000040", 2, 2)
+    book_id = database.get_book_by_isbn("9780000000040")["id"]
+    assert library_service.borrow_book_by_patron("123456", book_id)[0] is True
+    assert library_service.return_book_by_patron("123456", book_id)[0] is True
+    event_bus.flush()
+    kinds = [event["kind"] for event in reversed(database.get_events())]
+    assert kinds == ["borrow", "return"]
@@ -0,0 +1,115 @@
+"""tests for the hold queue and next-in-line dispatch."""
+
+from __future__ import annotations
+
+import json
+from datetime import datetime, timedelta
+
+import database
+from app import create_app
+from services import hold_service, library_service
+from services.pubsub import pubsub
+
+
+def _checked_out_book(isbn: str = "9780000000309") -> int:
+    """one-copy book already borrowed by patron 100000."""
+    database.insert_book("held book", "author", isbn, 1, 1)
+    book_id = database.get_book_by_isbn(isbn)["id"]
+    assert library_service.borrow_book_by_patron("100000", book_id)[0] is True
+    return book_id
+
+
+def test_hold_rejected_while_copies_are_on_the_shelf() -> None:
+    database.insert_book("on shelf", "author", "9780000000316", 1, 1)
+    book_id = database.get_book_by_isbn("9780000000316")["id"]
+    success, message, _ = hold_service.place_hold("200000", book_id)
+    assert success is False and "borrow it" in message
+
+
+def test_holds_queue_in_order_and_reject_duplicates() -> None:
+    book_id = _checked_out_book()
+    assert library_service.borrow_book_by_patron("200000", book_id)[1].endswith("place a hold on it.")
+
+    first = hold_service.place_hold("200000", book_id)
+    second = hold_service.place_hold("300000", book_id)
+    assert first[0] and second[0]
+    assert first[2]["position"] == 1 and second[2]["position"] == 2
+    assert hold_service.place_hold("200000", book_id)[1] == "You already have a hold on this book."
+    assert hold_service.place_hold("100000", book_id)[1] == "You already have this book borrowed."
+
+
+def test_return_sets_copy_aside_for_next_hold_and_notifies() -> None:
+    book_id = _checked_out_book()
+    hold_service.place_hold("200000", book_id)
+    hold_service.place_hold("300000", book_id)
+
+    with pubsub.subscribe(hold_service.hold_topic("200000")) as subscription:
+        assert library_service.return_book_by_patron("100000", book_id)[0] is True
+        message = subscription.get(timeout=1)
+    assert message["book_id"] == book_id and message["status"] == "ready"
+
+    # the copy stays off the shelf: only the patron it was set aside for can take it
+    assert database.get_book_by_id(book_id)["available_copies"] == 0
+    assert "not available" in library_service.borrow_book_by_patron("300000", book_id)[1]
+    assert library_service.borrow_book_by_patron("200000", book_id)[0] is True
+    assert database.get_book_by_id(book_id)["available_copies"] == 0
+    assert hold_service.list_holds("200000") == []
+    assert hold_service.list_holds("300000")[0]["position"] == 1
+
+
+def test_cancel_and_expiry_pass_the_copy_on() -> None:
+    book_id = _checked_out_book()
+    hold_service.place_hold("200000", book_id)
+    hold_service.place_hold("300000", book_id)
+    library_service.return_book_by_patron("100000", book_id)
+
+    ready = hold_service.list_holds("200000")[0]
+    assert hold_service.cancel_hold("300000", ready["id"]) == (False, "Hold not found.")
+    assert hold_service.cancel_hold("200000", ready["id"]) == (True, "Hold cancelled.")
+    assert hold_service.ready_holds("300000")[0]["book_id"] == book_id
+
+    assert hold_service.expire_holds(datetime.now() + timedelta(days=4)) == 1
+    assert hold_service.list_holds("300000") == []
+    assert database.get_book_by_id(book_id)["available_copies"] == 1
+
+
+def test_holds_api_and_stream() -> None:
+    book_id = _checked_out_book()
+    app = create_app({"TESTING": True, "SAMPLE_DATA": False, "HOLD_STREAM_MAX_SECONDS": 0})
+    client = app.test_client()
+
+    response = client.post("/api/holds", json={"patron_id": "200000", "book_id": book_id})
+    assert response.status_code == 201
+    hold_id = response.get_json()["hold"]["id"]
+    assert client.post("/api/holds", json={"patron_id": "200000", "book_id": book_id}).status_code == 409
+    assert client.post("/api/holds", json={"patron_id": "200000", "book_id": 9999}).status_code == 404
+    assert client.get("/api/holds?patron_id=200000").get_json()["count"] == 1
+
+    library_service.return_book_by_patron("100000", book_id)
+    response = client.get("/api/holds/stream?patron_id=200000")
+    assert response.mimetype == "text/event-stream"
+    body = response.get_data(as_text=True)
+    assert body.startswith("retry: ")
+    event, data = body.split("\n\n")[1].split("\n")
+    assert event == "event: hold_ready"
+    assert json.loads(data.removeprefix("data: "))["id"] == hold_id
+
+    assert client.delete(f"/api/holds/{hold_id}?patron_id=200000").status_code == 200
+    assert client.delete(f"/api/holds/{hold_id}?patron_id=200000").status_code == 409
+
+
+def test_status_page_shows_a_loan_picked_up_from_a_hold() -> None:
+    client = create_app({"TESTING": True, "SAMPLE_DATA": False}).test_client()
+    book_id = _checked_out_book()
+
+    def status() -> str:
+        return client.get("/status?patron_id=200000").get_data(as_text=True)
+
+    assert hold_service.place_hold("200000", book_id)[0]
+    assert library_service.return_book_by_patron("100000", book_id)[0]
+    ready = status()
+    assert library_service.borrow_book_by_patron("200000", book_id)[0]
+    # the pickup writes no books row, yet the page must show the new loan
+    borrowed = status()
+    assert borrowed != ready and "held book" in borrowed
+    assert database.get_active_borrow_record("200000", book_id) is not None
@@ -0,0 +1,65 @@
+"""tests for isbn normalization and the isbn_key index."""
+
+from __future__ import annotations
+
+import database
+from isbn import (
+    is_valid_isbn10,
+    is_valid_isbn13,
+    isbn10_to_isbn13,
+    isbn_key,
+    to_isbn13,
+    validate_isbn_batch,
+)
+from services import library_service
+
+
+def test_checksums() -> None:
+    assert is_valid_isbn13("9780306406157")
+    assert not is_valid_isbn13("9780306406158")
+    assert is_valid_isbn10("0306406152")
+    assert is_valid_isbn10("080442957X")
+    assert not is_valid_isbn10("0306406153")
+
+
+def test_isbn10_converts_to_isbn13() -> None:
+    assert isbn10_to_isbn13("0306406152") == "9780306406157"
+    assert to_isbn13("0-306-40615-2") == "9780306406157"
+    assert to_isbn13("978-0-306-40615-7") == "9780306406157"
+
+
+def test_invalid_forms_rejected() -> None:
+    assert to_isbn13("0306406153") is None
+    assert to_isbn13("12345") is None
+    assert to_isbn13("978030640615²") is None
+    assert to_isbn13("9780306406158", strict=True) is None
+    assert to_isbn13("9780306406158") == "9780306406158"
+
+
+def test_batch_validator_matches_single_validation() -> None:
+    raws = ["9780306406157", "9780306406158", "0-306-40615-2", "junk", "080442957x"]
+    assert validate_isbn_batch(raws) == [isbn_key(raw, strict=True) for raw in raws]
+    assert validate_isbn_batch(raws)[:3] == [9780306406157, None, 9780306406157]
+
+
+def test_add_book_accepts_isbn10_and_stores_isbn13() -> None:
+    success, _ = library_service.add_book_to_catalog("isbn ten", "author", "0-306-40615-2", 1)
+    assert success is True
+    stored = database.get_book_by_isbn("9780306406157")
+    assert stored["isbn"] == "9780306406157"
+    assert stored["isbn_key"] == 9780306406157
+
+
+def test_isbn_forms_share_one_book() -> None:
+    library_service.add_book_to_catalog("isbn forms", "author", "9780306406157", 1)
+    duplicate = library_service.add_book_to_catalog("isbn forms again", "author", "0306406152", 1)
+    assert duplicate[0] is False
+    assert "already exists" in duplicate[1]
+    assert database.get_book_by_isbn("978-0-306-40615-7")["title"] == "isbn forms"
+    assert len(library_service.search_books_in_catalog("0-306-40615-2", "isbn")) == 1
+
+
+def test_batch_validator_isbn13_fast_path() -> None:
+    raws = ["9780306406157", "9780306406158", "9780000000002", "9799999999990", "9789999999991"]
+    assert validate_isbn_batch(raws) == [isbn_key(raw, strict=True) for raw in raws]
+    assert validate_isbn_batch(raws, strict=False) == [int(raw) for raw in raws]
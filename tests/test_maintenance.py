@@ -0,0 +1,111 @@
+"""tests for the background database maintenance scheduler."""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import database
+from app import create_app
+from services.maintenance import MaintenanceScheduler, TrafficMonitor, scheduler
+
+
+@pytest.fixture
+def idle_scheduler() -> MaintenanceScheduler:
+    scheduler = MaintenanceScheduler()
+    scheduler.configure(quiet_seconds=0, tick=0)
+    return scheduler
+
+
+def _fill_and_delete(rows: int = 3000) -> None:
+    conn = sqlite3.connect(database.DATABASE)
+    conn.executemany(
+        "INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, 1, 1)",
+        [(f"filler {i} " + "x" * 200, "author", f"fill-{i}") for i in range(rows)],
+    )
+    conn.commit()
+    conn.execute("DELETE FROM books WHERE isbn LIKE 'fill-%'")
+    conn.commit()
+    conn.close()
+
+
+def test_traffic_monitor_tracks_in_flight_and_quiet_time() -> None:
+    traffic = TrafficMonitor()
+    assert traffic.idle_for(0)
+    traffic.started()
+    assert not traffic.idle_for(0)
+    traffic.finished()
+    assert traffic.idle_for(0)
+    assert not traffic.idle_for(60)
+
+
+def test_requests_turned_away_by_admission_control_leave_no_traffic() -> None:
+    app = create_app({"TESTING": True, "ADMISSION_PATRON_BURST": 1, "ADMISSION_PATRON_RATE": 0.1})
+    client = app.test_client()
+    assert client.get("/api/late_fee/123456/3").status_code == 200
+    for _ in range(2):
+        assert client.get("/api/late_fee/123456/3").status_code == 429
+    assert scheduler.traffic.in_flight == 0
+
+
+def test_incremental_vacuum_reclaims_freed_pages(idle_scheduler: MaintenanceScheduler) -> None:
+    _fill_and_delete()
+    database.get_db_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    before = os.path.getsize(database.DATABASE)
+    result = idle_scheduler.run_task("vacuum")
+    assert result["completed"] and result["reclaimed_bytes"] > 0
+    assert os.path.getsize(database.DATABASE) < before
+    state = {row["task"]: row for row in database.get_maintenance_state()}
+    assert state["vacuum"]["last_reclaimed"] == result["reclaimed_bytes"]
+
+
+def test_due_tasks_run_once_per_interval(idle_scheduler: MaintenanceScheduler) -> None:
+    _fill_and_delete()
+    assert sorted(r["task"] for r in idle_scheduler.run_pending()) == [
+        "analyze", "checkpoint", "optimize", "vacuum"
+    ]
+    # another worker (or the next tick) finds nothing due
+    assert MaintenanceScheduler().run_pending() == []
+    assert idle_scheduler.run_pending() == []
+
+
+def test_changed_rows_bring_analyze_forward(idle_scheduler: MaintenanceScheduler) -> None:
+    idle_scheduler.configure(analyze_changes=10)
+    idle_scheduler.run_pending()
+    for i in range(10):
+        database.insert_book(f"new {i}", "author", f"978000000{i:04d}", 1, 1)
+    assert [r["task"] for r in idle_scheduler.run_pending()] == ["analyze"]
+
+
+def test_claims_are_shared_between_workers() -> None:
+    now = datetime.now()
+    assert database.claim_maintenance_task("optimize", now, now - timedelta(hours=1))
+    assert not database.claim_maintenance_task("optimize", now, now - timedelta(hours=1))
+
+
+def test_live_traffic_stops_maintenance(idle_scheduler: MaintenanceScheduler) -> None:
+    idle_scheduler.traffic.started()
+    assert idle_scheduler.run_pending() == []
+    result = idle_scheduler.run_task("analyze")
+    assert result["files"] == 0 and not result["completed"]
+    # the CLI path runs regardless
+    assert idle_scheduler.run_task("analyze", yield_to_traffic=False)["completed"]
+
+
+def test_maintenance_window_hours(idle_scheduler: MaintenanceScheduler) -> None:
+    idle_scheduler.configure(window=(22, 4))
+    assert idle_scheduler.in_window(datetime(2024, 1, 1, 23))
+    assert idle_scheduler.in_window(datetime(2024, 1, 1, 3))
+    assert not idle_scheduler.in_window(datetime(2024, 1, 1, 12))
+
+
+def test_cli_and_status_endpoint() -> None:
+    app = create_app({"TESTING": True})
+    result = app.test_cli_runner().invoke(args=["maintenance", "run", "checkpoint", "analyze"])
+    assert result.exit_code == 0 and "analyze:" in result.output
+    tasks = {row["task"]: row for row in app.test_client().get("/api/maintenance/status").get_json()["tasks"]}
+    assert tasks["analyze"]["last_finished"] is not None
+    assert tasks["vacuum"]["last_finished"] is None
@@ -0,0 +1,162 @@
+"""tests for popularity counters and most-borrowed rankings."""
+
+from __future__ import annotations
+
+import random
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import database
+from app import create_app
+from services import library_service, popularity
+from services.events import event_bus
+from services.popularity import PopularityIndex, TopN
+
+TODAY = date(2026, 3, 31)
+
+
+def _day(days_ago: int) -> str:
+    return (TODAY - timedelta(days=days_ago)).isoformat()
+
+
+def _count(*rows) -> None:
+    assert database.add_borrow_counts(list(rows))
+
+
+def _book(isbn: str) -> int:
+    assert database.insert_book(f"book {isbn}", "author", isbn, 5, 5)
+    return database.get_book_by_isbn(isbn)["id"]
+
+
+def test_counts_add_up_per_day_and_in_all_time_totals() -> None:
+    _count((_day(1), 2, 1))
+    _count((_day(1), 2, 1), (_day(0), 1, 1))
+    conn = database.get_db_connection()
+    daily = conn.execute("SELECT day, book_id, borrows FROM popularity_daily ORDER BY day").fetchall()
+    totals = conn.execute("SELECT book_id, borrows FROM popularity_totals ORDER BY book_id").fetchall()
+    conn.close()
+    assert [tuple(row) for row in daily] == [(_day(1), 2, 2), (_day(0), 1, 1)]
+    assert [tuple(row) for row in totals] == [(1, 1), (2, 2)]
+
+
+def test_top_n_bumps_match_ranking_from_scratch() -> None:
+    rng = random.Random(3)
+    counts = Counter({book_id: rng.randint(1, 5) for book_id in range(1, 200)})
+    leaders = TopN(10, counts)
+    for _ in range(2000):
+        book_id = rng.randint(1, 300)
+        counts[book_id] += rng.randint(1, 3)
+        leaders.bump(book_id, counts[book_id])
+    assert leaders.ranked() == TopN(10, counts).ranked()
+    assert leaders.ranked() == sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:10]
+
+
+def test_borrows_reach_the_counters_as_they_are_made() -> None:
+    first, second = _book("9780000000400"), _book("9780000000417")
+    for patron_id in ("100001", "100002"):
+        assert library_service.borrow_book_by_patron(patron_id, second)[0]
+    assert library_service.borrow_book_by_patron("100003", first)[0]
+
+    # counted without waiting for the event writer
+    leaders = popularity.popular_books("week", 5)
+    assert [(book["id"], book["borrows"]) for book in leaders] == [(second, 2), (first, 1)]
+    assert leaders[0]["title"] == "book 9780000000417"
+
+
+def test_windows_slide_over_the_daily_buckets() -> None:
+    _count((_day(0), 1, 1), (_day(6), 2, 3), (_day(20), 3, 5))
+    conn = database.get_db_connection()
+    conn.execute("INSERT INTO popularity_totals (book_id, borrows) VALUES (4, 50)")
+    conn.commit()
+    conn.close()
+
+    index = PopularityIndex()
+    assert index.top("week", today=TODAY) == [(2, 3), (1, 1)]
+    assert index.top("month", today=TODAY) == [(3, 5), (2, 3), (1, 1)]
+    assert index.top("all", today=TODAY) == [(4, 50), (3, 5), (2, 3), (1, 1)]
+    # a day later book 2's borrows have left the week; ten days later book 3's the month
+    assert index.top("week", today=TODAY + timedelta(days=1)) == [(1, 1)]
+    assert index.top("month", today=TODAY + timedelta(days=10)) == [(2, 3), (1, 1)]
+
+
+def test_index_applies_new_borrows_without_reloading(monkeypatch) -> None:
+    _count((_day(3), 1, 2))
+    index = PopularityIndex()
+    assert index.top("week", today=TODAY) == [(1, 2)]
+
+    reads = []
+    real = database.get_popularity_counts
+
+    def counts(since, with_totals=True, after_version=-1):
+        state, changed, totals = real(since, with_totals, after_version)
+        reads.append((since, with_totals, changed))
+        return state, changed, totals
+
+    monkeypatch.setattr(database, "get_popularity_counts", counts)
+    _count((_day(0), 2, 3), (_day(0), 1, 1))
+    assert index.top("week", today=TODAY) == [(1, 3), (2, 3)]
+    assert index.top("all", today=TODAY) == [(1, 3), (2, 3)]
+    # only the two bucket rows the batch touched were read
+    assert reads == [(_day(1), False, [(_day(0), 1, 1), (_day(0), 2, 3)])]
+    # unchanged counters cost no bucket reads
+    assert index.top("month", today=TODAY) == [(1, 3), (2, 3)]
+    assert len(reads) == 1
+
+
+def test_old_buckets_are_pruned_but_totals_kept() -> None:
+    _count((_day(40), 1, 4))
+    _count((_day(0), 2, 1))
+    state, daily, totals = database.get_popularity_counts("0000-00-00")
+    assert daily == [(_day(0), 2, 1)]
+    assert sorted(totals) == [(1, 4), (2, 1)]
+    assert state["version"] == 2
+
+
+def test_rebuild_recounts_from_the_loans() -> None:
+    book_id = _book("9780000000424")
+    now = datetime.combine(TODAY, datetime.min.time()).replace(hour=12)
+    for days_ago, patron_id in ((0, "100001"), (2, "100002"), (45, "100003")):
+        borrowed = now - timedelta(days=days_ago)
+        assert database.insert_borrow_record(patron_id, book_id, borrowed, borrowed + timedelta(days=14))
+    _count((_day(0), book_id, 99))
+
+    assert popularity.rebuild(now) == {"daily_rows": 2, "books": 1, "loans": 3}
+    index = PopularityIndex()
+    assert index.top("week", today=TODAY) == [(book_id, 2)]
+    assert index.top("all", today=TODAY) == [(book_id, 3)]
+
+
+def test_popular_endpoint_and_commands() -> None:
+    app = create_app({"TESTING": True})
+    client = app.test_client()
+    book_id = _book("9780000000431")
+    assert library_service.borrow_book_by_patron("100001", book_id)[0]
+
+    body = client.get("/api/popular?window=month&limit=3").get_json()
+    assert (body["window"], body["days"], body["count"]) == ("month", database.POPULARITY_DAYS, 1)
+    assert body["books"][0]["id"] == book_id and body["books"][0]["borrows"] == 1
+    assert client.get("/api/popular?window=year").status_code == 400
+    assert client.get("/api/popular?limit=0").status_code == 400
+    assert client.get("/api/popular?limit=x").status_code == 400
+
+    runner = app.test_cli_runner()
+    # the sample data's loan of 1984 is counted too
+    assert "Counted 2 loans of 2 books" in runner.invoke(args=["popularity", "rebuild"]).output
+    assert "book 9780000000431" in runner.invoke(args=["popularity", "top", "--window", "all"]).output
+
+
+def test_borrows_are_counted_with_events_disabled(monkeypatch) -> None:
+    # restored after the test, so later ones get the usual bus back
+    monkeypatch.setattr(event_bus, "enabled", True)
+    app = create_app({"TESTING": True, "EVENTS_ENABLED": False})
+    client = app.test_client()
+    book_id = _book("9780000000448")
+    assert library_service.borrow_book_by_patron("100001", book_id)[0]
+    assert library_service.borrow_book_by_patron("100002", book_id)[0]
+    assert event_bus.flush()
+    conn = database.get_db_connection()
+    assert conn.execute("SELECT COUNT(*) FROM events").fetchone()[0] == 0
+    conn.close()
+
+    body = client.get("/api/popular?window=week&limit=1").get_json()
+    assert body["books"][0]["id"] == book_id and body["books"][0]["borrows"] == 2
@@ -0,0 +1,119 @@
+"""tests for the co-borrow recommendation index."""
+
+from __future__ import annotations
+
+import math
+import random
+from datetime import datetime, timedelta
+
+import database
+from app import create_app
+from services import recommendations
+from services.recommendations import RelatedIndex, build
+
+
+def _book(isbn: str) -> int:
+    assert database.insert_book(f"book {isbn}", "author", isbn, 5, 5)
+    return database.get_book_by_isbn(isbn)["id"]
+
+
+def _lend(patron_id: str, book_id: int, days_ago: int = 0) -> None:
+    borrowed = datetime.now() - timedelta(days=days_ago)
+    assert database.insert_borrow_record(patron_id, book_id, borrowed, borrowed + timedelta(days=14))
+
+
+def _neighbours(index: RelatedIndex, book_id: int) -> list:
+    return [(neighbour, shared) for neighbour, shared, _ in index.related(book_id, 50)]
+
+
+def test_pairs_are_scored_by_cosine_and_thresholded(tmp_path) -> None:
+    path = str(tmp_path / "related.bin")
+    baskets = [[1, 2, 3], [1, 2], [1, 2, 4], [2, 3], [3, 4], [5]]
+    result = build(path, baskets)
+    assert (result["books"], result["related_pairs"], result["spilled_runs"]) == (5, 2, 0)
+
+    index = RelatedIndex(path)
+    # 1 and 2 share three patrons, 2 and 3 two; every other pair only one
+    [(neighbour, shared, score)] = index.related(1)
+    assert (neighbour, shared) == (2, 3) and math.isclose(score, 3 / math.sqrt(3 * 4), rel_tol=1e-6)
+    assert _neighbours(index, 2) == [(1, 3), (3, 2)]
+    assert _neighbours(index, 4) == [] and _neighbours(index, 5) == []
+    assert index.related(99) == [] and index.related(-1) == []
+    assert index.related(2, limit=1) == index.related(2)[:1]
+
+
+def test_spilled_runs_merge_to_the_same_index(tmp_path, monkeypatch) -> None:
+    rng = random.Random(5)
+    baskets = [sorted(set(rng.choices(range(1, 60), k=rng.randint(1, 12)))) for _ in range(400)]
+    build(str(tmp_path / "memory.bin"), baskets)
+    monkeypatch.setattr(recommendations, "MAX_PAIRS", 50)
+    assert build(str(tmp_path / "spilled.bin"), baskets)["spilled_runs"] > 10
+
+    in_memory, spilled = RelatedIndex(str(tmp_path / "memory.bin")), RelatedIndex(str(tmp_path / "spilled.bin"))
+    assert any(in_memory.related(book_id) for book_id in range(60))
+    assert all(in_memory.related(book_id, 50) == spilled.related(book_id, 50) for book_id in range(60))
+
+
+def test_oversized_baskets_count_borrowers_but_no_pairs(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(recommendations, "MAX_BASKET", 3)
+    path = str(tmp_path / "related.bin")
+    result = build(path, [[1, 2], [1, 2], [1, 2, 3, 4]])
+    assert result["related_pairs"] == 1
+    # book 1 and 2 each have three borrowers, two of them shared
+    assert RelatedIndex(path).related(1)[0][:2] == (2, 2)
+    assert math.isclose(RelatedIndex(path).related(1)[0][2], 2 / 3, rel_tol=1e-6)
+
+
+def test_builder_streams_loans_and_archives_by_patron() -> None:
+    first, second, third = _book("9780000000500"), _book("9780000000517"), _book("9780000000524")
+    for patron_id in ("100001", "100002"):
+        _lend(patron_id, first, days_ago=400)
+        _lend(patron_id, second)
+    # a repeat loan is still one patron in common
+    _lend("100001", second, days_ago=2)
+    _lend("100003", third)
+    database.archive_loans(datetime.now() - timedelta(days=365))
+
+    baskets = dict(database.iter_patron_books())
+    assert baskets["100001"] == baskets["100002"] == sorted([first, second])
+    result = build()
+    assert result["related_pairs"] == 1
+    assert [(book["id"], book["shared"]) for book in recommendations.related_books(first)] == [(second, 2)]
+    assert recommendations.related_books(third) == []
+
+
+def test_index_follows_rebuilds_and_ignores_bad_files(tmp_path) -> None:
+    path = tmp_path / "related.bin"
+    index = RelatedIndex(str(path))
+    assert index.related(1) == []
+    build(str(path), [[1, 2], [1, 2]])
+    assert _neighbours(index, 1) == [(2, 2)]
+    build(str(path), [[1, 3], [1, 3], [1, 3]])
+    assert _neighbours(index, 1) == [(3, 3)]
+
+    path.write_bytes(path.read_bytes()[:-4])
+    assert index.related(1) == []
+    path.write_bytes(b"not an index")
+    assert index.related(1) == []
+
+
+def test_related_endpoint_and_commands(tmp_path) -> None:
+    app = create_app({"TESTING": True, "RELATED_INDEX_PATH": str(tmp_path / "related.bin")})
+    client = app.test_client()
+    first, second = _book("9780000000531"), _book("9780000000548")
+    assert client.get(f"/api/books/{first}/related").get_json()["count"] == 0
+
+    for patron_id in ("100001", "100002"):
+        _lend(patron_id, first)
+        _lend(patron_id, second)
+    runner = app.test_cli_runner()
+    output = runner.invoke(args=["recommendations", "build"]).output
+    assert "through 1 co-borrowed pairs" in output and (tmp_path / "related.bin").exists()
+    assert "book 9780000000548" in runner.invoke(args=["recommendations", "show", str(first)]).output
+
+    body = client.get(f"/api/books/{first}/related?limit=3").get_json()
+    assert (body["book_id"], body["count"]) == (first, 1)
+    assert body["related"][0]["id"] == second and body["related"][0]["shared"] == 2
+    assert client.get(f"/api/books/{first}/related?limit=0").status_code == 400
+    assert client.get(f"/api/books/{first}/related?limit=x").status_code == 400
+    assert 'class="related-toggle"' in client.get("/catalog").get_data(as_text=True)
@@ -0,0 +1,109 @@
+"""tests for available_copies reconciliation."""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import database
+from app import create_app
+from services import hold_service, library_service
+from services.reconciliation import compute_drift, reconcile
+
+
+def _book(isbn: str, copies: int) -> int:
+    assert database.insert_book(f"book {isbn}", "author", isbn, copies, copies)
+    return database.get_book_by_isbn(isbn)["id"]
+
+
+def _lost_availability_update(patron_id: str, book_id: int) -> None:
+    """a borrow whose process died between writing the loan and the availability."""
+    now = datetime.now()
+    assert database.insert_borrow_record(patron_id, book_id, now, now + timedelta(days=14))
+
+
+def _available(book_id: int) -> int:
+    return database.get_book_by_id(book_id)["available_copies"]
+
+
+def test_dry_run_reports_drift_and_repair_fixes_it() -> None:
+    book_id = _book("9780000000011", 3)
+    _lost_availability_update("100001", book_id)
+    report = reconcile(dry_run=True)
+    assert [(row["book_id"], row["stored"], row["expected"]) for row in report["drifted"]] == [(book_id, 3, 2)]
+    assert _available(book_id) == 3
+
+    report = reconcile(settle=0)
+    assert report["repaired"] == 1 and _available(book_id) == 2
+    assert compute_drift()["drifted"] == []
+
+
+def test_ready_holds_and_normal_circulation_are_not_drift() -> None:
+    book_id = _book("9780000000028", 1)
+    assert library_service.borrow_book_by_patron("100001", book_id)[0]
+    assert hold_service.place_hold("100002", book_id)[0]
+    assert library_service.return_book_by_patron("100001", book_id)[0]
+    # the returned copy is set aside for the hold, not available
+    assert _available(book_id) == 0
+    assert reconcile(settle=0)["drifted"] == []
+
+
+def test_overlent_books_are_clamped_and_flagged() -> None:
+    book_id = _book("9780000000035", 1)
+    _lost_availability_update("100001", book_id)
+    _lost_availability_update("100002", book_id)
+    (row,) = reconcile(settle=0)["drifted"]
+    assert row["overlent"] and row["expected"] == 0
+    assert _available(book_id) == 0
+
+
+def test_repairs_skip_books_that_changed_meanwhile() -> None:
+    book_id = _book("9780000000042", 2)
+    assert database.set_book_availability([(book_id, 5, 1)]) == []
+    assert database.set_book_availability([(book_id, 2, 1)]) == [(book_id, 1)]
+    assert _available(book_id) == 1
+
+
+def test_incremental_run_checks_books_touched_since_the_watermark() -> None:
+    touched = _book("9780000000059", 2)
+    untouched = _book("9780000000066", 2)
+    assert reconcile(settle=0)["checked"] >= 2
+    watermark = database.get_reconcile_state()["watermark"]
+    assert watermark is not None
+
+    _lost_availability_update("100001", touched)
+    conn = database.get_db_connection()
+    conn.execute("UPDATE books SET available_copies = 0 WHERE id = ?", (untouched,))
+    conn.commit()
+    conn.close()
+
+    report = reconcile(incremental=True, settle=0)
+    assert report["since"] == watermark
+    assert report["checked"] == 1 and report["repaired"] == 1
+    assert _available(touched) == 1 and _available(untouched) == 0
+    # a full run still finds everything
+    assert reconcile(settle=0)["repaired"] == 1 and _available(untouched) == 2
+
+
+def test_loans_are_counted_across_shards(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(database, "SHARD_COUNT", 2)
+    database.init_database()
+    book_id = _book("9780000000073", 5)
+    patrons = ["100001", "100002", "100003", "100004"]
+    assert len({database.shard_index(p) for p in patrons}) == 2
+    for patron in patrons:
+        _lost_availability_update(patron, book_id)
+    assert database.get_active_loan_counts([book_id]) == {book_id: 4}
+    assert reconcile(settle=0)["repaired"] == 1 and _available(book_id) == 1
+
+
+def test_reconcile_cli() -> None:
+    runner = create_app({"TESTING": True}).test_cli_runner()
+    book_id = _book("9780000000080", 2)
+    _lost_availability_update("100001", book_id)
+    result = runner.invoke(args=["inventory", "reconcile", "--dry-run"])
+    assert result.exit_code == 0
+    assert f"book {book_id}" in result.output and "1 drifted" in result.output
+    result = runner.invoke(args=["inventory", "reconcile", "--settle", "0"])
+    assert "1 repaired" in result.output
@@ -0,0 +1,135 @@
+"""tests for http-level route behaviour."""
+
+from __future__ import annotations
+
+import pytest
+from flask.testing import FlaskClient
+
+import database
+from app import create_app
+
+
+@pytest.fixture
+def client() -> FlaskClient:
+    app = create_app({"TESTING": True, "SAMPLE_DATA": False})
+    return app.test_client()
+
+
+# render cache
+
+
+def test_catalog_returns_304_for_current_etag(client: FlaskClient) -> None:
+    database.insert_book("cached title", "cached author", "1000000000300", 2, 2)
+    first = client.get("/catalog")
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    again = client.get("/catalog", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.data == b""
+
+
+def test_catalog_cache_invalidated_by_availability_change(client: FlaskClient) -> None:
+    database.insert_book("stock title", "stock author", "1000000000301", 2, 2)
+    book = database.get_book_by_isbn("1000000000301")
+    first = client.get("/catalog")
+    assert b"2/2 Available" in first.data
+
+    database.update_book_availability(book["id"], -1)
+
+    second = client.get("/catalog", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 200
+    assert b"1/2 Available" in second.data
+    assert second.headers["ETag"] != first.headers["ETag"]
+
+
+def test_catalog_renders_pending_flash_messages(client: FlaskClient) -> None:
+    database.insert_book("flash title", "flash author", "1000000000302", 1, 1)
+    book = database.get_book_by_isbn("1000000000302")
+    client.get("/catalog")
+
+    response = client.post(
+        "/borrow", data={"patron_id": "123456", "book_id": book["id"]}, follow_redirects=True
+    )
+    assert b"Successfully borrowed" in response.data
+    assert b"Successfully borrowed" not in client.get("/catalog").data
+
+
+def test_search_page_served_from_cache(client: FlaskClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    database.insert_book("cached search", "cached author", "1000000000303", 1, 1)
+    assert b"cached search" in client.get("/search?q=cached&type=title").data
+
+    monkeypatch.setattr(
+        "routes.search_routes.search_books_in_catalog",
+        lambda *_: pytest.fail("cached search should not query again"),
+    )
+    assert b"cached search" in client.get("/search?q=cached&type=title").data
+
+
+# json api caching
+
+
+def test_api_search_returns_304_without_searching(
+    client: FlaskClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    database.insert_book("api title", "api author", "1000000000310", 1, 1)
+    first = client.get("/api/search?q=api&type=title")
+    assert first.json["count"] == 1
+    assert "no-cache" in first.headers["Cache-Control"]
+
+    monkeypatch.setattr(
+        "routes.api_routes.search_books_in_catalog",
+        lambda *_: pytest.fail("revalidation should not search"),
+    )
+    again = client.get("/api/search?q=api&type=title", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+
+
+def test_api_late_fee_etag_changes_when_loan_returned(client: FlaskClient) -> None:
+    database.insert_book("fee title", "fee author", "1000000000311", 1, 1)
+    book = database.get_book_by_isbn("1000000000311")
+    client.post("/borrow", data={"patron_id": "222222", "book_id": book["id"]})
+
+    first = client.get(f"/api/late_fee/222222/{book['id']}")
+    assert first.headers["Cache-Control"].startswith("private")
+    etag = first.headers["ETag"]
+    assert client.get(f"/api/late_fee/222222/{book['id']}", headers={"If-None-Match": etag}).status_code == 304
+
+    client.post("/return", data={"patron_id": "222222", "book_id": book["id"]})
+    after = client.get(f"/api/late_fee/222222/{book['id']}", headers={"If-None-Match": etag})
+    assert after.status_code == 200
+    assert "No active borrow" in after.json["status"]
+
+
+def test_api_search_gzips_large_results(client: FlaskClient) -> None:
+    for i in range(40):
+        database.insert_book(f"bulk title {i}", "bulk author", f"{1000000000400 + i}", 1, 1)
+    response = client.get("/api/search?q=bulk&type=title", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] in {"gzip", "br"}
+    assert response.headers["ETag"].startswith("W/")
+    assert "Accept-Encoding" in response.headers["Vary"]
+
+    plain = client.get("/api/search?q=bulk&type=title")
+    assert "Content-Encoding" not in plain.headers
+    assert plain.json["count"] == 40
+
+
+# suggestions
+
+
+def test_api_suggest_returns_matching_books(client: FlaskClient) -> None:
+    database.insert_book("the hobbit", "j. r. r. tolkien", "1000000000610", 1, 1)
+    response = client.get("/api/suggest?q=hob")
+    assert response.status_code == 200
+    assert [s["title"] for s in response.json["suggestions"]] == ["the hobbit"]
+
+
+def test_api_suggest_requires_query(client: FlaskClient) -> None:
+    assert client.get("/api/suggest?q=").status_code == 400
+
+
+def test_search_page_fuzzy_type(client: FlaskClient) -> None:
+    database.insert_book("to kill a mockingbird", "harper lee", "1000000000621", 1, 1)
+    response = client.get("/search?q=mockinbird&type=fuzzy")
+    assert b"to kill a mockingbird" in response.data
+    assert client.get("/api/search?q=harpr&type=fuzzy").json["count"] == 1
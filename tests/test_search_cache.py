@@ -0,0 +1,60 @@
+"""tests for the search result cache."""
+
+from __future__ import annotations
+
+import pytest
+
+import database
+from services import library_service
+from services.search_cache import SearchCache, normalize_search_key
+
+
+def test_normalized_keys_ignore_case_and_padding() -> None:
+    assert normalize_search_key("  Harry ", "Title") == normalize_search_key("harry", "title")
+
+
+def test_cache_evicts_least_recent_by_bytes() -> None:
+    cache = SearchCache(max_bytes=120)
+    row = [{"title": "x" * 30}]
+    cache.put(("title", "a"), 1, row)
+    cache.put(("title", "b"), 1, row)
+    cache.get(("title", "a"), 1)
+    cache.put(("title", "c"), 1, row)
+
+    assert cache.get(("title", "b"), 1) is None
+    assert cache.get(("title", "a"), 1) == row
+    assert cache.stats()["bytes"] <= 120
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_drops_entries_when_stamp_changes() -> None:
+    cache = SearchCache()
+    cache.put(("title", "a"), 1, [{"id": 1}])
+    assert cache.get(("title", "a"), 2) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_hit_ratio_reported() -> None:
+    cache = SearchCache()
+    cache.get(("title", "a"), 1)
+    cache.put(("title", "a"), 1, [])
+    cache.get(("title", "a"), 1)
+    assert cache.stats()["hit_ratio"] == pytest.approx(0.5)
+
+
+def test_service_search_reuses_cached_results(monkeypatch: pytest.MonkeyPatch) -> None:
+    database.insert_book("orwell essays", "george orwell", "1000000000500", 1, 1)
+    first = library_service.search_books_in_catalog("Orwell", "author")
+    assert len(first) == 1
+
+    monkeypatch.setattr(
+        library_service, "search_books", lambda *_: pytest.fail("should be served from cache")
+    )
+    assert library_service.search_books_in_catalog(" orwell ", "author") == first
+
+
+def test_service_search_sees_catalog_writes() -> None:
+    database.insert_book("orwell essays", "george orwell", "1000000000501", 1, 1)
+    assert len(library_service.search_books_in_catalog("orwell", "author")) == 1
+    database.insert_book("orwell letters", "george orwell", "1000000000502", 1, 1)
+    assert len(library_service.search_books_in_catalog("orwell", "author")) == 2
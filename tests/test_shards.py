@@ -0,0 +1,146 @@
+"""tests for loan sharding by patron."""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import database
+from app import create_app
+from services import library_service
+
+PATRONS = [f"{n:06d}" for n in range(100000, 100040)]
+
+
+def _loan_count(path: str) -> int:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM borrow_records").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _add_loans() -> int:
+    database.insert_book("sharded book", "author", "9780000000200", 100, 100)
+    book_id = database.get_book_by_isbn("9780000000200")["id"]
+    now = datetime.now()
+    for patron in PATRONS:
+        database.insert_borrow_record(patron, book_id, now, now + timedelta(days=14))
+    return book_id
+
+
+def test_loans_route_to_the_patrons_shard(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(database, "SHARD_COUNT", 4)
+    database.init_database()
+    book_id = _add_loans()
+
+    paths = database.shard_paths()
+    assert len(paths) == 4 and all(os.path.exists(path) for path in paths)
+    assert _loan_count(database.DATABASE) == 0
+    for index, path in enumerate(paths):
+        expected = sum(database.shard_index(patron) == index for patron in PATRONS)
+        assert _loan_count(path) == expected
+
+    records = database.get_patron_borrow_records(PATRONS[0])
+    assert [record["title"] for record in records] == ["sharded book"]
+    assert database.get_patron_borrow_count(PATRONS[0]) == 1
+    assert len(database.get_active_loans_for_book(book_id)) == len(PATRONS)
+
+
+def test_borrow_and_return_work_across_shards(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(database, "SHARD_COUNT", 3)
+    database.init_database()
+    database.insert_book("shard service", "author", "9780000000217", 2, 2)
+    book_id = database.get_book_by_isbn("9780000000217")["id"]
+
+    assert library_service.borrow_book_by_patron("654321", book_id)[0] is True
+    report = library_service.get_patron_status_report("654321")
+    assert report["active_count"] == 1
+    assert library_service.return_book_by_patron("654321", book_id)[0] is True
+    assert library_service.get_patron_status_report("654321")["active_count"] == 0
+
+
+def test_rebalance_moves_every_loan(monkeypatch: pytest.MonkeyPatch) -> None:
+    book_id = _add_loans()
+    result = database.rebalance_shards(1, 4, batch_size=7)
+    assert result == {"moved": len(PATRONS), "kept": 0, "archived_moved": 0, "archived_kept": 0}
+
+    monkeypatch.setattr(database, "SHARD_COUNT", 4)
+    assert len(database.get_active_loans_for_book(book_id)) == len(PATRONS)
+    assert all(database.get_patron_borrow_count(patron) == 1 for patron in PATRONS)
+
+    result = database.rebalance_shards(4, 2)
+    assert result["moved"] + result["kept"] == len(PATRONS)
+    monkeypatch.setattr(database, "SHARD_COUNT", 2)
+    assert all(database.get_patron_borrow_count(patron) == 1 for patron in PATRONS)
+    assert sum(_loan_count(path) for path in database.shard_paths(4)) == 0
+
+
+def test_rebalance_command(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(database, "SHARD_COUNT", 1)
+    _add_loans()
+    app = create_app({"TESTING": True, "SAMPLE_DATA": False})
+    result = app.test_cli_runner().invoke(args=["shards", "rebalance", "--to", "3"])
+    assert result.exit_code == 0, result.output
+    assert f"Moved {len(PATRONS)} loans" in result.output
+
+
+def test_cli_commands_read_the_shard_layout_from_the_environment(monkeypatch: pytest.MonkeyPatch) -> None:
+    from click.testing import CliRunner
+    from flask.cli import FlaskGroup
+
+    monkeypatch.setattr(database, "SHARD_COUNT", 4)
+    database.init_database()
+    database.insert_book("sharded stock", "author", "9780000000224", 3, 3)
+    book_id = database.get_book_by_isbn("9780000000224")["id"]
+    for patron in PATRONS[:2]:
+        assert library_service.borrow_book_by_patron(patron, book_id)[0]
+    monkeypatch.setattr(database, "SHARD_COUNT", 1)
+
+    # the way `flask --app app ...` builds the app: inside the CLI, from the environment
+    cli = FlaskGroup(create_app=create_app)
+    env = {"LOAN_SHARDS": "4", "SAMPLE_DATA": None}
+    result = CliRunner().invoke(cli, ["inventory", "reconcile", "--dry-run", "--settle", "0"], env=env)
+    assert result.exit_code == 0, result.output
+    assert "0 drifted" in result.output
+    result = CliRunner().invoke(cli, ["shards", "info"], env=env)
+    assert sum(int(line.split(": ")[1].split()[0]) for line in result.output.splitlines()) == 2
+    assert database.SHARD_COUNT == 4
+    # a maintenance command never seeds the catalog with sample books
+    assert database.get_book_by_isbn("9780743273565") is None
+
+
+def test_rebalance_carries_archived_history_into_the_new_layout(monkeypatch: pytest.MonkeyPatch) -> None:
+    database.insert_book("archived shard book", "author", "9780000000231", 100, 100)
+    book_id = database.get_book_by_isbn("9780000000231")["id"]
+    long_ago = datetime.now() - timedelta(days=800)
+    for patron in PATRONS:
+        database.insert_borrow_record(patron, book_id, long_ago, long_ago + timedelta(days=14))
+        database.update_borrow_record_return_date(patron, book_id, long_ago + timedelta(days=7))
+    assert database.archive_loans(datetime.now() - timedelta(days=365)) == len(PATRONS)
+    _add_loans()
+
+    result = database.rebalance_shards(1, 4, batch_size=7)
+    assert (result["moved"], result["archived_moved"], result["archived_kept"]) == (len(PATRONS), len(PATRONS), 0)
+    monkeypatch.setattr(database, "SHARD_COUNT", 4)
+    for patron in PATRONS:
+        report = library_service.get_patron_status_report(patron, include_archived=True)
+        assert [record["title"] for record in report["history"]] == ["archived shard book"]
+        assert [record["title"] for record in report["current_loans"]] == ["sharded book"]
+    assert sum(len(books) for _, books in database.iter_patron_books()) == 2 * len(PATRONS)
+
+    # back to one file: the archive rows land in library.archive.db with ids
+    # the primary's loans will never reuse
+    result = database.rebalance_shards(4, 1)
+    assert result["archived_moved"] == len(PATRONS)
+    monkeypatch.setattr(database, "SHARD_COUNT", 1)
+    assert database.archive_loans(datetime.now() + timedelta(days=1)) == 0
+    for patron in PATRONS[:3]:
+        assert database.update_borrow_record_return_date(patron, database.get_book_by_isbn("9780000000200")["id"],
+                                                         datetime.now())
+    assert database.archive_loans(datetime.now() + timedelta(days=1)) == 3
+    report = library_service.get_patron_status_report(PATRONS[0], include_archived=True)
+    assert len(report["history"]) == 2
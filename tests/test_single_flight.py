@@ -0,0 +1,111 @@
+"""tests for single-flight coalescing of identical concurrent reads."""
+
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import database
+from services import library_service
+from services.single_flight import SingleFlight, single_flight
+
+
+def _herd(flight: SingleFlight, fn, callers: int = 8, key="k", timeout=None):
+    """start callers on one key, the first of which runs fn; returns their futures."""
+    pool = ThreadPoolExecutor(callers)
+    futures = [pool.submit(flight.do, key, fn, timeout)]
+    while flight.stats()["in_flight"] == 0:
+        time.sleep(0.001)
+    futures += [pool.submit(flight.do, key, fn, timeout) for _ in range(callers - 1)]
+    pool.shutdown(wait=False)
+    return futures
+
+
+def test_concurrent_calls_share_one_execution() -> None:
+    flight = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def slow():
+        runs.append(1)
+        release.wait(5)
+        return {"answer": 42}
+
+    futures = _herd(flight, slow)
+    time.sleep(0.05)
+    release.set()
+    results = [future.result(5) for future in futures]
+
+    assert len(runs) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats()["executions"] == 1 and flight.stats()["shared"] == 7
+    # nothing is remembered once the call is over
+    assert flight.do("k", lambda: "fresh") == "fresh"
+
+
+def test_waiters_get_the_leaders_exception() -> None:
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise ValueError("database is locked")
+
+    futures = _herd(flight, failing, callers=4)
+    time.sleep(0.05)
+    release.set()
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(5)
+
+
+def test_waiter_runs_its_own_call_after_timeout() -> None:
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def stuck():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(5)
+            return "shared"
+        return "own"
+
+    futures = _herd(flight, stuck, callers=2, timeout=0.05)
+    assert futures[1].result(5) == "own"
+    release.set()
+    assert futures[0].result(5) == "shared"
+    assert flight.stats()["timeouts"] == 1
+
+
+def test_search_herd_runs_one_query(monkeypatch: pytest.MonkeyPatch) -> None:
+    release = threading.Event()
+    queries = []
+    real_search = library_service.search_books
+
+    def slow_search(term, search_type):
+        queries.append(term)
+        release.wait(5)
+        return real_search(term, search_type)
+
+    monkeypatch.setattr(library_service, "search_books", slow_search)
+    database.insert_book("The Great Gatsby", "F. Scott Fitzgerald", "9780743273565", 3, 3)
+    library_service.search_cache.clear()
+    # "Gatsby " and "gatsby" normalize to the same search, so they coalesce too
+    terms = ["gatsby"] + ["Gatsby ", "GATSBY"] * 4
+    with ThreadPoolExecutor(len(terms)) as pool:
+        futures = [pool.submit(library_service.search_books_in_catalog, term, "title") for term in terms]
+        while not queries:
+            time.sleep(0.001)
+        time.sleep(0.05)
+        release.set()
+        results = [future.result(5) for future in futures]
+
+    assert len(queries) == 1
+    assert all(len(rows) == 1 and rows[0]["title"] == "The Great Gatsby" for rows in results)
+    # each caller gets its own rows
+    results[0][0]["title"] = "changed"
+    assert results[-1][0]["title"] == "The Great Gatsby"
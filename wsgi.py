@@ -0,0 +1,26 @@
+"""
+WSGI entry point for production servers.
+
+Each worker process imports this module and builds its own app. Database
+initialization is skipped here because it runs once in the server's master
+process before workers are forked (see gunicorn.conf.py), and production
+catalogs are never seeded with sample data.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import os
+
+from app import create_app
+
+# LOAN_SHARDS is read from the environment by create_app itself
+config = {
+    "INIT_DATABASE": False,
+    "SAMPLE_DATA": False,
+}
+if os.environ.get("READ_REPLICA_PATH"):
+    # Serve catalog/search/report reads from a snapshot refreshed every few seconds
+    config["READ_REPLICA_PATH"] = os.environ["READ_REPLICA_PATH"]
+    config["READ_REPLICA_MAX_STALENESS"] = float(os.environ.get("READ_REPLICA_MAX_STALENESS", "5"))
+
+app = create_app(config)